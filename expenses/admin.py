@@ -1,8 +1,8 @@
 from django.contrib import admin
-from .models import Member
+from .models import ContributionPolicy, ImportBatch, ImportJob, Member, MpesaShortcode, Payment
 
 class MemberAdmin(admin.ModelAdmin):
-    list_display = ('name', 'phone', 'user')  # Show owner of the member
+    list_display = ('name', 'phone', 'user', 'year', 'total_contributed', 'total_deficit')  # Show owner of the member
     list_filter = ('user',)  # Add filter by user
 
     # Superuser sees all members, others see only their own
@@ -12,4 +12,37 @@ class MemberAdmin(admin.ModelAdmin):
             return qs  # All members
         return qs.filter(user=request.user)  # Only owner’s members
 
-admin.site.register(Member, MemberAdmin)
\ No newline at end of file
+admin.site.register(Member, MemberAdmin)
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'user', 'year', 'status', 'rows_done', 'rows_failed', 'created_at')
+    list_filter = ('status', 'user')
+
+admin.site.register(ImportJob, ImportJobAdmin)
+
+class ImportBatchAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'sheet_name', 'user', 'year', 'reusable', 'created_at')
+    list_filter = ('reusable', 'user')
+    search_fields = ('content_hash',)
+
+admin.site.register(ImportBatch, ImportBatchAdmin)
+
+class ContributionPolicyAdmin(admin.ModelAdmin):
+    list_display = ('user', 'year', 'schedule', 'annual_target', 'updated_at')
+    list_filter = ('user',)
+
+admin.site.register(ContributionPolicy, ContributionPolicyAdmin)
+
+class MpesaShortcodeAdmin(admin.ModelAdmin):
+    list_display = ('shortcode', 'user')
+    search_fields = ('shortcode', 'user__username')
+
+admin.site.register(MpesaShortcode, MpesaShortcodeAdmin)
+
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('trans_id', 'user', 'amount', 'paid_at', 'account_reference', 'phone', 'status', 'member')
+    list_filter = ('status', 'source', 'user')
+    search_fields = ('trans_id', 'account_reference', 'phone')
+    raw_id_fields = ('member',)
+
+admin.site.register(Payment, PaymentAdmin)
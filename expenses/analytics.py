@@ -0,0 +1,77 @@
+from django.db.models import Count, Q, Sum
+
+from .cache import analytics_key, get_or_compute, years_key
+from .models import Contribution, ContributionPolicy, Member, MONTHS
+
+
+def _number(value):
+    return float(value or 0)
+
+
+def year_figures(user, year):
+    """Group-level figures for one of the user's years, summed by the database.
+
+    Totals come from the stored member aggregates and per-month amounts from
+    ``Contribution``, so no member row or JSON blob is loaded into Python.
+    The collection rate is the share of the combined annual target that
+    members have met: target minus deficit, over target. Targets are the
+    ones the deficits were computed against, so a policy's annual target
+    replaces the members' own.
+    """
+    policy = ContributionPolicy.for_year(user.id, year)
+    totals = Member.objects.filter(user=user, year=year).aggregate(
+        members=Count('id'),
+        in_deficit=Count('id', filter=Q(total_deficit__gt=0)),
+        contributed=Sum('total_contributed'),
+        target=Sum('annual_target'),
+        deficit=Sum('total_deficit'),
+    )
+    months = [0.0] * len(MONTHS)
+    month_rows = (Contribution.objects.filter(user=user, year=year)
+                  .values_list('month')
+                  .annotate(total=Sum('amount'))
+                  .order_by())
+    for month, total in month_rows:
+        months[month - 1] = _number(total)
+
+    if policy.target is None:
+        target = _number(totals['target'])
+    else:
+        target = policy.target * totals['members']
+    deficit = _number(totals['deficit'])
+    return {
+        'year': year,
+        'members': totals['members'],
+        'in_deficit': totals['in_deficit'],
+        'contributed': _number(totals['contributed']),
+        'target': target,
+        'deficit': deficit,
+        'collection_rate': round((target - deficit) / target, 4) if target else None,
+        'months': dict(zip(MONTHS, months)),
+    }
+
+
+def user_analytics(user):
+    """Figures for every year the user has members in, oldest first.
+
+    Each year is cached on its own, so a write only makes its own year be
+    aggregated again. ``contributed_change`` compares a year's total with the
+    previous year that has data.
+    """
+    years = get_or_compute(years_key(user.id), lambda: list(
+        Member.objects.filter(user=user)
+        .values_list('year', flat=True)
+        .distinct()
+        .order_by('-year')
+    ))
+
+    results = []
+    for year in sorted(years):
+        figures = dict(get_or_compute(
+            analytics_key(user.id, year), lambda year=year: year_figures(user, year)
+        ))
+        figures['contributed_change'] = (
+            round(figures['contributed'] - results[-1]['contributed'], 2) if results else None
+        )
+        results.append(figures)
+    return results
@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .cache import invalidate_member_cache
+from .upserts import bulk_upsert_members
+from .models import Contribution, ImportBatch, Member
+from .serializers import (
+    BulkDeleteSerializer, ContributionSerializer, MemberRowSerializer, MemberSerializer,
+)
+
+
+class IdCursorPagination(CursorPagination):
+    """Stable cursor pages by id, so a sync can resume where it stopped"""
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+def _year_filter(queryset, request):
+    year = request.query_params.get('year')
+    if year:
+        try:
+            queryset = queryset.filter(year=int(year))
+        except ValueError:
+            raise ValidationError({'year': 'Must be a number.'})
+    return queryset
+
+
+class MemberViewSet(viewsets.ModelViewSet):
+    """The user's members; ``?year=`` filters, ``?fields=a,b`` trims the output.
+
+    Single-object writes go through ``Member.save()``/``delete()``. The
+    ``bulk`` action takes up to ``API_BULK_MAX_ROWS`` rows per call and writes
+    them with the same upsert as an Excel import, in one transaction.
+    """
+    serializer_class = MemberSerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = _year_filter(Member.objects.filter(user=self.request.user), self.request)
+        fields = self.request.query_params.get('fields')
+        if fields and 'monthly_contributions' not in fields.split(','):
+            queryset = queryset.defer('monthly_contributions')
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['post', 'delete'])
+    def bulk(self, request):
+        if request.method == 'DELETE':
+            return self._bulk_delete(request)
+        return self._bulk_upsert(request)
+
+    def _bulk_upsert(self, request):
+        rows = request.data.get('members') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'members': 'Expected a non-empty list of members.'})
+        if len(rows) > settings.API_BULK_MAX_ROWS:
+            raise ValidationError({'members': f'At most {settings.API_BULK_MAX_ROWS} rows per call.'})
+
+        serializer = MemberRowSerializer(data=rows, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        by_year = defaultdict(list)
+        for row in serializer.validated_data:
+            year = row.pop('year')
+            by_year[year].append(row)
+
+        result = {'created': 0, 'updated': 0, 'unchanged': 0}
+        try:
+            with transaction.atomic():
+                for year, year_rows in by_year.items():
+                    # API rows have no fingerprint, so every row is written and
+                    # the stored fingerprints are cleared
+                    created, updated, unchanged = bulk_upsert_members(request.user, year, year_rows)
+                    result['created'] += created
+                    result['updated'] += updated
+                    result['unchanged'] += unchanged
+                ImportBatch.forget(request.user.id, by_year)
+        except IntegrityError:
+            # account_number is unique per year across all users
+            raise ValidationError({'members': 'An account number is already used by another user.'})
+        return Response(result, status=status.HTTP_200_OK)
+
+    def _bulk_delete(self, request):
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        members = Member.objects.filter(user=request.user)
+        if data['ids']:
+            members = members.filter(id__in=data['ids'])
+        if data['account_numbers']:
+            members = members.filter(year=data['year'], account_number__in=data['account_numbers'])
+
+        with transaction.atomic():
+            years = list(members.values_list('year', flat=True).distinct())
+            _, deleted = members.delete()
+            invalidate_member_cache(request.user.id, years)
+            ImportBatch.forget(request.user.id, years)
+        return Response({'deleted': deleted.get(Member._meta.label, 0)}, status=status.HTTP_200_OK)
+
+
+class ContributionViewSet(viewsets.ReadOnlyModelViewSet):
+    """The user's monthly contribution rows; ``?year=`` and ``?month=`` filter"""
+    serializer_class = ContributionSerializer
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = _year_filter(
+            Contribution.objects.filter(user=self.request.user), self.request
+        )
+        month = self.request.query_params.get('month')
+        if month:
+            try:
+                queryset = queryset.filter(month=int(month))
+            except ValueError:
+                raise ValidationError({'month': 'Must be a number.'})
+        return queryset
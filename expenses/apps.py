@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ExpensesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expenses'
+
+    def ready(self):
+        from . import checks  # noqa: F401 (registers the system checks)
+        from .db import configure_sqlite
+
+        connection_created.connect(configure_sqlite, dispatch_uid='expenses.configure_sqlite')
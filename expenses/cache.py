@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import MEMBER_CACHE_LOOKUPS
+
+
+def years_key(user_id):
+    return f'member-cache:{user_id}:years'
+
+
+def summary_key(user_id, year):
+    return f'member-cache:{user_id}:summary:{year}'
+
+
+def analytics_key(user_id, year):
+    return f'member-cache:{user_id}:analytics:{year}'
+
+
+def get_or_compute(key, compute):
+    """Return the cached value for ``key``, computing and storing it on a miss.
+
+    Hits and misses are counted in the metrics store, which every process
+    adds to atomically; counting in the cache itself would rewrite a file per
+    lookup on the file-based backend and lose counts between workers.
+    """
+    value = cache.get(key)
+    if value is not None:
+        MEMBER_CACHE_LOOKUPS.inc(result='hit')
+        return value
+
+    MEMBER_CACHE_LOOKUPS.inc(result='miss')
+    value = compute()
+    cache.set(key, value, timeout=settings.MEMBER_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate_member_cache(user_id, years):
+    """Drop a user's years list and the summaries and analytics of ``years``.
+
+    Runs after the current transaction commits, so a concurrent request can't
+    re-cache the old rows in between.
+    """
+    keys = [years_key(user_id)]
+    for year in set(years):
+        keys += [summary_key(user_id, year), analytics_key(user_id, year)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def cache_stats():
+    hits = int(MEMBER_CACHE_LOOKUPS.value(result='hit'))
+    misses = int(MEMBER_CACHE_LOOKUPS.value(result='miss'))
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 4) if lookups else None,
+    }
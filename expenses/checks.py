@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.security)
+def check_mpesa_callback_token(app_configs, **kwargs):
+    if settings.MPESA_CALLBACK_TOKEN:
+        return []
+    return [Warning(
+        'MPESA_CALLBACK_TOKEN is not set, so every M-Pesa callback is refused.',
+        hint='Set it to a long random string and add ?token=<value> to the callback URLs.',
+        id='expenses.W001',
+    )]
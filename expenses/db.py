@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """``connection_created`` receiver applying ``SQLITE_PRAGMAS`` to SQLite connections.
+
+    ``journal_mode`` is stored in the database file, the others last for the
+    connection, which with ``CONN_MAX_AGE`` serves many requests.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def take_write_lock(model):
+    """Make the current transaction take SQLite's write lock now.
+
+    A SQLite transaction starts out reading; if another connection commits
+    before its first write, that write fails at once with "database is
+    locked". Taking the lock first (as ``BEGIN IMMEDIATE`` would) makes it
+    wait its turn instead, up to the connection's timeout. Other databases
+    lock the rows they need with ``select_for_update``.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET id = id WHERE 0')
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Run the block in a transaction that is always rolled back.
+
+    The benchmark commands write real rows to time real queries, and leave
+    nothing behind when they finish or fail.
+    """
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
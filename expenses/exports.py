@@ -0,0 +1,51 @@
+import csv
+
+from .models import MONTHS
+
+# Same headers the Excel upload reads, so an export can be re-imported as is
+LEDGER_HEADERS = ['Name', 'Account Number', 'Phone'] + MONTHS + ['Total Contributed', 'Deficit']
+
+
+def ledger_rows(members):
+    """Yield one list per member in ``LEDGER_HEADERS`` order.
+
+    ``members`` is a queryset; it is read with ``.iterator()`` so only one
+    chunk of rows is held in memory at a time.
+    """
+    rows = members.values_list(
+        'name', 'account_number', 'phone', 'monthly_contributions',
+        'total_contributed', 'total_deficit',
+    ).iterator(chunk_size=2000)
+    for name, account_number, phone, contributions, contributed, deficit in rows:
+        yield (
+            [name, account_number, phone]
+            + [float(contributions.get(month, 0)) for month in MONTHS]
+            + [float(contributed), float(deficit)]
+        )
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Yield CSV lines for the header and ``rows``"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(LEDGER_HEADERS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, output, title):
+    """Write the header and ``rows`` to ``output`` with openpyxl's write-only mode"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=title)
+    worksheet.append(LEDGER_HEADERS)
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(output)
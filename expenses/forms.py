@@ -1,6 +1,11 @@
 from django.contrib.auth.forms import UserCreationForm
 from django import forms
 
+from .policies import MONTHS
+
+# Shares are relative, so only absurd sizes are refused
+MAX_SHARE = 1_000_000
+
 class CustomUserCreationForm(UserCreationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -14,4 +19,28 @@ class CustomUserCreationForm(UserCreationForm):
         self.fields['password2'].widget.attrs.update({'class': 'form-input'})
 
     class Meta(UserCreationForm.Meta):
-        fields = ('username', 'password1', 'password2')
\ No newline at end of file
+        fields = ('username', 'password1', 'password2')
+
+
+class ContributionPolicyForm(forms.Form):
+    """A year's schedule: each month's share of the annual target, and the target.
+
+    FloatField and DecimalField refuse NaN and infinities, and the target
+    has the model field's digits.
+    """
+    annual_target = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for month in MONTHS:
+            self.fields[month] = forms.FloatField(required=False, min_value=0, max_value=MAX_SHARE)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors and not self.schedule():
+            raise forms.ValidationError('A contribution policy needs at least one due month')
+        return cleaned_data
+
+    def schedule(self):
+        """``{month: share}`` for the months with something due"""
+        return {month: self.cleaned_data[month] for month in MONTHS if self.cleaned_data.get(month)}
@@ -0,0 +1,213 @@
+import time
+from contextlib import nullcontext
+
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .db import take_write_lock
+from .metrics import record_import
+from .models import MONTHS, Member
+from .upserts import bulk_upsert_members, existing_members
+
+# Sheet columns read by the import, anything else is ignored
+IMPORT_COLUMNS = ['Name', 'Account Number', 'Phone'] + MONTHS
+
+# Normalized columns whose content decides whether a row changed
+FINGERPRINT_COLUMNS = ['name', 'phone'] + MONTHS
+
+# Columns of the frame returned by normalize_dataframe
+NORMALIZED_COLUMNS = ['account_number', 'name', 'phone'] + MONTHS
+
+
+def _text_column(df, column):
+    """Return a column as stripped strings, with blanks/NaN as ''"""
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype='string')
+
+    series = df[column]
+    # Numeric ids read as floats (because of blank cells) lose the trailing '.0'
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64')
+    return series.astype('string').str.strip().fillna('')
+
+
+def _amount_column(df, column):
+    """Return ``(amounts, invalid_mask)`` for a month column"""
+    if column not in df.columns:
+        return pd.Series(0.0, index=df.index), pd.Series(False, index=df.index)
+
+    series = df[column]
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float).fillna(0.0), pd.Series(False, index=df.index)
+
+    amounts = pd.to_numeric(series, errors='coerce')
+    blank = series.isna() | series.astype('string').str.strip().eq('')
+    return amounts.fillna(0.0), amounts.isna() & ~blank
+
+
+def normalize_dataframe(df):
+    """Clean an uploaded sheet column-wise before it reaches the database.
+
+    Names, phones and account numbers are stripped (spaces are removed from
+    phones), and blank month cells become 0. Rows without a name or account
+    number, or with a non-numeric amount, are dropped and reported.
+
+    Returns ``(frame, errors)`` where ``frame`` has ``NORMALIZED_COLUMNS`` and
+    keeps the original index, and ``errors`` is a list of
+    ``{'row': <sheet row number>, 'errors': [...]}`` dicts.
+    """
+    df = df.rename(columns=lambda column: str(column).strip())
+    if 'Name' not in df.columns or 'Account Number' not in df.columns:
+        raise ValueError("Excel file must contain 'Name' and 'Account Number' columns")
+
+    frame = pd.DataFrame({
+        'account_number': _text_column(df, 'Account Number'),
+        'name': _text_column(df, 'Name'),
+        'phone': _text_column(df, 'Phone').str.replace(' ', '', regex=False),
+    }, index=df.index)
+
+    problems = {
+        'Missing name': frame['name'].eq(''),
+        'Missing account number': frame['account_number'].eq(''),
+    }
+    for month in MONTHS:
+        frame[month], invalid = _amount_column(df, month)
+        problems[f'Invalid amount for {month}'] = invalid
+
+    problem_mask = pd.DataFrame(problems)
+    bad_rows = problem_mask.any(axis=1)
+
+    errors = []
+    for index, flags in problem_mask[bad_rows].iterrows():
+        errors.append({
+            # Sheet rows are 1-based and the header takes the first row
+            'row': int(index) + 2,
+            'errors': [message for message, flagged in flags.items() if flagged],
+        })
+
+    return frame[~bad_rows], errors
+
+
+def row_fingerprints(frame):
+    """Hash each normalized row's content into a 16-character hex string.
+
+    ``hash_pandas_object`` hashes whole columns at once with a fixed key, so
+    the same row always gets the same fingerprint across uploads.
+    """
+    hashes = pd.util.hash_pandas_object(frame[FINGERPRINT_COLUMNS], index=False)
+    return [f'{value:016x}' for value in hashes.tolist()]
+
+
+def member_rows(frame):
+    """Turn a normalized frame into rows for ``bulk_upsert_members``"""
+    amounts = frame[MONTHS].to_numpy(dtype=float).tolist()
+    return [
+        {
+            'account_number': account_number,
+            'name': name,
+            'phone': phone,
+            'monthly_contributions': dict(zip(MONTHS, month_amounts)),
+            'fingerprint': fingerprint,
+        }
+        for account_number, name, phone, month_amounts, fingerprint in zip(
+            frame['account_number'].tolist(),
+            frame['name'].tolist(),
+            frame['phone'].tolist(),
+            amounts,
+            row_fingerprints(frame),
+        )
+    ]
+
+
+def import_frames(frames, user, year, batch_size=None, atomic=True, progress=None):
+    """Normalize and write an iterable of sheet chunks.
+
+    The whole import runs in one transaction unless ``atomic`` is False, in
+    which case every chunk commits on its own so other connections can see
+    progress. ``progress`` is called with the running result after each chunk.
+    Returns a dict with ``created``/``updated``/``unchanged`` counts and the
+    row ``errors`` from ``normalize_dataframe``.
+    """
+    result = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    start = time.perf_counter()
+
+    with transaction.atomic() if atomic else nullcontext():
+        if atomic:
+            take_write_lock(Member)
+        existing = existing_members(user, year)
+        for frame in frames:
+            clean, errors = normalize_dataframe(frame)
+            created, updated, unchanged = bulk_upsert_members(
+                user, year, member_rows(clean), batch_size, existing
+            )
+            result['created'] += created
+            result['updated'] += updated
+            result['unchanged'] += unchanged
+            result['errors'].extend(errors)
+            if progress is not None:
+                progress(result)
+
+    record_import(result['created'], result['updated'], result['unchanged'],
+                  len(result['errors']), time.perf_counter() - start)
+    return result
+
+
+def open_workbook(source):
+    """Open an .xlsx path or file object in openpyxl's streaming mode"""
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+def iter_sheet_chunks(worksheet, chunk_size=None):
+    """Yield a worksheet as DataFrames of at most ``chunk_size`` rows.
+
+    Only the columns the import uses are kept and fully blank rows are
+    skipped. Each frame's index is the sheet row number minus two, matching
+    what ``pd.read_excel`` would give, so error reports point at real rows.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    rows = worksheet.iter_rows(values_only=True)
+
+    header = next(rows, ())
+    header = ['' if cell is None else str(cell).strip() for cell in header]
+    positions = [i for i, name in enumerate(header) if name in IMPORT_COLUMNS]
+    columns = [header[i] for i in positions]
+
+    values, index = [], []
+    yielded = False
+    for row_number, row in enumerate(rows, start=2):
+        cells = [row[i] if i < len(row) else None for i in positions]
+        if all(cell is None for cell in cells):
+            continue
+
+        values.append(cells)
+        index.append(row_number - 2)
+        if len(values) >= chunk_size:
+            yield pd.DataFrame(values, columns=columns, index=index)
+            values, index = [], []
+            yielded = True
+
+    # An empty sheet still yields one frame so its headers get validated
+    if values or not yielded:
+        yield pd.DataFrame(values, columns=columns, index=index)
+
+
+def parse_sheet(path, sheet_name):
+    """Read and normalize one sheet of a saved workbook.
+
+    Used as a process-pool task, so it only touches the file and returns
+    plain data: ``(frame, errors, seconds)``.
+    """
+    start = time.perf_counter()
+    workbook = open_workbook(path)
+    try:
+        frames, errors = [], []
+        for chunk in iter_sheet_chunks(workbook[sheet_name]):
+            clean, chunk_errors = normalize_dataframe(chunk)
+            frames.append(clean)
+            errors.extend(chunk_errors)
+    finally:
+        workbook.close()
+
+    return pd.concat(frames), errors, time.perf_counter() - start
@@ -0,0 +1,303 @@
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import record_import
+from .models import ImportBatch, ImportJob
+from .pools import process_pool
+from .upserts import bulk_upsert_members
+
+
+def save_upload(uploaded_file):
+    """Copy an uploaded workbook into IMPORT_JOB_DIR.
+
+    The file is hashed chunk by chunk while it is written, so spotting a
+    repeated upload costs no extra pass. Returns ``(path, sha256 hex digest)``.
+    """
+    os.makedirs(settings.IMPORT_JOB_DIR, exist_ok=True)
+    # openpyxl picks the reader from the extension, so keep an .xlsx suffix
+    path = os.path.join(settings.IMPORT_JOB_DIR, f'{uuid.uuid4().hex}.xlsx')
+    digest = hashlib.sha256()
+    with open(path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            destination.write(chunk)
+    return path, digest.hexdigest()
+
+
+def remove_upload(path):
+    """Delete a saved workbook, ignoring files that are already gone"""
+    if path and os.path.exists(path):
+        try:
+            os.unlink(path)
+        except PermissionError:
+            pass
+
+
+def enqueue_import(user, path, file_name, year, sheet_name='', sheet_years=None):
+    """Queue a saved workbook for the import worker.
+
+    ``sheet_years`` maps several sheets to the year each one holds; without
+    it only ``sheet_name`` (or the first sheet) is imported into ``year``.
+    """
+    return ImportJob.objects.create(
+        user=user,
+        file_path=path,
+        file_name=file_name,
+        year=year,
+        sheet_name=sheet_name,
+        sheet_years=sheet_years or {},
+    )
+
+
+def find_imported_batch(user, content_hash, year, sheet_name):
+    """Return the latest reusable batch of the same file, year and sheet, or None.
+
+    Batches whose job, or whose sheet of a multi-sheet job, failed are never
+    reused, so a retry after an error imports again.
+    """
+    batches = (ImportBatch.objects
+               .filter(user=user, content_hash=content_hash, year=year, sheet_name=sheet_name,
+                       reusable=True, duplicate_of__isnull=True)
+               .exclude(job__status=ImportJob.FAILED)
+               .select_related('job'))
+    for batch in batches[:5]:
+        if not batch.result().get('error'):
+            return batch
+    return None
+
+
+def record_batches(job, content_hash, sheet_years):
+    """Record the sheets ``job`` imports, as ``{sheet: year}``, for later uploads.
+
+    The job will rewrite those years, so their earlier batches stop being
+    reusable: uploading an older file again must import it again.
+    """
+    ImportBatch.forget(job.user_id, sheet_years.values())
+    ImportBatch.objects.bulk_create(
+        ImportBatch(user=job.user, job=job, file_name=job.file_name, year=year,
+                    sheet_name=sheet, content_hash=content_hash)
+        for sheet, year in sheet_years.items()
+    )
+
+
+def record_duplicate(batch, file_name):
+    """Log an upload that was skipped because it matched ``batch``"""
+    return ImportBatch.objects.create(
+        user=batch.user, job=batch.job, duplicate_of=batch, file_name=file_name,
+        year=batch.year, sheet_name=batch.sheet_name, content_hash=batch.content_hash,
+        reusable=False,
+    )
+
+
+def claim_next_job():
+    """Move the oldest queued job to running and return it, or None.
+
+    The claim is a conditional UPDATE, so several workers can poll the same
+    table without picking up the same job twice.
+    """
+    queued = (ImportJob.objects.filter(status=ImportJob.QUEUED)
+              .order_by('created_at')
+              .values_list('id', flat=True)[:10])
+    for job_id in queued:
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(id=job_id, status=ImportJob.QUEUED).update(
+            status=ImportJob.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return ImportJob.objects.select_related('user').get(id=job_id)
+    return None
+
+
+def fail_stale_jobs():
+    """Fail running jobs whose worker stopped saving progress.
+
+    A worker killed mid-import leaves its job running, and the job's page
+    polling, forever. Jobs without a heartbeat for IMPORT_JOB_STALE_SECONDS
+    are marked failed so the file can be uploaded again (the rows already
+    committed stay; importing again rewrites them). Returns how many failed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    stale = ImportJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=ImportJob.RUNNING,
+    )
+    failed = 0
+    for job in stale:
+        # Conditional, in case the job finished or beat since it was read
+        updated = ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING,
+                                           heartbeat_at=job.heartbeat_at).update(
+            status=ImportJob.FAILED,
+            message='The import stopped unexpectedly; please upload the file again.',
+            finished_at=timezone.now(),
+        )
+        if updated:
+            remove_upload(job.file_path)
+        failed += updated
+    return failed
+
+
+def _save_progress(job, fields):
+    """Save ``fields`` of a running job along with a fresh heartbeat"""
+    job.heartbeat_at = timezone.now()
+    job.save(update_fields=[*fields, 'heartbeat_at'])
+
+
+def run_import_job(job):
+    """Run a claimed job and record its outcome.
+
+    Single-sheet jobs stream their sheet chunk by chunk; jobs with a
+    ``sheet_years`` map parse all their sheets in a process pool. The saved
+    workbook is removed once the job finishes either way. A job that
+    ``fail_stale_jobs`` failed meanwhile stays failed.
+    """
+    try:
+        if job.sheet_years:
+            _import_sheet_map(job)
+        else:
+            _import_single_sheet(job)
+        job.status = ImportJob.DONE
+    except Exception as e:
+        job.status = ImportJob.FAILED
+        job.message = f'Error: {str(e)}'
+    finally:
+        job.finished_at = timezone.now()
+        finished = ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING).update(
+            status=job.status, message=job.message, finished_at=job.finished_at,
+        )
+        if not finished:
+            job.refresh_from_db(fields=['status', 'message', 'finished_at'])
+        remove_upload(job.file_path)
+
+    return job
+
+
+def _import_single_sheet(job):
+    """Stream one sheet, committing every chunk so progress is visible"""
+    # pandas and openpyxl load with the first job, not with every web worker
+    from .importers import import_frames, iter_sheet_chunks, open_workbook
+
+    def record_progress(result):
+        job.created = result['created']
+        job.updated = result['updated']
+        job.unchanged = result['unchanged']
+        job.rows_done = result['created'] + result['updated'] + result['unchanged']
+        job.rows_failed = len(result['errors'])
+        job.errors = result['errors'][:settings.IMPORT_JOB_MAX_ERRORS]
+        _save_progress(job, [
+            'created', 'updated', 'unchanged', 'rows_done', 'rows_failed', 'errors'
+        ])
+
+    workbook = open_workbook(job.file_path)
+    try:
+        if job.sheet_name:
+            if job.sheet_name not in workbook.sheetnames:
+                raise ValueError(f"Sheet '{job.sheet_name}' not found")
+            worksheet = workbook[job.sheet_name]
+        else:
+            worksheet = workbook.worksheets[0]
+
+        if worksheet.max_row:
+            job.rows_total = max(worksheet.max_row - 1, 0)
+            _save_progress(job, ['rows_total'])
+
+        import_frames(
+            iter_sheet_chunks(worksheet), job.user, job.year,
+            atomic=False, progress=record_progress,
+        )
+    finally:
+        workbook.close()
+
+
+def _as_completed_beating(futures, job):
+    """Yield ``futures`` as they finish, saving the job's heartbeat while waiting.
+
+    Parsing a large sheet can outlast IMPORT_JOB_STALE_SECONDS, and a job
+    that doesn't beat meanwhile would be failed under its worker.
+    """
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=settings.IMPORT_JOB_STALE_SECONDS / 4,
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            _save_progress(job, [])
+        yield from done
+
+
+def _import_sheet_map(job):
+    """Parse several sheets concurrently and write each in its own transaction.
+
+    A sheet that fails is recorded in ``sheet_results`` and the rest carry on.
+    """
+    from .importers import member_rows, open_workbook, parse_sheet
+
+    workbook = open_workbook(job.file_path)
+    try:
+        missing = [sheet for sheet in job.sheet_years if sheet not in workbook.sheetnames]
+        if missing:
+            raise ValueError(f"Sheet '{missing[0]}' not found")
+        job.rows_total = sum(
+            max((workbook[sheet].max_row or 1) - 1, 0) for sheet in job.sheet_years
+        )
+        _save_progress(job, ['rows_total'])
+    finally:
+        workbook.close()
+
+    workers = min(len(job.sheet_years), settings.IMPORT_PARSE_WORKERS or os.cpu_count() or 1)
+    with process_pool(workers) as pool:
+        futures = {
+            pool.submit(parse_sheet, job.file_path, sheet): (sheet, year)
+            for sheet, year in job.sheet_years.items()
+        }
+        for future in _as_completed_beating(futures, job):
+            sheet, year = futures[future]
+            sheet_result = {'sheet': sheet, 'year': year}
+            try:
+                frame, errors, parse_seconds = future.result()
+                start = time.perf_counter()
+                created, updated, unchanged = bulk_upsert_members(
+                    job.user, year, member_rows(frame)
+                )
+                sheet_result.update({
+                    'rows': created + updated + unchanged,
+                    'created': created,
+                    'updated': updated,
+                    'unchanged': unchanged,
+                    'failed': len(errors),
+                    'parse_seconds': round(parse_seconds, 3),
+                    'write_seconds': round(time.perf_counter() - start, 3),
+                })
+            except Exception as e:
+                sheet_result['error'] = f'Error: {str(e)}'
+                job.sheet_results.append(sheet_result)
+                _save_progress(job, ['sheet_results'])
+                continue
+
+            record_import(created, updated, unchanged, len(errors),
+                          parse_seconds + sheet_result['write_seconds'])
+
+            job.created += created
+            job.updated += updated
+            job.unchanged += unchanged
+            job.rows_done += created + updated + unchanged
+            job.rows_failed += len(errors)
+            room = settings.IMPORT_JOB_MAX_ERRORS - len(job.errors)
+            job.errors.extend({'sheet': sheet, **error} for error in errors[:max(room, 0)])
+            job.sheet_results.append(sheet_result)
+            _save_progress(job, [
+                'created', 'updated', 'unchanged', 'rows_done', 'rows_failed', 'errors',
+                'sheet_results',
+            ])
+
+    failed = [result['sheet'] for result in job.sheet_results if 'error' in result]
+    if failed:
+        job.message = f"Could not import sheets: {', '.join(failed)}"
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from expenses.models import Payment
+from expenses.payments import apply_pending, assign_owners
+
+
+class Command(BaseCommand):
+    help = 'Apply pending M-Pesa payments to member contributions in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once nothing is pending instead of polling')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Seconds to wait between polls when nothing is pending')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Payments per transaction (default PAYMENT_APPLY_BATCH_SIZE)')
+        parser.add_argument('--retry-unmatched', action='store_true',
+                            help='Queue unmatched payments again first, e.g. after adding members '
+                                 'or registering a shortcode')
+
+    def handle(self, *args, **options):
+        if options['retry_unmatched']:
+            assigned = assign_owners()
+            if assigned:
+                self.stdout.write(f'{assigned} payments assigned to the owners of their shortcodes')
+            retried = Payment.objects.filter(status=Payment.UNMATCHED).update(status=Payment.PENDING)
+            self.stdout.write(f'{retried} unmatched payments queued again')
+
+        while True:
+            # Drop connections past CONN_MAX_AGE or broken, as a request would
+            close_old_connections()
+            start = time.perf_counter()
+            try:
+                result = apply_pending(options['batch_size'])
+            except OperationalError as e:
+                # e.g. the database stayed locked past its timeout; the batch
+                # was rolled back and is still pending
+                self.stderr.write(f'Could not apply payments, retrying: {e}')
+                time.sleep(options['sleep'])
+                continue
+            if not result['applied'] and not result['unmatched']:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write(
+                f"Applied {result['applied']} payments, {result['unmatched']} unmatched "
+                f'in {time.perf_counter() - start:.2f}s'
+            )
@@ -0,0 +1,117 @@
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from expenses.db import rolled_back
+from expenses.importers import import_frames, iter_sheet_chunks, open_workbook
+from expenses.models import Member, MONTHS
+from expenses.views import process_dataframe
+
+
+def synthetic_sheet(rows, seed=0):
+    """Build a DataFrame shaped like an uploaded contributions sheet"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Name': [f' Member {i} ' for i in range(rows)],
+        'Account Number': [f'ACC{i:07d}' for i in range(rows)],
+        'Phone': [f'07{i:08d}' for i in range(rows)],
+    })
+    for month in MONTHS:
+        df[month] = rng.choice([0, 500, 1000, 2000], size=rows).astype(float)
+    return df
+
+
+def legacy_import(df, user, year):
+    """The original per-row update_or_create loop, kept for comparison"""
+    for _, row in df.iterrows():
+        Member.objects.update_or_create(
+            user=user,
+            account_number=str(row['Account Number']).strip(),
+            year=year,
+            defaults={
+                'name': row['Name'].strip(),
+                'phone': str(row.get('Phone', '')).strip().replace(' ', ''),
+                'monthly_contributions': {
+                    month: float(row.get(month, 0)) for month in MONTHS
+                },
+            }
+        )
+
+
+def streaming_import(workbooks):
+    """Import saved workbooks the way the upload views do.
+
+    ``workbooks`` pairs each benchmark frame with the .xlsx it was saved to.
+    """
+    def importer(df, user, year):
+        path = next(path for frame, path in workbooks if frame is df)
+        workbook = open_workbook(path)
+        try:
+            return import_frames(iter_sheet_chunks(workbook.worksheets[0]), user, year)
+        finally:
+            workbook.close()
+    return importer
+
+
+class Command(BaseCommand):
+    help = 'Time the Excel member import on synthetic sheets (all writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000])
+        parser.add_argument('--year', type=int, default=2024)
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also time the per-row update_or_create loop')
+        parser.add_argument('--workbook', action='store_true',
+                            help='Also time streaming the sheet from a saved .xlsx file')
+
+    def handle(self, *args, **options):
+        paths = [('bulk', process_dataframe)]
+        if options['legacy']:
+            paths.insert(0, ('legacy', legacy_import))
+
+        for rows in options['rows']:
+            df = synthetic_sheet(rows)
+            # Every amount changes, so the last pass has to rewrite all rows
+            changed = df.copy()
+            changed['January'] += 1
+
+            workbooks = []
+            if options['workbook']:
+                for frame in (df, changed):
+                    workbook = tempfile.NamedTemporaryFile(suffix='.xlsx')
+                    frame.to_excel(workbook.name, index=False)
+                    workbooks.append((frame, workbook))
+                paths.append(('stream', streaming_import(
+                    [(frame, workbook.name) for frame, workbook in workbooks]
+                )))
+
+            for label, importer in paths:
+                # Insert every row, re-import the same sheet, then a changed one
+                insert_time, same_time, update_time = self._time_import(
+                    importer, [df, df, changed], options['year']
+                )
+                self.stdout.write(
+                    f'{label:>6} {rows:>7} rows  '
+                    f'insert {insert_time:7.2f}s ({rows / insert_time:9.0f} rows/s)  '
+                    f'unchanged {same_time:7.2f}s ({rows / same_time:9.0f} rows/s)  '
+                    f'update {update_time:7.2f}s ({rows / update_time:9.0f} rows/s)'
+                )
+
+            if workbooks:
+                paths.pop()
+                for _, workbook in workbooks:
+                    workbook.close()
+
+    def _time_import(self, importer, frames, year):
+        timings = []
+        with rolled_back():
+            user = User.objects.create(username='__benchmark_import__')
+            for df in frames:
+                start = time.perf_counter()
+                importer(df, user, year)
+                timings.append(time.perf_counter() - start)
+        return timings
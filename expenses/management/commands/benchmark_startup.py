@@ -0,0 +1,192 @@
+import http.client
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Boots the WSGI app in a fresh interpreter and serves one request, the way a
+# new worker or a serverless cold start does. argv: path, "eager" or "lazy".
+FIRST_RESPONSE_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from expenditure_tracker.wsgi import application
+if sys.argv[2] == 'eager':
+    from expenses.warmup import warm_up
+    warm_up()
+booted = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+environ = {'PATH_INFO': sys.argv[1]}
+setup_testing_defaults(environ)
+status = []
+response = application(environ, lambda line, headers, exc_info=None: status.append(line))
+b''.join(response)
+done = time.perf_counter()
+print(json.dumps({
+    'boot': booted - start,
+    'first_response': done - start,
+    'status': status[0],
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'pandas': 'pandas' in sys.modules,
+    'reportlab': 'reportlab' in sys.modules,
+}))
+'''
+
+# (label, GUNICORN_PRELOAD, GUNICORN_WARM_UP)
+GUNICORN_PROFILES = [
+    ('no preload', 'false', 'false'),
+    ('preload', 'true', 'false'),
+    ('preload + warm-up', 'true', 'true'),
+]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    """Ids of the processes whose parent is ``pid`` (Linux /proc)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # The command name is in parentheses and may contain spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _memory(pid):
+    """``Rss``, ``Pss`` and private memory of a process in MB, from smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'private': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure cold start: time to first response and memory of a fresh worker, '
+        'with the heavy modules loaded lazily (as shipped) or eagerly (as before), '
+        'and optionally per-worker memory under gunicorn.conf.py (Linux only)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts per mode; medians are shown')
+        parser.add_argument('--path', default='/login/', help='Page served as the first request')
+        parser.add_argument('--gunicorn', action='store_true',
+                            help='Also boot gunicorn in each preload/warm-up profile')
+        parser.add_argument('--workers', type=int, default=3)
+        parser.add_argument('--json', action='store_true', help='Print the raw results as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)  # Includes the settings module manage.py picked
+        results = {'cold_start': {}}
+        for mode in ('eager', 'lazy'):
+            runs = [self.cold_start(options['path'], mode, env) for _ in range(options['runs'])]
+            results['cold_start'][mode] = {
+                key: statistics.median(run[key] for run in runs)
+                for key in ('boot', 'first_response', 'max_rss_mb')
+            }
+            results['cold_start'][mode].update(status=runs[0]['status'],
+                                               pandas=runs[0]['pandas'],
+                                               reportlab=runs[0]['reportlab'])
+
+        if options['gunicorn']:
+            if not os.path.exists('/proc/self/smaps_rollup'):
+                raise CommandError('--gunicorn reads worker memory from /proc and needs Linux')
+            results['gunicorn'] = {
+                label: self.gunicorn(options['path'], options['workers'], preload, warm_up, env)
+                for label, preload, warm_up in GUNICORN_PROFILES
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for mode, row in results['cold_start'].items():
+            self.stdout.write(
+                f'{mode:>5}  boot {row["boot"]:6.3f}s  first response {row["first_response"]:6.3f}s  '
+                f'max RSS {row["max_rss_mb"]:6.1f} MB  '
+                f'pandas {"yes" if row["pandas"] else "no"}  reportlab {"yes" if row["reportlab"] else "no"}'
+            )
+        for label, row in results.get('gunicorn', {}).items():
+            workers = row['workers']
+            self.stdout.write(
+                f'{label:>18}  first response {row["first_response"]:6.3f}s  '
+                f'master RSS {row["master"]["rss"]:6.1f} MB  '
+                f'worker RSS {statistics.mean(w["rss"] for w in workers):6.1f} MB  '
+                f'worker private {statistics.mean(w["private"] for w in workers):6.1f} MB  '
+                f'total PSS {row["total_pss"]:6.1f} MB'
+            )
+
+    def cold_start(self, path, mode, env):
+        completed = subprocess.run(
+            [sys.executable, '-c', FIRST_RESPONSE_SCRIPT, path, mode],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise CommandError(completed.stderr.strip().splitlines()[-1])
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def gunicorn(self, path, workers, preload, warm_up, env, timeout=60):
+        """Boot gunicorn, time its first response and read every process's memory"""
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+             'expenditure_tracker.wsgi'],
+            cwd=settings.BASE_DIR,
+            env={**env, 'GUNICORN_PRELOAD': preload, 'GUNICORN_WARM_UP': warm_up},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        start = time.perf_counter()
+        try:
+            first_response = None
+            while first_response is None:
+                if time.perf_counter() - start > timeout or server.poll() is not None:
+                    raise CommandError(f'gunicorn did not answer within {timeout}s')
+                try:
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                    connection.request('GET', path)
+                    connection.getresponse().read()
+                    first_response = time.perf_counter() - start
+                except OSError:
+                    time.sleep(0.02)
+
+            while len(_children(server.pid)) < workers:
+                if time.perf_counter() - start > timeout:
+                    raise CommandError('gunicorn workers did not all start')
+                time.sleep(0.05)
+            worker_memory = [_memory(pid) for pid in _children(server.pid)]
+            master_memory = _memory(server.pid)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+        return {
+            'first_response': first_response,
+            'master': master_memory,
+            'workers': worker_memory,
+            'total_pss': master_memory['pss'] + sum(worker['pss'] for worker in worker_memory),
+        }
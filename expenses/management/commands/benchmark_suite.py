@@ -0,0 +1,309 @@
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import resolve
+
+from expenses.cache import summary_key, years_key
+from expenses.db import rolled_back
+from expenses.jobs import run_import_job
+from expenses.management.commands.generate_synthetic_data import synthetic_members, write_workbook
+from expenses.middleware import QueryTimer
+from expenses.models import ImportJob, Member, MONTHS
+from expenses.upserts import bulk_upsert_members
+from expenses.warmup import warm_up
+
+STEPS = [
+    'dashboard', 'dashboard_cached', 'edit_contributions', 'generate_pdf',
+    'generate_pdf_cached', 'upload_single', 'upload_multi', 'delete_all',
+]
+
+# Years the suite writes to: members are seeded into the first, the
+# single-sheet upload goes to the second and the multi-sheet one to the rest
+SEED_YEAR, SINGLE_YEAR, *MULTI_YEARS = [2019, 2020, 2021, 2022, 2023]
+
+# Changes smaller than this many milliseconds are never called regressions
+NOISE_FLOOR_MS = 5
+
+
+def measure(action):
+    """Run ``action`` and return its wall time and SQL, counted on every connection"""
+    timer = QueryTimer(keep=0)
+    with ExitStack() as stack:
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(timer))
+        start = time.perf_counter()
+        result = action()
+        elapsed = time.perf_counter() - start
+    return result, {
+        'ms': round(elapsed * 1000, 2),
+        'queries': timer.count,
+        'db_ms': round(timer.seconds * 1000, 2),
+    }
+
+
+def best_of(repeat, action, before=None):
+    """Fastest of ``repeat`` runs; ``before`` resets state ahead of each one"""
+    best = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        _, timing = measure(action)
+        if best is None or timing['ms'] < best['ms']:
+            best = timing
+    return best
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """Rows of ``(size, step, old, new, change, regressed)`` for steps in both runs"""
+    rows = []
+    for size, steps in new['results'].items():
+        for step, timing in steps.items():
+            before = old['results'].get(size, {}).get(step)
+            if before is None:
+                continue
+            change = (timing['ms'] - before['ms']) / before['ms'] if before['ms'] else 0.0
+            regressed = (
+                (change > threshold and timing['ms'] - before['ms'] > NOISE_FLOOR_MS)
+                or timing['queries'] > before['queries']
+            )
+            rows.append((size, step, before, timing, change, regressed))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the main pages end to end (dashboard, uploads, edit, PDF, delete) '
+        'through the test client at several member counts; every write is rolled back. '
+        'Results can be saved as JSON and compared with an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Members in the benchmarked year')
+        parser.add_argument('--steps', nargs='+', choices=STEPS, default=STEPS)
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Read-only steps report the best of this many runs')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', nargs='+', metavar='JSON',
+                            help='Compare this run with an earlier result file, or compare two files')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Slowdown (0.2 = 20%%) reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        compare_files = options['compare'] or []
+        if len(compare_files) > 2:
+            raise CommandError('--compare takes one or two files')
+        if len(compare_files) == 2:
+            old, new = (self.load(path) for path in compare_files)
+            return self.report_comparison(old, new, options)
+
+        # The pages import these on first use; load them before anything is timed
+        warm_up()
+        results = {}
+        for size in options['sizes']:
+            results[str(size)] = self.run_size(size, options['steps'], options['repeat'])
+            for step, timing in results[str(size)].items():
+                extra = f"  {timing['rows_per_second']:>9.0f} rows/s" if 'rows_per_second' in timing else ''
+                self.stdout.write(
+                    f"{size:>7} {step:<20} {timing['ms']:>10.1f} ms {timing['queries']:>6} queries "
+                    f"{timing['db_ms']:>10.1f} ms SQL{extra}"
+                )
+
+        run = {
+            'meta': {
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': _git_commit(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(run, output, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if compare_files:
+            self.report_comparison(self.load(compare_files[0]), run, options)
+
+    def load(self, path):
+        try:
+            with open(path) as result_file:
+                return json.load(result_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+
+    def report_comparison(self, old, new, options):
+        rows = compare(old, new, options['threshold'])
+        regressions = 0
+        for size, step, before, after, change, regressed in rows:
+            regressions += regressed
+            self.stdout.write(
+                f"{size:>7} {step:<20} {before['ms']:>10.1f} -> {after['ms']:>10.1f} ms "
+                f"({change:+6.1%})  {before['queries']:>6} -> {after['queries']:<6} queries"
+                f"{'  REGRESSION' if regressed else ''}"
+            )
+        self.stdout.write(f'{regressions} regressions in {len(rows)} comparable steps')
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{regressions} steps regressed')
+
+    def run_size(self, size, steps, repeat):
+        """Seed ``size`` members for a throwaway user, time ``steps`` and roll it all back.
+
+        Uploads, statements and cached summaries go to temporary directories,
+        and metrics aren't recorded, so nothing outside the transaction changes.
+        """
+        results = {}
+        with tempfile.TemporaryDirectory() as scratch, override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            SECURE_SSL_REDIRECT=False,
+            METRICS_ENABLED=False,
+            IMPORT_JOB_DIR=f'{scratch}/jobs',
+            PDF_CACHE_DIR=f'{scratch}/pdf',
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': f'{scratch}/cache',
+            }},
+        ):
+            with rolled_back():
+                user = User.objects.create(username='__benchmark_suite__')
+                bulk_upsert_members(user, SEED_YEAR, synthetic_members(size, SEED_YEAR, account_prefix='BENCH'))
+                client = Client()
+                client.force_login(user)
+                suite = _Suite(client, user, size, repeat)
+                for step in steps:
+                    results[step] = getattr(suite, step)()
+        return results
+
+
+class _Suite:
+    """One method per step, each returning its timing dict"""
+
+    def __init__(self, client, user, size, repeat):
+        self.client = client
+        self.user = user
+        self.size = size
+        self.repeat = repeat
+        self.member_id = (Member.objects.filter(user=user, year=SEED_YEAR)
+                          .order_by('id').values_list('id', flat=True)[size // 2])
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        if response.status_code != 200:
+            raise CommandError(f'GET {path} returned {response.status_code}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def clear_summary(self):
+        cache.delete_many([years_key(self.user.id), summary_key(self.user.id, SEED_YEAR)])
+
+    def dashboard(self):
+        return best_of(self.repeat, lambda: self.get('/', year=SEED_YEAR), before=self.clear_summary)
+
+    def dashboard_cached(self):
+        self.get('/', year=SEED_YEAR)
+        return best_of(self.repeat, lambda: self.get('/', year=SEED_YEAR))
+
+    def edit_contributions(self):
+        path = f'/edit/{self.member_id}/'
+        form = {month: 500 for month in MONTHS}
+
+        def edit():
+            self.get(path)
+            response = self.client.post(path, form)
+            if response.status_code != 302:
+                raise CommandError(f'POST {path} returned {response.status_code}')
+        _, timing = measure(edit)
+        return timing
+
+    def generate_pdf(self):
+        # Statements are cached by content; a new amount forces a fresh render each run
+        def change_member():
+            member = Member.objects.get(id=self.member_id)
+            member.monthly_contributions['December'] = time.perf_counter_ns() % 100000
+            member.save()
+        return best_of(self.repeat, lambda: self.get(f'/report-pdf/{self.member_id}/'),
+                       before=change_member)
+
+    def generate_pdf_cached(self):
+        self.get(f'/report-pdf/{self.member_id}/')
+        return best_of(self.repeat, lambda: self.get(f'/report-pdf/{self.member_id}/'))
+
+    def run_upload(self, post_upload, rows):
+        def upload():
+            response = post_upload()
+            if response.status_code != 302:
+                raise CommandError(f'Upload returned {response.status_code}')
+            job = ImportJob.objects.select_related('user').get(
+                id=resolve(response.url).kwargs['job_id']
+            )
+            run_import_job(job)
+            if job.status != ImportJob.DONE:
+                raise CommandError(f'Import failed: {job.message}')
+        _, timing = measure(upload)
+        timing['rows_per_second'] = round(rows / (timing['ms'] / 1000), 1)
+        return timing
+
+    def upload_single(self):
+        workbook = BytesIO()
+        write_workbook(workbook, {'Contributions': synthetic_members(self.size, SINGLE_YEAR, account_prefix='BENCH')})
+        workbook.name = 'single.xlsx'
+
+        def post():
+            workbook.seek(0)
+            return self.client.post('/upload/', {'excel_file': workbook, 'year': SINGLE_YEAR})
+        return self.run_upload(post, self.size)
+
+    def upload_multi(self):
+        per_sheet = max(self.size // len(MULTI_YEARS), 1)
+        workbook = BytesIO()
+        write_workbook(workbook, {
+            year: synthetic_members(per_sheet, year, account_prefix='BENCH') for year in MULTI_YEARS
+        })
+        workbook.name = 'multi.xlsx'
+
+        def post():
+            workbook.seek(0)
+            response = self.client.post('/upload/', {'excel_file': workbook, 'year': MULTI_YEARS[0]})
+            if response.status_code != 200:
+                raise CommandError(f'Upload returned {response.status_code}')
+            selection = {'sheet_index': [str(index) for index in range(len(MULTI_YEARS))]}
+            selection.update({f'sheet_year_{index}': year for index, year in enumerate(MULTI_YEARS)})
+            return self.client.post('/upload/', selection)
+        return self.run_upload(post, per_sheet * len(MULTI_YEARS))
+
+    def delete_all(self):
+        def delete():
+            response = self.client.post('/delete-all/', {'year': SEED_YEAR})
+            if response.status_code != 302:
+                raise CommandError(f'Delete returned {response.status_code}')
+        _, timing = measure(delete)
+        if Member.objects.filter(user=self.user, year=SEED_YEAR).exists():
+            raise CommandError('delete_all left members behind')
+        return timing
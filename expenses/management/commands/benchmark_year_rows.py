@@ -0,0 +1,63 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from expenses.db import rolled_back
+from expenses.importers import import_frames
+from expenses.management.commands.benchmark_import import synthetic_sheet
+from expenses.models import ContributionPolicy, Member
+from expenses.policies import year_rows
+
+
+def per_member(members, policy):
+    """The old path: every figure comes from a model property, member by member"""
+    rows = []
+    for member in members.iterator(chunk_size=2000):
+        rows.append({
+            'id': member.id,
+            'name': member.name,
+            'total_contributed': sum(float(amount) for amount in member.monthly_contributions.values()),
+            'expected': member.expected(policy),
+            'deficits': member.deficits(policy),
+        })
+    return rows
+
+
+def batched(members, policy):
+    """One vectorized pass per chunk of plain rows"""
+    return list(year_rows(members, policy, ('id', 'name')))
+
+
+class Command(BaseCommand):
+    help = "Compare per-member and vectorized evaluation of a year's rows (all writes are rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--year', type=int, default=2024)
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        for count in options['members']:
+            with rolled_back():
+                user = User.objects.create(username='__benchmark_year_rows__')
+                import_frames([synthetic_sheet(count)], user, options['year'])
+                members = Member.objects.filter(user=user, year=options['year']).order_by('name', 'id')
+                policy = ContributionPolicy.for_year(user.id, options['year'])
+
+                timings = {}
+                for label, evaluate in (('per-member', per_member), ('batched', batched)):
+                    best = None
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        evaluate(members, policy)
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    timings[label] = best
+
+            self.stdout.write(
+                f'{count:>7} members  '
+                f"per-member {timings['per-member']:7.3f}s  "
+                f"batched {timings['batched']:7.3f}s  "
+                f"speedup {timings['per-member'] / timings['batched']:5.1f}x"
+            )
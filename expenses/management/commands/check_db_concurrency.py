@@ -0,0 +1,137 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Q, Sum
+
+from expenses.db import configure_sqlite
+from expenses.management.commands.generate_synthetic_data import synthetic_members
+from expenses.models import ContributionPolicy, Member
+
+ALIAS = 'concurrency_check'
+READ_YEAR, WRITE_YEAR = 2023, 2024
+
+
+class Command(BaseCommand):
+    help = (
+        'Show whether dashboard reads keep going while a large import writes. '
+        'Runs on a scratch copy of the SQLite schema, once with SQLITE_PRAGMAS and '
+        "once with SQLite's defaults (rollback journal, full syncs, 2 MB cache), and "
+        'reports read latency during the import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='Members written by the import, in one transaction')
+        parser.add_argument('--readers', type=int, default=4, help='Threads reading meanwhile')
+        parser.add_argument('--modes', nargs='+', choices=['tuned', 'default'],
+                            default=['tuned', 'default'])
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError(
+                'Only SQLite readers wait for writers; PostgreSQL reads never block on an import'
+            )
+        for mode in options['modes']:
+            with tempfile.TemporaryDirectory() as scratch:
+                connections.settings[ALIAS] = {
+                    **connections['default'].settings_dict,
+                    'NAME': os.path.join(scratch, 'check.sqlite3'),
+                    'CONN_MAX_AGE': 0,
+                }
+                if mode == 'default':
+                    connection_created.disconnect(dispatch_uid='expenses.configure_sqlite')
+                try:
+                    result = self.run_mode(mode, options['rows'], options['readers'])
+                finally:
+                    connection_created.connect(configure_sqlite, dispatch_uid='expenses.configure_sqlite')
+                    connections[ALIAS].close()
+                    del connections[ALIAS]
+                    del connections.settings[ALIAS]
+            self.report(mode, result)
+
+    def run_mode(self, mode, rows, readers):
+        journal = connections[ALIAS].cursor().execute('PRAGMA journal_mode').fetchone()[0]
+        self.stdout.write(f'{mode} ({journal} journal): preparing a scratch database with {rows} members...')
+        call_command('migrate', database=ALIAS, verbosity=0)
+        user = User.objects.using(ALIAS).create(username='__concurrency_check__')
+        policy = ContributionPolicy.for_year(user.id, READ_YEAR)
+        members = [Member(user=user, year=READ_YEAR, **row) for row in synthetic_members(rows, READ_YEAR)]
+        Member.set_totals(members, policy)
+        Member.objects.using(ALIAS).bulk_create(members, batch_size=1000)
+        connections[ALIAS].close()
+
+        importing = threading.Event()
+        done = threading.Event()
+        latencies, errors, import_seconds = [], [], []
+
+        def read():
+            # The dashboard's summary and first page
+            try:
+                importing.wait()
+                year = Member.objects.using(ALIAS).filter(user=user, year=READ_YEAR)
+                while not done.is_set():
+                    start = time.perf_counter()
+                    try:
+                        year.aggregate(
+                            count=Count('id'),
+                            contributed=Sum('total_contributed'),
+                            deficit=Sum('total_deficit'),
+                            in_deficit=Count('id', filter=Q(total_deficit__gt=0)),
+                        )
+                        list(year.order_by('name', 'id')[:25])
+                    except OperationalError as e:
+                        errors.append(str(e))
+                    else:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connections[ALIAS].close()
+
+        def write():
+            # One sheet's inserts, in one transaction as the import runs them
+            try:
+                incoming = [Member(user=user, year=WRITE_YEAR, **row)
+                            for row in synthetic_members(rows, WRITE_YEAR, account_prefix='IMP')]
+                Member.set_totals(incoming, policy)
+                importing.set()
+                start = time.perf_counter()
+                with transaction.atomic(using=ALIAS):
+                    Member.objects.using(ALIAS).bulk_create(incoming, batch_size=1000)
+                import_seconds.append(time.perf_counter() - start)
+            finally:
+                done.set()
+                importing.set()
+                connections[ALIAS].close()
+
+        threads = [threading.Thread(target=read) for _ in range(readers)]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, import_seconds
+
+    def report(self, mode, result):
+        latencies, errors, import_seconds = result
+        if not import_seconds:
+            raise CommandError(f'{mode}: the import failed')
+        line = (
+            f'{mode}: import took {import_seconds[0]:.2f}s; {len(latencies)} reads meanwhile '
+            f'({len(latencies) / import_seconds[0]:.0f}/s)'
+        )
+        if latencies:
+            ms = sorted(latency * 1000 for latency in latencies)
+            line += (
+                f', median {statistics.median(ms):.1f} ms, '
+                f'p95 {ms[int(len(ms) * 0.95)]:.1f} ms, max {ms[-1]:.1f} ms'
+            )
+        if errors:
+            line += f'; {len(errors)} failed ({errors[0]})'
+        self.stdout.write(line)
@@ -0,0 +1,155 @@
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.models import ImportBatch, MONTHS
+from expenses.upserts import bulk_upsert_members
+
+# Same headers the upload reads
+WORKBOOK_HEADERS = ['Name', 'Account Number', 'Phone'] + MONTHS
+
+FIRST_NAMES = [
+    'Wanjiku', 'Otieno', 'Achieng', 'Kamau', 'Njeri', 'Mwangi', 'Akinyi', 'Kiprop',
+    'Chebet', 'Mutua', 'Wambui', 'Omondi', 'Nafula', 'Barasa', 'Atieno', 'Kariuki',
+    'Jeptoo', 'Muthoni', 'Ochieng', 'Wairimu', 'Grace', 'Peter', 'Mary', 'John',
+]
+LAST_NAMES = [
+    'Njoroge', 'Odhiambo', 'Wekesa', 'Kiplagat', 'Mutiso', 'Ndungu', 'Onyango', 'Chege',
+    'Maina', 'Kibet', 'Wafula', 'Owino', 'Nyambura', 'Kosgei', 'Gitau', 'Auma',
+]
+
+# Member profiles and the share of members generated with each
+REGULAR, IRREGULAR, LAPSED = range(3)
+PROFILE_SHARES = [0.6, 0.3, 0.1]
+
+
+def synthetic_members(count, year, seed=0, account_prefix='SYN', annual_target=6000):
+    """``count`` member rows for ``year``, shaped like ``bulk_upsert_members`` input.
+
+    Names, account numbers and phones depend only on the member's position,
+    so the same members come back in every year generated with one prefix.
+    About 60% pay the default January-March installments plus extras, 30%
+    pay irregular amounts and 10% have lapsed.
+    """
+    names = np.random.default_rng(seed)
+    first = names.choice(FIRST_NAMES, size=count)
+    last = names.choice(LAST_NAMES, size=count)
+
+    rng = np.random.default_rng([seed, year])
+    profile = rng.choice(3, size=count, p=PROFILE_SHARES)
+    amounts = np.zeros((count, len(MONTHS)))
+    regular = profile == REGULAR
+    amounts[regular, :3] = annual_target / 3
+    amounts[regular, 3:] = rng.choice([0, 0, 500, 1000], size=(int(regular.sum()), 9))
+    irregular = profile == IRREGULAR
+    amounts[irregular] = rng.choice([0, 250, 500, 1000, 1500, 2000], size=(int(irregular.sum()), 12))
+
+    return [
+        {
+            'account_number': f'{account_prefix}-{index:07d}',
+            'name': f'{first[index]} {last[index]}',
+            'phone': f'07{index % 10 ** 8:08d}',
+            'monthly_contributions': dict(zip(MONTHS, month_amounts)),
+        }
+        for index, month_amounts in enumerate(amounts.tolist())
+    ]
+
+
+def workbook_row(member, rng, error_rate):
+    """A member as a treasurer's sheet would hold it.
+
+    Zero months are often left blank, names pick up stray spaces, Excel
+    keeps some phones as numbers (dropping the leading 0), and about
+    ``error_rate`` of the rows carry an amount the import rejects.
+    """
+    name = member['name']
+    if rng.random() < 0.05:
+        name = f' {name}  '
+    phone = member['phone']
+    if rng.random() < 0.3:
+        phone = int(phone)
+    amounts = [
+        None if amount == 0 and rng.random() < 0.7 else amount
+        for amount in member['monthly_contributions'].values()
+    ]
+    if error_rate and rng.random() < error_rate:
+        amounts[int(rng.integers(len(amounts)))] = 'n/a'
+    return [name, member['account_number'], phone] + amounts
+
+
+def write_workbook(output, sheets, seed=0, error_rate=0.0):
+    """Write ``sheets`` (sheet name -> member rows) as an .xlsx to a path or file object"""
+    rng = np.random.default_rng(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    for title, members in sheets.items():
+        worksheet = workbook.create_sheet(title=str(title))
+        worksheet.append(WORKBOOK_HEADERS)
+        for member in members:
+            worksheet.append(workbook_row(member, rng, error_rate))
+    workbook.save(output)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users and members across years, and optionally a '
+        'multi-sheet workbook (a sheet per year) to upload'
+    )
+
+    def add_arguments(self, parser):
+        this_year = datetime.now().year
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--members', type=int, default=1000, help='Members per user per year')
+        parser.add_argument('--years', type=int, nargs='+',
+                            default=[this_year - 2, this_year - 1, this_year])
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Usernames are <prefix>-<n>; account numbers start with it too')
+        parser.add_argument('--password', help='Password for the users (unusable by default)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--reset', action='store_true',
+                            help="Delete the prefix's existing users and their members first")
+        parser.add_argument('--workbook', help='Also write the first user\'s years to this .xlsx')
+        parser.add_argument('--workbook-only', action='store_true',
+                            help='Only write --workbook, leaving the database alone')
+        parser.add_argument('--error-rate', type=float, default=0.001,
+                            help='Share of workbook rows with an invalid amount')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['workbook_only'] and not options['workbook']:
+            raise CommandError('--workbook-only needs --workbook')
+
+        if options['workbook']:
+            sheets = {
+                year: synthetic_members(options['members'], year, options['seed'], f'{prefix}-1')
+                for year in options['years']
+            }
+            write_workbook(options['workbook'], sheets, options['seed'], options['error_rate'])
+            self.stdout.write(
+                f"Wrote {options['workbook']}: {len(sheets)} sheets of {options['members']} members"
+            )
+        if options['workbook_only']:
+            return
+
+        if options['reset']:
+            deleted, _ = User.objects.filter(username__startswith=f'{prefix}-').delete()
+            self.stdout.write(f'Deleted {deleted} existing rows')
+
+        for number in range(1, options['users'] + 1):
+            user, created = User.objects.get_or_create(username=f'{prefix}-{number}')
+            if created:
+                if options['password']:
+                    user.set_password(options['password'])
+                else:
+                    user.set_unusable_password()
+                user.save()
+            for year in options['years']:
+                rows = synthetic_members(options['members'], year, options['seed'], f'{prefix}-{number}')
+                created_count, updated, unchanged = bulk_upsert_members(user, year, rows)
+                ImportBatch.forget(user.id, [year])
+                self.stdout.write(
+                    f'{user.username} {year}: {created_count} created, {updated} updated, '
+                    f'{unchanged} unchanged'
+                )
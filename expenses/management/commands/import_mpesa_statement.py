@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.models import MpesaShortcode
+from expenses.payments import read_statement, record_payments
+
+
+class Command(BaseCommand):
+    help = 'Queue the incoming payments of an M-Pesa statement export (.csv or .xlsx)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--shortcode', required=True,
+                            help='Paybill or till number the statement is for')
+
+    def handle(self, *args, **options):
+        owner = MpesaShortcode.objects.select_related('user').filter(shortcode=options['shortcode']).first()
+        if owner is None:
+            raise CommandError(f"Shortcode {options['shortcode']} is not registered to a user")
+        try:
+            payments, errors = read_statement(options['path'], owner.user)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        # Receipts already received by callback or an earlier statement are skipped
+        record_payments(payments)
+        for error in errors:
+            self.stderr.write(f"Row {error['row']}: {', '.join(error['errors'])}")
+        self.stdout.write(
+            f'{len(payments)} payments read, {len(errors)} rows skipped; '
+            f'run apply_payments to add them to the ledger'
+        )
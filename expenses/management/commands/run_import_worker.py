@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from expenses.jobs import claim_next_job, fail_stale_jobs, run_import_job
+
+# Seconds between checks for jobs left running by a worker that died
+STALE_CHECK_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Process queued Excel import jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        last_stale_check = None
+        while True:
+            # Drop connections past CONN_MAX_AGE or broken, as a request would
+            close_old_connections()
+            try:
+                if last_stale_check is None or time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL:
+                    stale = fail_stale_jobs()
+                    if stale:
+                        self.stdout.write(f'Failed {stale} jobs left running by a stopped worker')
+                    last_stale_check = time.monotonic()
+                job = claim_next_job()
+            except OperationalError as e:
+                self.stderr.write(f'Could not claim a job, retrying: {e}')
+                time.sleep(options['sleep'])
+                continue
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            run_import_job(job)
+            self.stdout.write(
+                f'Import job {job.id} {job.status}: {job.rows_done} rows imported, '
+                f'{job.rows_failed} failed'
+            )
@@ -0,0 +1,107 @@
+import json
+import random
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from expenses.models import Member, MpesaShortcode
+from expenses.views import mpesa_confirmation
+
+
+def confirmation_payload(index, shortcode, account_number, phone, paid_at):
+    """A C2B confirmation shaped like the ones Daraja posts"""
+    return {
+        'TransactionType': 'Pay Bill',
+        'TransID': f'SIM{index:09d}',
+        'TransTime': paid_at.strftime('%Y%m%d%H%M%S'),
+        'TransAmount': str(random.choice([100, 250, 500, 1000, 2000])),
+        'BusinessShortCode': shortcode,
+        'BillRefNumber': account_number,
+        'InvoiceNumber': '',
+        'OrgAccountBalance': '',
+        'ThirdPartyTransID': '',
+        'MSISDN': phone,
+        'FirstName': 'Simulated',
+    }
+
+
+class Command(BaseCommand):
+    help = 'Post synthetic M-Pesa confirmation callbacks, as a local stand-in for Daraja'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--shortcode', default='600000',
+                            help="Registered shortcode to pay into; its owner's members are paid")
+        parser.add_argument('--year', type=int, default=timezone.now().year,
+                            help='Pay members of this year')
+        parser.add_argument('--unknown', type=float, default=0.05,
+                            help='Share of payments with an account number no member has')
+        parser.add_argument('--url', default=None,
+                            help='Confirmation URL of a running server; default calls the view in-process')
+        parser.add_argument('--start', type=int, default=0,
+                            help='First transaction number, to avoid reusing receipt numbers')
+
+    def handle(self, *args, **options):
+        if not settings.MPESA_CALLBACK_TOKEN:
+            raise CommandError('Set MPESA_CALLBACK_TOKEN first; callbacks without it are refused')
+        user_id = MpesaShortcode.owner_id(options['shortcode'])
+        if user_id is None:
+            raise CommandError(f"Register shortcode {options['shortcode']} to a user in the admin first")
+        members = list(Member.objects.filter(user_id=user_id, year=options['year'])
+                       .values_list('account_number', 'phone')[:10000])
+        if not members:
+            self.stderr.write(f"No members in {options['year']}; every payment will be unmatched")
+            members = [('UNKNOWN', '')]
+
+        paid_at = timezone.now().replace(year=options['year'])
+        payloads = []
+        for index in range(options['start'], options['start'] + options['count']):
+            account_number, phone = random.choice(members)
+            if random.random() < options['unknown']:
+                account_number = f'NOPE{index}'
+            payloads.append(confirmation_payload(index, options['shortcode'], account_number, phone, paid_at))
+
+        post = self._post_http(options['url']) if options['url'] else self._post_in_process()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            statuses = list(pool.map(post, payloads))
+        elapsed = time.perf_counter() - start
+
+        failed = sum(1 for status in statuses if status != 200)
+        self.stdout.write(
+            f"{len(payloads)} callbacks in {elapsed:.2f}s "
+            f"({len(payloads) / elapsed * 60:.0f}/min), {failed} failed"
+        )
+
+    def _post_in_process(self):
+        factory = RequestFactory()
+
+        def post(payload):
+            request = factory.post(self._with_token('/payments/mpesa/confirmation/'), json.dumps(payload),
+                                   content_type='application/json')
+            try:
+                return mpesa_confirmation(request).status_code
+            finally:
+                # Each thread has its own connection
+                connection.close()
+        return post
+
+    def _post_http(self, url):
+        def post(payload):
+            request = urllib.request.Request(self._with_token(url), data=json.dumps(payload).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        return post
+
+    def _with_token(self, url):
+        separator = '&' if '?' in url else '?'
+        return f"{url}{separator}{urlencode({'token': settings.MPESA_CALLBACK_TOKEN})}"
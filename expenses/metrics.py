@@ -0,0 +1,220 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger('expenses.metrics')
+
+# Every metric, in the order /metrics/ lists them
+REGISTRY = []
+
+# Samples are running totals keyed by name, label string and bucket bound
+# (empty for everything but histogram buckets). Adding to them is a single
+# upsert, so any number of processes can share the file.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, le)
+)
+'''
+ADD_SAMPLE = '''
+INSERT INTO samples (name, labels, le, value) VALUES (?, ?, ?, ?)
+ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value
+'''
+
+_local = threading.local()
+
+
+def _connection():
+    """This thread's connection to METRICS_DB, reopened after a fork or when the path changes"""
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.pid != os.getpid() or _local.path != settings.METRICS_DB:
+        connection = sqlite3.connect(settings.METRICS_DB, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(SCHEMA)
+        _local.connection = connection
+        _local.pid = os.getpid()
+        _local.path = settings.METRICS_DB
+    return connection
+
+
+def _add(samples):
+    """Add ``(name, labels, le, amount)`` samples in one transaction.
+
+    Metrics never break the request or import being measured: storage
+    errors are logged and the samples dropped.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    try:
+        connection = _connection()
+        with connection:
+            connection.executemany(ADD_SAMPLE, samples)
+    except sqlite3.Error as e:
+        logger.warning('Could not record metrics: %s', e)
+
+
+def _label_string(labelnames, labels):
+    if sorted(labels) != sorted(labelnames):
+        raise ValueError(f'Expected labels {labelnames}, got {sorted(labels)}')
+    return ','.join(
+        '{}="{}"'.format(
+            name, str(labels[name]).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        )
+        for name in labelnames
+    )
+
+
+def _format_bound(bound):
+    return '+Inf' if math.isinf(bound) else repr(float(bound))
+
+
+def _sample_line(name, labels, value):
+    value = str(int(value)) if float(value).is_integer() else repr(float(value))
+    return f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+
+
+class Counter:
+    """A running total; by convention its name ends in ``_total``"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = list(labelnames)
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        _add(self.samples(amount, **labels))
+
+    def samples(self, amount, **labels):
+        return [(self.name, _label_string(self.labelnames, labels), '', amount)] if amount else []
+
+    def value(self, **labels):
+        """The total for ``labels``, summed over every process"""
+        row = _connection().execute(
+            'SELECT value FROM samples WHERE name = ? AND labels = ? AND le = ?',
+            (self.name, _label_string(self.labelnames, labels), ''),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def exposition(self, stored):
+        """Sample lines from ``stored``, a dict of ``(name, labels, le)`` to value"""
+        return [
+            _sample_line(name, labels, value)
+            for (name, labels, _), value in sorted(stored.items()) if name == self.name
+        ]
+
+
+class Histogram:
+    """Counts of observations at or below each bucket bound, plus their sum"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(float(bound) for bound in buckets) + [math.inf]
+        self.labelnames = list(labelnames)
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        _add(self.samples(value, **labels))
+
+    def samples(self, value, **labels):
+        label_string = _label_string(self.labelnames, labels)
+        # Buckets are cumulative, as Prometheus expects
+        samples = [
+            (f'{self.name}_bucket', label_string, _format_bound(bound), 1)
+            for bound in self.buckets if value <= bound
+        ]
+        samples.append((f'{self.name}_sum', label_string, '', value))
+        samples.append((f'{self.name}_count', label_string, '', 1))
+        return samples
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def exposition(self, stored):
+        """Sample lines from ``stored``, a dict of ``(name, labels, le)`` to value.
+
+        Every bucket is listed for each label set, including empty ones.
+        """
+        bucket, total, count = f'{self.name}_bucket', f'{self.name}_sum', f'{self.name}_count'
+        lines = []
+        for labels in sorted(labels for name, labels, _ in stored if name == count):
+            for bound in self.buckets:
+                le = _format_bound(bound)
+                bucket_labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                lines.append(_sample_line(bucket, bucket_labels, stored.get((bucket, labels, le), 0)))
+            lines.append(_sample_line(total, labels, stored[(total, labels, '')]))
+            lines.append(_sample_line(count, labels, stored[(count, labels, '')]))
+        return lines
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+    stored = {
+        (name, labels, le): value
+        for name, labels, le, value in
+        _connection().execute('SELECT name, labels, le, value FROM samples')
+    }
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.exposition(stored))
+    return '\n'.join(lines) + '\n'
+
+
+IMPORT_ROWS = Counter(
+    'cwa_import_rows_total', 'Member rows processed by Excel imports, by outcome', ['result'],
+)
+IMPORT_ROWS_PER_SECOND = Histogram(
+    'cwa_import_rows_per_second', 'Rows written per second by each import or sheet',
+    buckets=[100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000],
+)
+PDF_RENDER_SECONDS = Histogram(
+    'cwa_pdf_render_seconds', 'Time to build one member statement PDF',
+    buckets=[0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+UPLOAD_BYTES = Histogram(
+    'cwa_upload_bytes', 'Size of uploaded workbooks',
+    buckets=[10_000, 100_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000],
+)
+MEMBER_CACHE_LOOKUPS = Counter(
+    'cwa_member_cache_lookups_total', 'Member summary and analytics cache lookups, by result', ['result'],
+)
+DASHBOARD_ROWS = Histogram(
+    'cwa_dashboard_rows', 'Member rows rendered per dashboard page',
+    buckets=[0, 10, 25, 50, 100, 250, 500],
+)
+
+
+def record_import(created, updated, unchanged, failed, seconds):
+    """Count one import's rows by outcome and observe its throughput, in one write"""
+    samples = []
+    for result, rows in (('created', created), ('updated', updated),
+                         ('unchanged', unchanged), ('failed', failed)):
+        samples += IMPORT_ROWS.samples(rows, result=result)
+    rows = created + updated + unchanged
+    if rows and seconds > 0:
+        samples += IMPORT_ROWS_PER_SECOND.samples(rows / seconds)
+    if samples:
+        _add(samples)
@@ -0,0 +1,123 @@
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('expenses.performance')
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts and times every SQL statement.
+
+    Only the ``PERFORMANCE_SLOW_QUERIES`` slowest statements are kept, without
+    their parameters, which may hold member names and phone numbers.
+    """
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []  # Min-heap of (seconds, sequence, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            entry = (elapsed, self.count, sql)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, entry)
+            elif self.keep:
+                heapq.heappushpop(self.slowest, entry)
+
+    def slowest_queries(self):
+        return [
+            {'ms': round(seconds * 1000, 2), 'sql': sql[:1000]}
+            for seconds, _, sql in sorted(self.slowest, reverse=True)
+        ]
+
+
+class PerformanceMiddleware:
+    """Time each request and its SQL, report it in ``Server-Timing`` and log slow ones.
+
+    The header carries the request's total, database and application time
+    plus its query count. Requests over ``PERFORMANCE_SLOW_REQUEST_MS`` are
+    written as one JSON line to the ``expenses.performance`` logger, with their
+    slowest queries. With ``PERFORMANCE_MONITORING`` off the middleware
+    removes itself at startup, so it costs nothing.
+
+    A streaming response's header can only cover the time until it starts;
+    the log entry is written once the body has been sent, so the queries run
+    while streaming (e.g. a year's statements) are counted there.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_MONITORING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer(settings.PERFORMANCE_SLOW_QUERIES)
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+
+        elapsed = time.perf_counter() - start
+        response['Server-Timing'] = server_timing(elapsed, timer)
+
+        if response.streaming and getattr(response, 'file_to_stream', None) is None:
+            # Keep counting until the body has been sent
+            response.streaming_content = self._finish_after(
+                response.streaming_content, stack, request, response, timer, start
+            )
+        else:
+            stack.close()
+            self.log_if_slow(request, response, timer, elapsed)
+        return response
+
+    def _finish_after(self, content, stack, request, response, timer, start):
+        try:
+            yield from content
+        finally:
+            stack.close()
+            self.log_if_slow(request, response, timer, time.perf_counter() - start)
+
+    def log_if_slow(self, request, response, timer, elapsed):
+        if elapsed * 1000 < settings.PERFORMANCE_SLOW_REQUEST_MS:
+            return
+        match = request.resolver_match
+        logger.warning(json.dumps({
+            'time': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'user': getattr(getattr(request, 'user', None), 'pk', None),
+            'ms': round(elapsed * 1000, 2),
+            'db_ms': round(timer.seconds * 1000, 2),
+            'queries': timer.count,
+            'slowest_queries': timer.slowest_queries(),
+        }))
+
+
+def server_timing(elapsed, timer):
+    """``Server-Timing`` value for a request that took ``elapsed`` seconds"""
+    return (
+        f'total;dur={elapsed * 1000:.1f}, '
+        f'db;dur={timer.seconds * 1000:.1f};desc="{timer.count} queries", '
+        f'app;dur={max(elapsed - timer.seconds, 0) * 1000:.1f}'
+    )
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='sheet_results',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='sheet_years',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
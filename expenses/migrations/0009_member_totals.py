@@ -0,0 +1,52 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:27
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+CENTS = Decimal('0.01')
+
+
+def backfill_totals(apps, schema_editor):
+    # Same rule as Member.refresh_totals at the time of this migration
+    Member = apps.get_model('expenses', 'Member')
+    db_alias = schema_editor.connection.alias
+    batch = []
+    for member in Member.objects.using(db_alias).only('monthly_contributions', 'annual_target').iterator(chunk_size=2000):
+        contributions = member.monthly_contributions or {}
+        total = sum(float(amt) for amt in contributions.values())
+        q1_paid = sum(float(contributions.get(month, 0)) for month in ['January', 'February', 'March'])
+        member.total_contributed = Decimal(total).quantize(CENTS)
+        member.q1_paid = Decimal(q1_paid).quantize(CENTS)
+        member.total_deficit = Decimal(max(float(member.annual_target) - q1_paid, 0.0)).quantize(CENTS)
+        batch.append(member)
+        if len(batch) >= 2000:
+            Member.objects.using(db_alias).bulk_update(batch, ['total_contributed', 'q1_paid', 'total_deficit'])
+            batch = []
+    Member.objects.using(db_alias).bulk_update(batch, ['total_contributed', 'q1_paid', 'total_deficit'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0008_importjob_sheet_years'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='q1_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='total_contributed',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='total_deficit',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:28
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+MONTHS = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'
+]
+
+
+def explode_contributions(apps, schema_editor):
+    Member = apps.get_model('expenses', 'Member')
+    Contribution = apps.get_model('expenses', 'Contribution')
+    db_alias = schema_editor.connection.alias
+    rows = []
+    members = Member.objects.using(db_alias).only('year', 'monthly_contributions').iterator(chunk_size=2000)
+    for member in members:
+        contributions = member.monthly_contributions or {}
+        for month_number, month in enumerate(MONTHS, start=1):
+            amount = float(contributions.get(month, 0) or 0)
+            if amount:
+                rows.append(Contribution(
+                    member_id=member.id,
+                    year=member.year,
+                    month=month_number,
+                    amount=Decimal(amount).quantize(Decimal('0.01')),
+                ))
+        if len(rows) >= 5000:
+            Contribution.objects.using(db_alias).bulk_create(rows, batch_size=1000)
+            rows = []
+    Contribution.objects.using(db_alias).bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0009_member_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to='expenses.member')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year', 'month'], name='expenses_co_year_8e98b6_idx')],
+                'unique_together': {('member', 'month')},
+            },
+        ),
+        migrations.RunPython(explode_contributions, migrations.RunPython.noop),
+    ]
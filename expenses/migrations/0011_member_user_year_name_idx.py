@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0010_contribution'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'year', 'name'], name='member_user_year_name_idx'),
+        ),
+    ]
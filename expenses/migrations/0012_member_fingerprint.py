@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0011_member_user_year_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
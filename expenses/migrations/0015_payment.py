@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0014_contributionpolicy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trans_id', models.CharField(max_length=32, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('paid_at', models.DateTimeField()),
+                ('account_reference', models.CharField(blank=True, max_length=50)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('payer_name', models.CharField(blank=True, max_length=100)),
+                ('source', models.CharField(choices=[('callback', 'Callback'), ('statement', 'Statement')], default='callback', max_length=10)),
+                ('raw', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('applied', 'Applied'), ('unmatched', 'Unmatched')], default='pending', max_length=10)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('member', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='expenses.member')),
+            ],
+            options={
+                'ordering': ['-paid_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='payment_status_idx')],
+            },
+        ),
+    ]
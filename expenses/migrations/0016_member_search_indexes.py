@@ -0,0 +1,79 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:48
+
+from django.db import OperationalError, migrations, models
+
+FTS_TABLE = 'expenses_member_fts'
+
+# The FTS table mirrors expenses_member.name (external content), kept in
+# sync by triggers so bulk inserts and upserts are indexed too
+SQLITE_FTS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"name, content='expenses_member', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON expenses_member BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END",
+    f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON expenses_member BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END",
+    f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name ON expenses_member BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        # Matches the UPPER(name::text) LIKE UPPER('x%') that istartswith emits
+        schema_editor.execute(
+            'CREATE INDEX member_name_prefix_idx ON expenses_member '
+            '(user_id, year, UPPER(name::text) text_pattern_ops)'
+        )
+    elif vendor == 'sqlite':
+        # Django's LIKE has an ESCAPE clause SQLite won't index, so name
+        # prefixes are searched as NOCASE ranges instead
+        schema_editor.execute(
+            'CREATE INDEX member_name_nocase_idx ON expenses_member '
+            '(user_id, year, name COLLATE NOCASE)'
+        )
+        # Without statistics SQLite seeks (user, year) and scans the year
+        # instead of combining the prefix indexes for an OR'd search
+        schema_editor.execute('ANALYZE expenses_member')
+        # Fuzzy name search is optional: skip it on builds without FTS5/trigram
+        try:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+                cursor.execute('DROP TABLE temp.fts_probe')
+        except OperationalError:
+            return
+        for statement in SQLITE_FTS:
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS member_name_prefix_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP INDEX IF EXISTS member_name_nocase_idx')
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0015_payment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'year', 'account_number'], name='member_user_year_account_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'year', 'phone'], name='member_user_year_phone_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
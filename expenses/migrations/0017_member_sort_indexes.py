@@ -0,0 +1,66 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+AMOUNT_FIELDS = ['total_contributed', 'total_deficit']
+
+
+def _column_indexes(schema_editor, model, column):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return [
+        name for name, info in constraints.items()
+        if info['index'] and not info['unique'] and info['columns'] == [column]
+    ]
+
+
+def drop_amount_indexes(apps, schema_editor):
+    # Dropped by name: on SQLite an AlterField rebuilds the whole table, which
+    # would also lose the search triggers from 0016
+    Member = apps.get_model('expenses', 'Member')
+    for name in AMOUNT_FIELDS:
+        column = Member._meta.get_field(name).column
+        for index in _column_indexes(schema_editor, Member, column):
+            schema_editor.remove_index(Member, models.Index(fields=[name], name=index))
+
+
+def create_amount_indexes(apps, schema_editor):
+    Member = apps.get_model('expenses', 'Member')
+    for name in AMOUNT_FIELDS:
+        column = Member._meta.get_field(name).column
+        schema_editor.add_index(Member, models.Index(fields=[name], name=f'expenses_member_{column}_idx'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0016_member_search_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='member',
+                    name='total_contributed',
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                migrations.AlterField(
+                    model_name='member',
+                    name='total_deficit',
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_amount_indexes, create_amount_indexes),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'year', 'total_contributed', 'id'], name='member_user_year_contrib_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['user', 'year', 'total_deficit', 'id'], name='member_user_year_deficit_idx'),
+        ),
+    ]
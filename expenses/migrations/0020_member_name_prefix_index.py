@@ -0,0 +1,77 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:53
+
+from django.db import migrations
+import expenses.models
+
+FTS_TABLE = 'expenses_member_fts'
+
+# 0016's trigger re-indexed every updated row, and import upserts always set name
+UPDATE_TRIGGER = (
+    f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name ON expenses_member {{when}}BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+)
+
+
+def _replace_update_trigger(schema_editor, when):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+    schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update')
+    schema_editor.execute(UPDATE_TRIGGER.format(when=when))
+
+
+def guard_update_trigger(apps, schema_editor):
+    _replace_update_trigger(schema_editor, 'WHEN old.name IS NOT new.name ')
+
+
+def unguard_update_trigger(apps, schema_editor):
+    _replace_update_trigger(schema_editor, '')
+
+
+def drop_raw_name_index(apps, schema_editor):
+    # 0016 created these in raw SQL; AddIndex below puts the same index in
+    # the migration state
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP INDEX IF EXISTS member_name_nocase_idx')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS member_name_prefix_idx')
+
+
+def create_raw_name_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE INDEX member_name_nocase_idx ON expenses_member '
+            '(user_id, year, name COLLATE NOCASE)'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX member_name_prefix_idx ON expenses_member '
+            '(user_id, year, UPPER(name::text) text_pattern_ops)'
+        )
+
+
+def analyze_members(apps, schema_editor):
+    # As in 0016: without statistics for the new index SQLite seeks
+    # (user, year) and scans the year instead of using it
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ANALYZE expenses_member')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0019_mpesa_shortcode'),
+    ]
+
+    operations = [
+        migrations.RunPython(guard_update_trigger, unguard_update_trigger),
+        migrations.RunPython(drop_raw_name_index, create_raw_name_index),
+        migrations.AddIndex(
+            model_name='member',
+            index=expenses.models.NamePrefixIndex(fields=['user', 'year', 'name'], name='member_name_prefix_idx'),
+        ),
+        migrations.RunPython(analyze_members, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.11 on 2026-10-17 22:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_member_users(apps, schema_editor):
+    Member = apps.get_model('expenses', 'Member')
+    Contribution = apps.get_model('expenses', 'Contribution')
+    db_alias = schema_editor.connection.alias
+    Contribution.objects.using(db_alias).update(user_id=Subquery(
+        Member.objects.using(db_alias).filter(id=OuterRef('member_id')).values('user_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('expenses', '0020_member_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='contribution',
+            name='expenses_co_year_8e98b6_idx',
+        ),
+        migrations.AddField(
+            model_name='contribution',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_member_users, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='contribution',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['user', 'year', 'month', 'amount'], name='contribution_user_year_idx'),
+        ),
+    ]
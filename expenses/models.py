@@ -1,5 +1,38 @@
-from django.db import models
+from decimal import Decimal
+from functools import lru_cache
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import OpClass
+from django.db.models import F
+from django.db.models.functions import Collate, Upper
+
+from .cache import invalidate_member_cache
+from .policies import DEFAULT_POLICY, MONTHS, CompiledPolicy
+
+CENTS = Decimal('0.01')
+
+
+class NamePrefixIndex(models.Index):
+    """``(user, year, name)`` ordered the way ``search.name_prefix`` compares names.
+
+    SQLite searches NOCASE ranges and PostgreSQL istartswith's
+    ``UPPER(name) LIKE``, so each gets its own index expression; other
+    databases a plain index.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        vendor = schema_editor.connection.vendor
+        *columns, name = [F(field) for field in self.fields]
+        if vendor == 'sqlite':
+            index = models.Index(*columns, Collate(name, 'nocase'), name=self.name)
+        elif vendor == 'postgresql':
+            index = models.Index(*columns, OpClass(Upper(name), name='text_pattern_ops'), name=self.name)
+        else:
+            index = models.Index(fields=self.fields, name=self.name)
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
 
 
 class Member(models.Model):
@@ -23,30 +56,467 @@ class Member(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Aggregates of monthly_contributions, kept in sync by refresh_totals()
+    total_contributed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    q1_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # Paid in the policy's due months
+    total_deficit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    # Hash of the row last written by an Excel import; blank after any other
+    # save, so the next import rewrites the member instead of skipping it
+    fingerprint = models.CharField(max_length=16, blank=True, default='')
+
+    # Fields rewritten by refresh_totals(), for bulk writes
+    TOTAL_FIELDS = ['total_contributed', 'q1_paid', 'total_deficit']
+
     class Meta:
         unique_together = ('account_number', 'year')  # Prevent duplicate entries
+        # On SQLite the name search table and its triggers (migration 0016)
+        # live outside these: a migration that rebuilds the table loses them
+        indexes = [
+            # Backs the dashboard's keyset pagination by name
+            models.Index(fields=['user', 'year', 'name'], name='member_user_year_name_idx'),
+            # Case-insensitive name prefix search
+            NamePrefixIndex(fields=['user', 'year', 'name'], name='member_name_prefix_idx'),
+            # ... and by amount, with id as the tie-breaker the pages seek on
+            models.Index(fields=['user', 'year', 'total_contributed', 'id'],
+                         name='member_user_year_contrib_idx'),
+            models.Index(fields=['user', 'year', 'total_deficit', 'id'],
+                         name='member_user_year_deficit_idx'),
+            # Dashboard search by account number and phone prefix
+            models.Index(fields=['user', 'year', 'account_number'], name='member_user_year_account_idx'),
+            models.Index(fields=['user', 'year', 'phone'], name='member_user_year_phone_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        member = super().from_db(db, field_names, values)
+        # The year as stored, so a save moving the member to another year
+        # refreshes the one it left too
+        member._stored_year = member.__dict__.get('year')
+        return member
+
+    def save(self, *args, **kwargs):
+        self.refresh_totals()
+        self.fingerprint = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.TOTAL_FIELDS) | {'fingerprint'}
+        super().save(*args, **kwargs)
+
+        if update_fields is None or {'monthly_contributions', 'year'} & set(update_fields):
+            Contribution.replace_for([(self.id, self.user_id, self.year, self.monthly_contributions)])
+        years = {self.year, getattr(self, '_stored_year', None)} - {None}
+        invalidate_member_cache(self.user_id, years)
+        ImportBatch.forget(self.user_id, years)
+        self._stored_year = self.year
+
+    def delete(self, *args, **kwargs):
+        invalidate_member_cache(self.user_id, [self.year])
+        ImportBatch.forget(self.user_id, [self.year])
+        return super().delete(*args, **kwargs)
+
+    def refresh_totals(self, policy=None):
+        """Recompute the stored aggregates from monthly_contributions.
+
+        save() does this automatically; bulk writes use set_totals() instead.
+        """
+        self.set_totals([self], policy or ContributionPolicy.for_year(self.user_id, self.year))
+
+    @classmethod
+    def set_totals(cls, members, policy):
+        """Fill in the stored aggregates of ``members`` in one vectorized pass"""
+        if not members:
+            return
+        totals = policy.totals(
+            [[float(member.monthly_contributions.get(month, 0) or 0) for month in MONTHS]
+             for member in members],
+            [float(member.annual_target) for member in members],
+        )
+        for member, contributed, due_paid, deficit in zip(members, *(column.tolist() for column in totals)):
+            member.total_contributed = Decimal(contributed).quantize(CENTS)
+            member.q1_paid = Decimal(due_paid).quantize(CENTS)
+            member.total_deficit = Decimal(deficit).quantize(CENTS)
+
+    @classmethod
+    def refresh_year_totals(cls, user_id, year, policy=None):
+        """Recompute the stored aggregates of every member of a user's year.
+
+        Used when the year's policy changes. Rows are written with a raw
+        ``executemany`` for the same reason as ``Contribution.replace_for``.
+        """
+        policy = policy or ContributionPolicy.for_year(user_id, year)
+        rows = list(cls.objects.filter(user_id=user_id, year=year)
+                    .values_list('id', 'monthly_contributions', 'annual_target'))
+        if rows:
+            member_ids, contributions, targets = zip(*rows)
+            totals = policy.totals(
+                [[float(months.get(month, 0) or 0) for month in MONTHS] for months in contributions],
+                [float(target) for target in targets],
+            )
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'UPDATE {table} SET total_contributed = %s, q1_paid = %s, total_deficit = %s '
+                    f'WHERE id = %s',
+                    [
+                        (round(contributed, 2), round(due_paid, 2), round(deficit, 2), member_id)
+                        for contributed, due_paid, deficit, member_id
+                        in zip(*(column.tolist() for column in totals), member_ids)
+                    ],
+                )
+        invalidate_member_cache(user_id, [year])
+
+    def expected(self, policy=None):
+        """Amount due each month under the year's policy"""
+        policy = policy or ContributionPolicy.for_year(self.user_id, self.year)
+        return policy.member_months(self.monthly_contributions, self.annual_target)[0]
+
+    def deficits(self, policy=None):
+        """Shortfall per month under the year's policy, in its last due month"""
+        policy = policy or ContributionPolicy.for_year(self.user_id, self.year)
+        return policy.member_months(self.monthly_contributions, self.annual_target)[1]
+
+
+class Contribution(models.Model):
+    """One month of a member's contributions, mirrored from monthly_contributions.
+
+    Lets reports aggregate by month in SQL instead of decoding the JSON of
+    every member. Months with nothing paid have no row.
+    """
+    member = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name='contributions'
+    )
+    # Copied from the member, so per-user reports don't join members
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='contributions'
+    )
+    year = models.PositiveIntegerField()  # Copied from the member for grouping
+    month = models.PositiveSmallIntegerField()  # 1 = January ... 12 = December
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        unique_together = ('member', 'month')
+        indexes = [
+            # Month totals for a user's year, read from the index alone
+            models.Index(fields=['user', 'year', 'month', 'amount'], name='contribution_user_year_idx'),
+        ]
+
+    @classmethod
+    def replace_for(cls, members):
+        """Rewrite the rows of saved members in two statements.
+
+        ``members`` is an iterable of
+        ``(member_id, user_id, year, monthly_contributions)``.
+        Rows go through a raw ``executemany`` because building a model
+        instance per month made large imports several times slower.
+        """
+        member_ids = []
+        rows = []
+        for member_id, user_id, year, contributions in members:
+            member_ids.append(member_id)
+            for month_number, month in enumerate(MONTHS, start=1):
+                amount = float(contributions.get(month, 0) or 0)
+                if amount:
+                    rows.append((member_id, user_id, year, month_number, round(amount, 2)))
+
+        cls.objects.filter(member_id__in=member_ids).delete()
+        if rows:
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {table} (member_id, user_id, year, month, amount) '
+                    f'VALUES (%s, %s, %s, %s, %s)',
+                    rows,
+                )
+
+
+class ImportJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='import_jobs'
+    )
+
+    # Uploaded workbook waiting in IMPORT_JOB_DIR and what to import from it
+    file_path = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255)
+    year = models.PositiveIntegerField()
+    sheet_name = models.CharField(max_length=255, blank=True)  # Blank means first sheet
+    sheet_years = models.JSONField(default=dict, blank=True)  # {sheet: year} for multi-sheet imports
+
+    # Progress, updated by the worker after every chunk
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)  # Estimate from the sheet dimensions
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)  # Rows skipped because nothing changed
+    errors = models.JSONField(default=list)  # First IMPORT_JOB_MAX_ERRORS row errors
+    sheet_results = models.JSONField(default=list)  # Per-sheet counts and timings
+    message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker with every progress save; a running job whose
+    # heartbeat goes stale lost its worker (see jobs.fail_stale_jobs)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
 
     @property
-    def total_contributed(self):
-        return sum(float(amt) for amt in self.monthly_contributions.values())
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
 
     @property
-    def total_deficit(self):
-        return sum(self.deficits().values())
-
-    def deficits(self):
-        deficits = {}
-        # Calculate total paid for Jan-Mar
-        total_paid = sum(float(self.monthly_contributions.get(month, 0)) 
-                        for month in ['January', 'February', 'March'])
-        
-        # Calculate deficit only for March if total is less than annual target
-        if total_paid < float(self.annual_target):
-            deficits['March'] = float(self.annual_target) - total_paid
-        
-        # No deficits for other months
-        for month in ['January', 'February', 'April', 'May', 'June', 
-                      'July', 'August', 'September', 'October', 'November', 'December']:
-            deficits[month] = 0.0
-            
-        return deficits
+    def duration(self):
+        """Seconds the worker spent on the job, once it has finished"""
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    def progress(self):
+        """JSON-friendly snapshot for the progress endpoint"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'finished': self.finished,
+            'year': self.year,
+            'rows_total': self.rows_total,
+            'rows_done': self.rows_done,
+            'rows_failed': self.rows_failed,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'message': self.message,
+        }
+
+
+class ImportBatch(models.Model):
+    """One uploaded sheet, identified by the SHA-256 of the whole file.
+
+    Uploading a file again for the same user, year and sheet reuses the job
+    of the first upload instead of importing it twice. Editing or deleting
+    members, or queueing another import of the year, makes the year's
+    batches non-reusable, since the members no longer match what the file
+    produced.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='import_batches'
+    )
+    job = models.ForeignKey(
+        ImportJob,
+        on_delete=models.CASCADE,
+        related_name='batches'
+    )
+    # Set when this upload was identical to an earlier one and nothing ran
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates'
+    )
+
+    file_name = models.CharField(max_length=255)
+    year = models.PositiveIntegerField()
+    sheet_name = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64)
+    reusable = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'content_hash', 'year', 'sheet_name'],
+                         name='importbatch_lookup_idx'),
+        ]
+
+    @classmethod
+    def forget(cls, user_id, years):
+        """Stop reusing the user's batches for ``years`` after members change"""
+        cls.objects.filter(user_id=user_id, year__in=set(years), reusable=True).update(reusable=False)
+
+    def result(self):
+        """Counts and timing for this batch's sheet, from its job"""
+        job = self.job
+        if job.sheet_years:
+            for sheet_result in job.sheet_results:
+                if sheet_result['sheet'] == self.sheet_name:
+                    seconds = sheet_result.get('parse_seconds', 0) + sheet_result.get('write_seconds', 0)
+                    return {**sheet_result, 'seconds': round(seconds, 3)}
+            return {}
+        return {
+            'rows': job.rows_done,
+            'created': job.created,
+            'updated': job.updated,
+            'unchanged': job.unchanged,
+            'failed': job.rows_failed,
+            'seconds': job.duration,
+            'error': job.message if job.status == job.FAILED else '',
+        }
+
+
+@lru_cache(maxsize=256)
+def _compile_policy(schedule, target):
+    return CompiledPolicy(json.loads(schedule), target)
+
+
+class ContributionPolicy(models.Model):
+    """When a user's members must pay in a year, and how much.
+
+    Years without a policy use ``DEFAULT_POLICY`` (the annual target spread
+    over January to March). Saving or deleting a policy recomputes the stored
+    totals of that year's members.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='contribution_policies'
+    )
+    year = models.PositiveIntegerField()
+    schedule = models.JSONField(default=dict)  # {month: share of the annual target}
+    # Same target for every member; blank uses each member's annual_target
+    annual_target = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f'{self.user} {self.year}: due {", ".join(self.compile().due_months)}'
+
+    def clean(self):
+        try:
+            self.compile()
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValidationError(str(e))
+
+    def compile(self):
+        """The evaluator for this policy, built once per distinct schedule"""
+        target = None if self.annual_target is None else float(self.annual_target)
+        return _compile_policy(json.dumps(self.schedule, sort_keys=True), target)
+
+    @classmethod
+    def for_year(cls, user_id, year):
+        policy = cls.objects.filter(user_id=user_id, year=year).first()
+        return policy.compile() if policy is not None else DEFAULT_POLICY
+
+    def save(self, *args, **kwargs):
+        self.compile()  # Reject schedules without a due month before saving
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Member.refresh_year_totals(self.user_id, self.year, self.compile())
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Member.refresh_year_totals(self.user_id, self.year, DEFAULT_POLICY)
+        return result
+
+
+class MpesaShortcode(models.Model):
+    """A paybill or till number whose payments belong to one user.
+
+    Payments into the shortcode are only ever matched to that user's
+    members. Shortcodes are added in the admin once the user has shown they
+    own the number, since anyone can sign up.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mpesa_shortcodes'
+    )
+    shortcode = models.CharField(max_length=20, unique=True)  # BusinessShortCode
+
+    def __str__(self):
+        return f'{self.shortcode} ({self.user})'
+
+    @classmethod
+    def owner_id(cls, shortcode):
+        """Id of the user a shortcode belongs to, or None if it isn't registered"""
+        return (cls.objects.filter(shortcode=str(shortcode or '').strip())
+                .values_list('user_id', flat=True).first())
+
+
+class Payment(models.Model):
+    """One M-Pesa payment, as received from a callback or a statement file.
+
+    Receiving a payment only inserts this row; ``payments.apply_pending``
+    later matches it to a member and adds it to the month it was paid in.
+    ``trans_id`` is M-Pesa's receipt number and doubles as the idempotency
+    key, so a callback retried by Safaricom or a payment seen again in a
+    statement is stored once. ``user`` owns the shortcode the payment was
+    made to; payments without one are never matched.
+    """
+    PENDING = 'pending'
+    APPLIED = 'applied'
+    UNMATCHED = 'unmatched'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (APPLIED, 'Applied'),
+        (UNMATCHED, 'Unmatched'),
+    ]
+
+    CALLBACK = 'callback'
+    STATEMENT = 'statement'
+    SOURCE_CHOICES = [
+        (CALLBACK, 'Callback'),
+        (STATEMENT, 'Statement'),
+    ]
+
+    trans_id = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='payments'
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    paid_at = models.DateTimeField()
+    account_reference = models.CharField(max_length=50, blank=True)  # BillRefNumber, the account number
+    phone = models.CharField(max_length=20, blank=True)  # MSISDN
+    payer_name = models.CharField(max_length=100, blank=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default=CALLBACK)
+    raw = models.JSONField(default=dict, blank=True)  # Payload as received
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    member = models.ForeignKey(
+        Member,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='payments'
+    )
+    received_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-paid_at']
+        indexes = [
+            # The applier scans pending payments oldest first
+            models.Index(fields=['status', 'id'], name='payment_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.trans_id} KES {self.amount}'
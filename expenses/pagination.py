@@ -0,0 +1,82 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Dashboard sort options: query value -> (field, descending)
+SORTS = {
+    'name': ('name', False),
+    '-name': ('name', True),
+    'contributed': ('total_contributed', False),
+    '-contributed': ('total_contributed', True),
+    'deficit': ('total_deficit', False),
+    '-deficit': ('total_deficit', True),
+}
+DEFAULT_SORT = 'name'
+
+
+def encode_cursor(member, field):
+    """Opaque cursor pointing at ``member`` in a listing sorted by ``field``"""
+    payload = json.dumps([str(getattr(member, field)), member.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    """Return ``(value, id)`` from ``encode_cursor``, or None if it is invalid.
+
+    ``field`` is the model field sorted on; the value must be one it accepts,
+    so a hand-edited cursor can't reach the query.
+    """
+    try:
+        value, member_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = field.to_python(value)
+        if value is None:
+            return None
+        field.run_validators(value)
+        return value, int(member_id)
+    except (ValueError, TypeError, AttributeError, ValidationError):
+        return None
+
+
+def keyset_page(queryset, sort, page_size, after=None, before=None):
+    """Fetch one page of ``queryset`` by seeking past a cursor.
+
+    Rows are ordered by the sort field with ``id`` as tie-breaker, and the page
+    starts right after the ``after`` cursor (or ends right before ``before``),
+    so the database never has to skip over earlier rows like OFFSET does.
+    Returns ``(rows, next_cursor, previous_cursor)``; cursors are None at the
+    ends of the listing.
+    """
+    field, descending = SORTS.get(sort, SORTS[DEFAULT_SORT])
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    position = decode_cursor(cursor, queryset.model._meta.get_field(field)) if cursor else None
+
+    # Walking backwards flips the order, then the page is reversed again below
+    seek_descending = descending != backwards
+    if position is not None:
+        value, member_id = position
+        lookup = 'lt' if seek_descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{lookup}': value})
+            | Q(**{field: value, f'id__{lookup}': member_id})
+        )
+
+    prefix = '-' if seek_descending else ''
+    rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    if backwards:
+        next_cursor = encode_cursor(rows[-1], field)
+        previous_cursor = encode_cursor(rows[0], field) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1], field) if has_more else None
+        previous_cursor = encode_cursor(rows[0], field) if position is not None else None
+    return rows, next_cursor, previous_cursor
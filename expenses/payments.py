@@ -0,0 +1,299 @@
+import re
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .db import take_write_lock
+from .upserts import bulk_upsert_members
+from .models import ImportBatch, Member, MONTHS, MpesaShortcode, Payment
+
+# Columns of an M-Pesa organisation statement export that are read
+STATEMENT_COLUMNS = {
+    'Receipt No.': 'trans_id',
+    'Completion Time': 'paid_at',
+    'Transaction Status': 'status',
+    'Paid In': 'amount',
+    'Other Party Info': 'other_party',
+    'A/C No.': 'account_reference',
+}
+
+
+def _field_limit(name):
+    return Payment._meta.get_field(name).max_length
+
+
+def _amount(value):
+    """Parse an amount as Payment.amount stores it.
+
+    Raises ValueError for anything that isn't a finite number within the
+    field's max_digits, which would otherwise only fail when saved.
+    """
+    field = Payment._meta.get_field('amount')
+    try:
+        amount = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        raise ValueError(f'invalid amount {value!r}')
+    limit = 10 ** (field.max_digits - field.decimal_places)
+    if amount.is_finite() and abs(amount) < limit:
+        # Rounding to cents can carry 9999999999.999 over the limit
+        amount = amount.quantize(Decimal(1).scaleb(-field.decimal_places))
+        if abs(amount) < limit:
+            return amount
+    raise ValueError(f'invalid amount {value!r}')
+
+
+def phone_key(phone):
+    """Last nine digits of a Kenyan number, so 07.., 2547.. and +2547.. compare equal"""
+    digits = re.sub(r'\D', '', str(phone or ''))
+    return digits[-9:] if len(digits) >= 9 else digits
+
+
+def phone_variants(key):
+    """The ways a number with ``phone_key`` ``key`` may have been typed into a sheet"""
+    return [f'0{key}', f'254{key}', f'+254{key}', key]
+
+
+def _aware(value):
+    """M-Pesa times carry no zone; they are in MPESA_TIME_ZONE"""
+    zone = ZoneInfo(settings.MPESA_TIME_ZONE)
+    return timezone.make_aware(value, zone) if timezone.is_naive(value) else value
+
+
+def callback_payment(payload):
+    """Build an unsaved Payment from a Daraja C2B confirmation payload.
+
+    The payment belongs to the user who owns its BusinessShortCode, if any.
+    Raises ValueError when a required field is missing or malformed.
+    """
+    try:
+        trans_id = str(payload['TransID']).strip()
+        amount = _amount(payload['TransAmount'])
+        paid_at = _aware(datetime.strptime(str(payload['TransTime']), '%Y%m%d%H%M%S'))
+        if not trans_id or len(trans_id) > _field_limit('trans_id'):
+            raise ValueError(f'invalid TransID {trans_id!r}')
+        if amount <= 0:
+            raise ValueError(f'invalid amount {amount}')
+    except (KeyError, ValueError) as e:
+        raise ValueError(f'Invalid payment payload: {e}')
+
+    names = (payload.get('FirstName'), payload.get('MiddleName'), payload.get('LastName'))
+    # The payment has been made, so overlong details are cut rather than
+    # refused; the payload keeps them in full
+    return Payment(
+        trans_id=trans_id,
+        user_id=MpesaShortcode.owner_id(payload.get('BusinessShortCode')),
+        amount=amount,
+        paid_at=paid_at,
+        account_reference=str(payload.get('BillRefNumber') or '').strip()[:_field_limit('account_reference')],
+        phone=str(payload.get('MSISDN') or '').strip()[:_field_limit('phone')],
+        payer_name=' '.join(name for name in names if name)[:_field_limit('payer_name')],
+        source=Payment.CALLBACK,
+        raw=payload,
+    )
+
+
+def record_payments(payments):
+    """Insert payments, skipping receipt numbers already stored.
+
+    This is all a callback does, so bursts of callbacks only append rows and
+    never wait on member rows.
+    """
+    return Payment.objects.bulk_create(payments, ignore_conflicts=True)
+
+
+def read_statement(path, user):
+    """Read an M-Pesa statement export (.csv or .xlsx) into unsaved Payments.
+
+    Only completed, incoming rows are kept; every payment belongs to
+    ``user``, who owns the statement's shortcode. Returns ``(payments, errors)``.
+    """
+    # Only statement imports need pandas; callbacks and the applier don't
+    import pandas as pd
+
+    if str(path).lower().endswith('.csv'):
+        df = pd.read_csv(path, dtype=str)
+    else:
+        df = pd.read_excel(path, dtype=str)
+    df = df.fillna('')
+    df.columns = [str(column).strip() for column in df.columns]
+    missing = [column for column in ('Receipt No.', 'Completion Time', 'Paid In') if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    df = df.rename(columns=STATEMENT_COLUMNS)
+
+    payments = []
+    errors = []
+    for index, row in enumerate(df.to_dict('records'), start=2):
+        if str(row.get('status') or 'Completed').strip() != 'Completed':
+            continue
+        amount = str(row.get('amount') or '').replace(',', '').strip()
+        if not amount:
+            continue  # Outgoing transaction
+        trans_id = str(row['trans_id']).strip()
+        try:
+            amount = _amount(amount)
+            paid_at = _aware(pd.to_datetime(row['paid_at']).to_pydatetime())
+            if not trans_id or len(trans_id) > _field_limit('trans_id'):
+                raise ValueError(f'invalid receipt number {trans_id!r}')
+        except (ValueError, TypeError) as e:
+            errors.append({'row': index, 'errors': [str(e)]})
+            continue
+        if amount <= 0:
+            continue
+
+        # "2547XXXXXXXX - JANE DOE"
+        phone, _, name = str(row.get('other_party') or '').partition(' - ')
+        account_reference = str(row.get('account_reference') or '').strip()
+        payments.append(Payment(
+            trans_id=trans_id,
+            user=user,
+            amount=amount,
+            paid_at=paid_at,
+            account_reference=account_reference[:_field_limit('account_reference')],
+            phone=phone.strip()[:_field_limit('phone')],
+            payer_name=name.strip()[:_field_limit('payer_name')],
+            source=Payment.STATEMENT,
+            raw={key: str(value) for key, value in row.items()},
+        ))
+    return payments, errors
+
+
+def assign_owners():
+    """Give callback payments without a user to the owner of their shortcode.
+
+    For payments received before their shortcode was registered. Returns how
+    many payments were assigned.
+    """
+    assigned = 0
+    for shortcode, user_id in MpesaShortcode.objects.values_list('shortcode', 'user_id'):
+        assigned += Payment.objects.filter(
+            user__isnull=True, source=Payment.CALLBACK, raw__BusinessShortCode=shortcode,
+        ).update(user_id=user_id)
+    return assigned
+
+
+def _paid_month(payment):
+    """``(year, month number)`` a payment counts for, in MPESA_TIME_ZONE"""
+    paid_at = timezone.localtime(payment.paid_at, ZoneInfo(settings.MPESA_TIME_ZONE))
+    return paid_at.year, paid_at.month
+
+
+def match_members(payments):
+    """Map each payment's id to the member it pays for.
+
+    Only members of the payment's user are considered; payments without a
+    user are never matched. A payment matches the member whose account
+    number equals its account reference in the year it was paid. Otherwise
+    it falls back to the phone number, if exactly one of that user's members
+    of that year has it. Two queries cover the whole batch.
+    """
+    matched = {}
+    payments = [payment for payment in payments if payment.user_id is not None]
+    users = {payment.user_id for payment in payments}
+    by_account = defaultdict(list)
+    for payment in payments:
+        by_account[(payment.user_id, payment.account_reference, _paid_month(payment)[0])].append(payment)
+
+    references = {reference for _, reference, _ in by_account if reference}
+    years = {year for _, _, year in by_account}
+    if references:
+        members = (Member.objects.filter(user_id__in=users, account_number__in=references, year__in=years)
+                   .select_related('user'))
+        for member in members:
+            for payment in by_account.get((member.user_id, member.account_number, member.year), []):
+                matched[payment.id] = member
+
+    by_phone = defaultdict(list)
+    for payment in payments:
+        if payment.id not in matched and phone_key(payment.phone):
+            by_phone[(payment.user_id, phone_key(payment.phone), _paid_month(payment)[0])].append(payment)
+    if by_phone:
+        phones = [variant for _, key, _ in by_phone for variant in phone_variants(key)]
+        candidates = defaultdict(list)
+        members = (Member.objects.filter(user_id__in={user_id for user_id, _, _ in by_phone},
+                                         phone__in=phones, year__in={year for _, _, year in by_phone})
+                   .select_related('user'))
+        for member in members:
+            candidates[(member.user_id, phone_key(member.phone), member.year)].append(member)
+        for key, key_payments in by_phone.items():
+            if len(candidates.get(key, [])) == 1:
+                for payment in key_payments:
+                    matched[payment.id] = candidates[key][0]
+    return matched
+
+
+def _claim_pending(batch_size):
+    pending = Payment.objects.filter(status=Payment.PENDING).order_by('id')
+    if connection.features.has_select_for_update_skip_locked:
+        # Several appliers can run side by side without waiting on each other
+        pending = pending.select_for_update(skip_locked=True)
+    return list(pending[:batch_size])
+
+
+def apply_pending(batch_size=None):
+    """Apply one batch of pending payments in a single transaction.
+
+    Each matched payment is added to its member's month, then every member
+    touched in the batch is written with one ``bulk_upsert_members`` call per
+    user and year, instead of one save per payment. The members are locked
+    and read again before the payments are added, so an edit or import that
+    commits meanwhile is never overwritten with older amounts. Returns a dict
+    of ``applied`` and ``unmatched`` counts; both are 0 once nothing is pending.
+    """
+    batch_size = batch_size or settings.PAYMENT_APPLY_BATCH_SIZE
+    with transaction.atomic():
+        take_write_lock(Payment)
+        payments = _claim_pending(batch_size)
+        if not payments:
+            return {'applied': 0, 'unmatched': 0}
+
+        matched = match_members(payments)
+        current = (Member.objects.select_for_update(of=('self',)).select_related('user')
+                   .in_bulk({member.id for member in matched.values()}))
+        # A member deleted since matching leaves its payments unmatched
+        matched = {
+            payment_id: current[member.id]
+            for payment_id, member in matched.items() if member.id in current
+        }
+        members = {}
+        for payment in payments:
+            member = matched.get(payment.id)
+            if member is None:
+                continue
+            members[member.id] = member
+            month = MONTHS[_paid_month(payment)[1] - 1]
+            contributions = member.monthly_contributions
+            contributions[month] = round(float(contributions.get(month, 0) or 0) + float(payment.amount), 2)
+
+        groups = defaultdict(list)
+        for member in members.values():
+            groups[(member.user, member.year)].append({
+                'account_number': member.account_number,
+                'name': member.name,
+                'phone': member.phone,
+                'monthly_contributions': member.monthly_contributions,
+            })
+        for (user, year), rows in groups.items():
+            bulk_upsert_members(user, year, rows)
+            ImportBatch.forget(user.id, [year])
+
+        now = timezone.now()
+        applied = []
+        unmatched = []
+        for payment in payments:
+            if payment.id in matched:
+                payment.status = Payment.APPLIED
+                payment.member = matched[payment.id]
+                payment.applied_at = now
+                applied.append(payment)
+            else:
+                unmatched.append(payment.id)
+        Payment.objects.bulk_update(applied, ['status', 'member', 'applied_at'], batch_size=500)
+        Payment.objects.filter(id__in=unmatched).update(status=Payment.UNMATCHED)
+
+    return {'applied': len(applied), 'unmatched': len(unmatched)}
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+
+from .reports import STATEMENT_TEMPLATE_VERSION, render_statement
+
+
+def statement_key(data):
+    """Content hash of a statement: same member data and layout, same PDF"""
+    payload = json.dumps([STATEMENT_TEMPLATE_VERSION, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def statement_path(key):
+    return os.path.join(settings.PDF_CACHE_DIR, f'{key}.pdf')
+
+
+# Bytes this process has rendered into the cache since it last evicted
+_written_since_eviction = 0
+
+
+def open_statement(data, key):
+    """Return an open file of the cached statement, rendering it on a miss.
+
+    The file's mtime is when it was rendered (used for Last-Modified); its
+    atime is bumped on every hit and drives the LRU eviction.
+    """
+    path = statement_path(key)
+    try:
+        statement = open(path, 'rb')
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            os.utime(path, (time.time(), os.fstat(statement.fileno()).st_mtime))
+        except FileNotFoundError:
+            pass  # Evicted by another process since; the open file still reads
+        return statement
+
+    os.makedirs(settings.PDF_CACHE_DIR, exist_ok=True)
+    # Write under a temporary name so readers never see a half-written PDF
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as output:
+        written = output.write(render_statement(data))
+    os.replace(tmp_path, path)
+    statement = open(path, 'rb')
+
+    # Scanning the directory costs a stat per statement, so it only happens
+    # once this process has written PDF_CACHE_EVICT_BYTES since its last scan
+    global _written_since_eviction
+    _written_since_eviction += written
+    if _written_since_eviction >= settings.PDF_CACHE_EVICT_BYTES:
+        _written_since_eviction = 0
+        evict_statements()
+    return statement
+
+
+def evict_statements(max_bytes=None):
+    """Delete least recently used statements until the cache fits ``max_bytes``"""
+    max_bytes = settings.PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    with os.scandir(settings.PDF_CACHE_DIR) as scan:
+        for entry in scan:
+            if entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except (FileNotFoundError, PermissionError):
+            pass
+        total -= size
@@ -0,0 +1,121 @@
+import numpy as np
+
+MONTHS = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'
+]
+
+# The original rule: the annual target is due in three equal installments
+# from January to March, and any shortfall shows up in March
+DEFAULT_SCHEDULE = {'January': 1, 'February': 1, 'March': 1}
+
+
+class CompiledPolicy:
+    """A contribution schedule turned into arrays, ready to evaluate members.
+
+    ``schedule`` maps due months to their relative share of the annual
+    target. ``target`` overrides each member's own annual target when set.
+    Members are evaluated as an ``(n, 12)`` array of monthly amounts, so a
+    whole year is computed in one pass without a Python loop per member.
+    """
+
+    def __init__(self, schedule, target=None):
+        weights = np.array([float(schedule.get(month, 0) or 0) for month in MONTHS])
+        with np.errstate(over='ignore', invalid='ignore'):
+            total = weights.sum()
+        # An infinite or NaN share (or total) would make every share NaN
+        if not np.isfinite(total) or (weights < 0).any():
+            raise ValueError('Shares must be finite numbers, zero or more')
+        if total <= 0:
+            raise ValueError('A contribution policy needs at least one due month')
+        self.shares = weights / total
+        self.due = self.shares > 0
+        # Any shortfall is reported in the last month something is due
+        self.last_due = int(np.flatnonzero(self.due)[-1])
+        self.target = None if target is None else float(target)
+        if self.target is not None and not np.isfinite(self.target):
+            raise ValueError('The annual target must be a finite amount')
+
+    @property
+    def due_months(self):
+        return [month for month, due in zip(MONTHS, self.due) if due]
+
+    def targets(self, member_targets):
+        """The target each member is held to, as a float array"""
+        member_targets = np.asarray(member_targets, dtype=float)
+        if self.target is None:
+            return member_targets
+        return np.full(member_targets.shape, self.target)
+
+    def totals(self, amounts, member_targets):
+        """Stored aggregates for ``(n, 12)`` amounts.
+
+        Returns ``(total_contributed, due_paid, total_deficit)`` arrays, where
+        ``due_paid`` is what was paid in the due months.
+        """
+        amounts = np.asarray(amounts, dtype=float).reshape(-1, len(MONTHS))
+        due_paid = amounts[:, self.due].sum(axis=1)
+        deficit = np.maximum(self.targets(member_targets) - due_paid, 0.0)
+        return amounts.sum(axis=1), due_paid, deficit
+
+    def evaluate(self, amounts, member_targets):
+        """Per-month ``(expected, deficit)`` arrays of shape ``(n, 12)``"""
+        amounts = np.asarray(amounts, dtype=float).reshape(-1, len(MONTHS))
+        expected = self.targets(member_targets)[:, None] * self.shares
+        _, _, total_deficit = self.totals(amounts, member_targets)
+        deficits = np.zeros_like(amounts)
+        deficits[:, self.last_due] = total_deficit
+        return expected, deficits
+
+    def member_months(self, monthly_contributions, annual_target):
+        """``(expected, deficits)`` dicts keyed by month for a single member"""
+        amounts = [[float(monthly_contributions.get(month, 0) or 0) for month in MONTHS]]
+        expected, deficits = self.evaluate(amounts, [annual_target])
+        return dict(zip(MONTHS, expected[0].tolist())), dict(zip(MONTHS, deficits[0].tolist()))
+
+
+DEFAULT_POLICY = CompiledPolicy(DEFAULT_SCHEDULE)
+
+
+def evaluate_rows(rows, policy):
+    """Fill in a batch of member rows from their monthly contributions.
+
+    ``rows`` are plain dicts with ``monthly_contributions`` and
+    ``annual_target``. The batch is loaded into one ``(n, 12)`` array and
+    evaluated in a single pass; each row gains ``total_contributed``,
+    ``total_deficit`` and per-month ``expected`` and ``deficits`` dicts, and
+    its ``annual_target`` becomes a float. Returns ``rows``.
+    """
+    if not rows:
+        return rows
+    amounts = np.array(
+        [[float(row['monthly_contributions'].get(month, 0) or 0) for month in MONTHS] for row in rows]
+    )
+    targets = [float(row['annual_target']) for row in rows]
+    expected, deficits = policy.evaluate(amounts, targets)
+    contributed = amounts.sum(axis=1)
+    total_deficit = deficits.sum(axis=1)
+    for row, target, row_contributed, row_deficit, row_expected, row_deficits in zip(
+        rows, targets, contributed.tolist(), total_deficit.tolist(), expected.tolist(), deficits.tolist()
+    ):
+        row['annual_target'] = target
+        row['total_contributed'] = row_contributed
+        row['total_deficit'] = row_deficit
+        row['expected'] = dict(zip(MONTHS, row_expected))
+        row['deficits'] = dict(zip(MONTHS, row_deficits))
+    return rows
+
+
+def year_rows(members, policy, fields=(), chunk_size=2000):
+    """Yield evaluated rows for a queryset of members, ``chunk_size`` at a time.
+
+    Only ``fields`` plus the contributions and target are read, as plain
+    values, so no model instance is built per member.
+    """
+    chunk = []
+    for row in members.values(*fields, 'monthly_contributions', 'annual_target').iterator(chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from evaluate_rows(chunk, policy)
+            chunk = []
+    yield from evaluate_rows(chunk, policy)
@@ -0,0 +1,12 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+def process_pool(workers):
+    """A process pool whose workers can use settings and the ORM.
+
+    Each worker runs ``django.setup``, so the pool works whether processes
+    are forked or spawned (the default on macOS and Windows).
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
@@ -0,0 +1,155 @@
+import zipfile
+from collections import deque
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Table, TableStyle
+
+from .metrics import PDF_RENDER_SECONDS
+from .models import ContributionPolicy, MONTHS
+from .policies import evaluate_rows
+from .pools import process_pool
+
+# Bump whenever the statement layout changes, so cached PDFs are rebuilt
+STATEMENT_TEMPLATE_VERSION = 2
+
+# Built once per process and shared by every statement
+STYLES = getSampleStyleSheet()
+CONTRIBUTIONS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOX', (0, 0), (-1, -1), 1, colors.black),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+
+# Member fields a statement shows, besides the figures from evaluate_rows()
+STATEMENT_FIELDS = ('name', 'account_number', 'phone')
+
+
+def statement_data(member, policy=None):
+    """Plain, picklable copy of what a member's statement shows.
+
+    ``policy`` is the year's compiled ``ContributionPolicy``; without it the
+    member's year is looked up. Statements for a whole year are built with
+    ``year_rows(members, policy, STATEMENT_FIELDS)`` instead, which yields
+    the same dicts.
+    """
+    row = {field: getattr(member, field) for field in STATEMENT_FIELDS}
+    row.update(monthly_contributions=member.monthly_contributions, annual_target=member.annual_target)
+    policy = policy or ContributionPolicy.for_year(member.user_id, member.year)
+    return evaluate_rows([row], policy)[0]
+
+
+def statement_elements(data):
+    """ReportLab flowables for one member's statement"""
+    elements = [Paragraph(f"Member Report: {data['name']}", STYLES['Title'])]
+
+    # Member Details
+    details = [
+        ["Account Number:", data['account_number']],
+        ["Phone:", data['phone']],
+        ["Total Contributed:", f"KES {data['total_contributed']:.2f}"],
+        ["Total Deficit:", f"KES {data['total_deficit']:.2f}"]
+    ]
+    elements.append(Table(details, colWidths=[150, 150]))
+
+    contributions = data['monthly_contributions']
+
+    # Build contributions table; expected and deficit come from the year's policy
+    contributions_data = [["Month", "Paid (KES)", "Expected (KES)", "Deficit (KES)"]]
+
+    for month in MONTHS:
+        paid = float(contributions.get(month, 0))
+        expected = data['expected'][month]
+        deficit = data['deficits'][month]
+
+        contributions_data.append([
+            month,
+            f"{paid:.2f}",
+            f"{expected:.2f}",
+            f"{deficit:.2f}" if deficit > 0 else "0.00"
+        ])
+
+    contributions_table = Table(contributions_data)
+    contributions_table.setStyle(CONTRIBUTIONS_TABLE_STYLE)
+    elements.append(contributions_table)
+    return elements
+
+
+def render_statement(data):
+    """Build one member's statement and return the PDF bytes"""
+    with PDF_RENDER_SECONDS.time():
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        doc.build(statement_elements(data))
+    return buffer.getvalue()
+
+
+def render_statements(datas, workers, window=None):
+    """Render statements in a process pool, yielding ``(data, pdf)`` in order.
+
+    At most ``window`` statements are in flight at once, so a year with
+    thousands of members doesn't queue every PDF in memory.
+    """
+    window = window or workers * 4
+    with process_pool(workers) as pool:
+        pending = deque()
+        for data in datas:
+            pending.append((data, pool.submit(render_statement, data)))
+            if len(pending) >= window:
+                data, future = pending.popleft()
+                yield data, future.result()
+        while pending:
+            data, future = pending.popleft()
+            yield data, future.result()
+
+
+class _ChunkBuffer:
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files):
+    """Yield a ZIP archive of ``(filename, bytes)`` pairs piece by piece.
+
+    The buffer has no ``tell``/``seek``, so zipfile writes data descriptors
+    instead of seeking back, and each member leaves memory once yielded.
+    """
+    buffer = _ChunkBuffer()
+    # PDFs are already compressed, so the entries are only stored
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for filename, content in files:
+            archive.writestr(filename, content)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def build_merged_statements(datas, output):
+    """Write every statement into one PDF, a member per page, to ``output``"""
+    elements = []
+    for data in datas:
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(statement_elements(data))
+    if not elements:
+        elements.append(Paragraph("No members", STYLES['Title']))
+    SimpleDocTemplate(output, pagesize=letter).build(elements)
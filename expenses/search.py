@@ -0,0 +1,89 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Collate
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+from .payments import phone_variants
+
+# SQLite full-text index over member names, created by migration 0016 when
+# the SQLite build has FTS5 with the trigram tokenizer
+FTS_TABLE = 'expenses_member_fts'
+
+# Dashboard filters: query value -> condition on the stored totals
+STATUS_FILTERS = {
+    'deficit': Q(total_deficit__gt=0),
+    'paid': Q(total_deficit=0),
+}
+
+
+def fts_available():
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+def prefix(field, value):
+    """``field`` starts with ``value``, as a range the field's index can seek.
+
+    Django's LIKE carries an ESCAPE clause, which keeps SQLite from using an
+    index for it; a ``>= value AND < value + U+10FFFF`` range does not.
+    """
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + '\U0010ffff'})
+
+
+def name_prefix(term):
+    """Case-insensitive name prefix that stays on an index.
+
+    On SQLite this is a NOCASE range, elsewhere ``istartswith``; both are
+    served by ``member_name_prefix_idx`` (``models.NamePrefixIndex``) and
+    fold ASCII case only, like SQLite's LIKE.
+    """
+    if connection.vendor != 'sqlite':
+        return Q(name__istartswith=term)
+    name = Collate('name', 'nocase')
+    return Q(GreaterThanOrEqual(name, term), LessThan(name, term + '\U0010ffff'))
+
+
+def search_condition(term, fuzzy=False):
+    """Condition matching members whose name, account number or phone starts with ``term``.
+
+    Every prefix is a range on one of the ``(user, year, ...)`` indexes, so
+    SQLite and PostgreSQL can answer the OR from the indexes alone. Phone
+    numbers match however they were typed (07.., 2547.., +2547..). With
+    ``fuzzy`` the name may contain ``term`` anywhere, using the FTS5 trigram
+    index where there is one.
+    """
+    term = term.strip()
+    condition = name_prefix(term)
+    for account in {term, term.upper()}:
+        condition |= prefix('account_number', account)
+
+    digits = re.sub(r'\D', '', term)
+    if len(digits) >= 3 and len(digits) >= len(term) - 1:
+        # Strip a leading 0/254 so the typed number can be matched in any format
+        local = re.sub(r'^(?:254|0)', '', digits)
+        for variant in set(phone_variants(local)):
+            condition |= prefix('phone', variant)
+
+    if fuzzy:
+        if len(term) >= 3 and fts_available():
+            # Quoted so the term is matched as a string, not FTS5 query syntax
+            match = '"{}"'.format(term.replace('"', '""'))
+            condition |= Q(id__in=RawSQL(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+            ))
+        else:
+            condition |= Q(name__icontains=term)
+    return condition
+
+
+def filter_members(queryset, term='', status='', min_contributed=None, fuzzy=False):
+    """Apply the dashboard's search box and filters in the database"""
+    if term and term.strip():
+        queryset = queryset.filter(search_condition(term, fuzzy))
+    if status in STATUS_FILTERS:
+        queryset = queryset.filter(STATUS_FILTERS[status])
+    if min_contributed is not None:
+        queryset = queryset.filter(total_contributed__gte=min_contributed)
+    return queryset
@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from rest_framework import serializers
+
+from .models import Contribution, Member, MONTHS
+
+
+# A month's amount, within what the stored totals (max_digits=12, decimal_places=2) hold
+MONTH_AMOUNT = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal(0))
+TOTAL_LIMIT = 10 ** (MONTH_AMOUNT.max_digits - MONTH_AMOUNT.decimal_places)
+
+
+def validate_contributions(value):
+    """Monthly contributions must be ``{month name: non-negative amount}``.
+
+    Amounts must be finite and fit the stored totals, alone and summed.
+    """
+    if not isinstance(value, dict):
+        raise serializers.ValidationError('Expected an object of month: amount.')
+    contributions = {}
+    for month, amount in value.items():
+        if month not in MONTHS:
+            raise serializers.ValidationError(f'Unknown month: {month}')
+        if amount is None or amount == '':
+            amount = 0
+        try:
+            amount = MONTH_AMOUNT.run_validation(amount)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError(f"Invalid amount for {month}: {' '.join(e.detail)}")
+        contributions[month] = float(amount)
+    if sum(contributions.values()) >= TOTAL_LIMIT:
+        raise serializers.ValidationError('The year\'s contributions add up to more than can be stored.')
+    return contributions
+
+
+class FieldSelectionMixin:
+    """Drop the fields not listed in the request's ``?fields=a,b``"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        selected = request.query_params.get('fields') if request is not None else None
+        if selected:
+            wanted = set(selected.split(','))
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class MemberSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    monthly_contributions = serializers.JSONField(required=False)
+
+    class Meta:
+        model = Member
+        fields = [
+            'id', 'account_number', 'name', 'phone', 'year', 'monthly_contributions',
+            'annual_target', 'total_contributed', 'total_deficit', 'created_at',
+        ]
+        read_only_fields = ['total_contributed', 'total_deficit', 'created_at']
+
+    def validate_monthly_contributions(self, value):
+        return validate_contributions(value)
+
+
+class MemberRowSerializer(serializers.Serializer):
+    """One row of a bulk write, shaped like a row of an Excel upload"""
+    account_number = serializers.CharField(max_length=50)
+    name = serializers.CharField(max_length=100)
+    phone = serializers.CharField(max_length=20, allow_blank=True, required=False, default='')
+    year = serializers.IntegerField(min_value=1)
+    monthly_contributions = serializers.JSONField(required=False, default=dict)
+
+    def validate_monthly_contributions(self, value):
+        return validate_contributions(value)
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    year = serializers.IntegerField(required=False)
+    account_numbers = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False, default=list
+    )
+
+    def validate(self, data):
+        if not data['ids'] and not data['account_numbers']:
+            raise serializers.ValidationError('Give ids or account_numbers to delete.')
+        if data['account_numbers'] and 'year' not in data:
+            raise serializers.ValidationError('account_numbers need a year.')
+        return data
+
+
+class ContributionSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Contribution
+        fields = ['id', 'member', 'year', 'month', 'amount']
@@ -1,3 +1,1529 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from expenses.analytics import year_figures
+from expenses.cache import analytics_key, summary_key, years_key
+from expenses.exports import LEDGER_HEADERS
+from expenses.importers import iter_sheet_chunks, normalize_dataframe, open_workbook
+from expenses.jobs import _as_completed_beating, claim_next_job, enqueue_import, fail_stale_jobs, run_import_job
+from expenses.management.commands.generate_synthetic_data import synthetic_members, write_workbook
+from expenses.metrics import record_import, render as render_metrics
+from expenses.models import Contribution, ContributionPolicy, ImportBatch, ImportJob, Member, MONTHS, MpesaShortcode, Payment
+from expenses.pagination import SORTS, encode_cursor, keyset_page
+from expenses.payments import apply_pending, assign_owners, read_statement
+from expenses.policies import DEFAULT_POLICY, CompiledPolicy, evaluate_rows, year_rows
+from expenses.search import filter_members, fts_available
+from expenses.upserts import bulk_upsert_members
+
+
+def member_row(account_number, name='Member', amount=500, **extra):
+    """A row for ``bulk_upsert_members`` paying ``amount`` every month"""
+    return {
+        'account_number': account_number,
+        'name': name,
+        'phone': '0700000000',
+        'monthly_contributions': {month: amount for month in MONTHS},
+        **extra,
+    }
+
+
+# Pages are requested over plain HTTP, and nothing is written outside the test database
+web_settings = override_settings(
+    SECURE_SSL_REDIRECT=False,
+    METRICS_ENABLED=False,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+
+
+class BulkUpsertMembersTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+
+    def test_creates_then_updates(self):
+        self.assertEqual(bulk_upsert_members(self.user, 2024, [member_row('A1'), member_row('A2')]), (2, 0, 0))
+        self.assertEqual(
+            bulk_upsert_members(self.user, 2024, [member_row('A1', name='Renamed', amount=1000)]),
+            (0, 1, 0),
+        )
+
+        member = Member.objects.get(user=self.user, year=2024, account_number='A1')
+        self.assertEqual(member.name, 'Renamed')
+        self.assertEqual(member.total_contributed, Decimal('12000.00'))
+        self.assertEqual(Contribution.objects.filter(member=member).count(), len(MONTHS))
+        self.assertEqual(Member.objects.filter(user=self.user, year=2024).count(), 2)
+
+    def test_duplicate_rows_keep_the_last(self):
+        result = bulk_upsert_members(self.user, 2024, [
+            member_row('A1', name='First', amount=100),
+            member_row('A1', name='Second', amount=200),
+        ])
+
+        self.assertEqual(result, (1, 0, 0))
+        member = Member.objects.get(account_number='A1', year=2024)
+        self.assertEqual(member.name, 'Second')
+        self.assertEqual(member.total_contributed, Decimal('2400.00'))
+
+    def test_update_keeps_annual_target(self):
+        bulk_upsert_members(self.user, 2024, [member_row('A1')])
+        Member.objects.filter(account_number='A1').update(annual_target=Decimal('12000.00'))
+
+        bulk_upsert_members(self.user, 2024, [member_row('A1', amount=800)])
+
+        member = Member.objects.get(account_number='A1', year=2024)
+        self.assertEqual(member.annual_target, Decimal('12000.00'))
+        deficit = member.total_deficit
+        member.refresh_totals()
+        self.assertEqual(deficit, member.total_deficit)
+
+    def test_matching_fingerprint_is_left_alone(self):
+        bulk_upsert_members(self.user, 2024, [member_row('A1', fingerprint='abc')])
+
+        result = bulk_upsert_members(self.user, 2024, [member_row('A1', name='Ignored', fingerprint='abc')])
+
+        self.assertEqual(result, (0, 0, 1))
+        self.assertEqual(Member.objects.get(account_number='A1').name, 'Member')
+
+    def test_other_users_account_is_not_overwritten(self):
+        other = User.objects.create(username='other')
+        bulk_upsert_members(other, 2024, [member_row('A1', name='Theirs')])
+
+        with self.assertRaises(IntegrityError):
+            bulk_upsert_members(self.user, 2024, [member_row('A1', name='Mine')])
+
+        member = Member.objects.get(account_number='A1', year=2024)
+        self.assertEqual((member.user, member.name), (other, 'Theirs'))
+        self.assertFalse(Member.objects.filter(user=self.user).exists())
+
+    def test_same_account_in_another_year_is_a_new_member(self):
+        bulk_upsert_members(self.user, 2023, [member_row('A1')])
+
+        self.assertEqual(bulk_upsert_members(self.user, 2024, [member_row('A1')]), (1, 0, 0))
+
+
+class MemberTotalsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+
+    def member(self, **contributions):
+        return Member(user=self.user, name='Amina', phone='0711', account_number='A1', year=2024,
+                      annual_target=Decimal('6000'), monthly_contributions=contributions)
+
+    def stored(self, member):
+        member = Member.objects.get(pk=member.pk)
+        return member.total_contributed, member.q1_paid, member.total_deficit
+
+    def test_save_stores_the_totals(self):
+        member = self.member(January=1000, February='500.25', May=2000)
+        member.save()
+
+        # Only January-March count towards the default target
+        self.assertEqual(self.stored(member), (Decimal('3500.25'), Decimal('1500.25'), Decimal('4499.75')))
+
+    def test_update_fields_still_refresh_the_totals(self):
+        member = self.member(January=1000)
+        member.save()
+
+        member.monthly_contributions = {'January': 2000, 'March': 4000}
+        member.save(update_fields=['monthly_contributions'])
+
+        self.assertEqual(self.stored(member), (Decimal('6000.00'), Decimal('6000.00'), Decimal('0.00')))
+
+    def test_year_policy_applies(self):
+        ContributionPolicy.objects.create(user=self.user, year=2024, schedule={'May': 1})
+        member = self.member(January=1000, May=2000)
+        member.save()
+
+        self.assertEqual(self.stored(member), (Decimal('3000.00'), Decimal('2000.00'), Decimal('4000.00')))
+
+
+class ContributionRowsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+
+    def months(self, account_number='A1'):
+        return dict(Contribution.objects.filter(member__account_number=account_number)
+                    .order_by('month').values_list('month', 'amount'))
+
+    def test_rows_follow_the_json(self):
+        bulk_upsert_members(self.user, 2024, [
+            member_row('A1', monthly_contributions={'January': 100, 'March': '250.75', 'May': 0}),
+        ])
+        self.assertEqual(self.months(), {1: Decimal('100.00'), 3: Decimal('250.75')})
+
+        bulk_upsert_members(self.user, 2024, [member_row('A1', monthly_contributions={'December': 5})])
+        self.assertEqual(self.months(), {12: Decimal('5.00')})
+
+        member = Member.objects.get(account_number='A1')
+        member.monthly_contributions = {'February': 20}
+        member.save(update_fields=['monthly_contributions'])
+        self.assertEqual(self.months(), {2: Decimal('20.00')})
+
+        member.name = 'Renamed'
+        member.save(update_fields=['name'])
+        self.assertEqual(self.months(), {2: Decimal('20.00')})
+
+        member.delete()
+        self.assertFalse(Contribution.objects.exists())
+
+    def test_other_members_untouched(self):
+        bulk_upsert_members(self.user, 2024, [member_row('A1', amount=10), member_row('A2', amount=20)])
+
+        bulk_upsert_members(self.user, 2024, [member_row('A1', amount=30)])
+
+        self.assertEqual(set(self.months('A2').values()), {Decimal('20.00')})
+        self.assertEqual(len(self.months('A2')), len(MONTHS))
+
+
+class NormalizeDataframeTests(SimpleTestCase):
+
+    def test_blank_and_nan_amounts_become_zero(self):
+        frame, errors = normalize_dataframe(pd.DataFrame({
+            'Name': ['Amina', 'Brian', 'Chao'],
+            'Account Number': ['A1', 'A2', 'A3'],
+            'January': [np.nan, 500.0, 250.0],
+            'February': ['', '  ', None],
+        }))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(frame['January'].tolist(), [0.0, 500.0, 250.0])
+        self.assertEqual(frame['February'].tolist(), [0.0, 0.0, 0.0])
+        self.assertEqual(frame['December'].tolist(), [0.0, 0.0, 0.0])
+
+    def test_invalid_amount_drops_the_row(self):
+        frame, errors = normalize_dataframe(pd.DataFrame({
+            'Name': ['Amina', 'Brian'],
+            'Account Number': ['A1', 'A2'],
+            'March': ['100', 'abc'],
+        }))
+
+        self.assertEqual(frame['account_number'].tolist(), ['A1'])
+        self.assertEqual(frame['March'].tolist(), [100.0])
+        self.assertEqual(errors, [{'row': 3, 'errors': ['Invalid amount for March']}])
+
+    def test_numeric_account_numbers_and_phones(self):
+        # A blank cell makes pandas read the whole column as floats
+        frame, errors = normalize_dataframe(pd.DataFrame({
+            'Name': [' Amina ', 'Brian', 'Chao'],
+            'Account Number': [1001.0, 1002.0, np.nan],
+            'Phone': [712345678, 798765432, 711111111],
+        }))
+
+        self.assertEqual(frame['account_number'].tolist(), ['1001', '1002'])
+        self.assertEqual(frame['name'].tolist(), ['Amina', 'Brian'])
+        self.assertEqual(frame['phone'].tolist(), ['712345678', '798765432'])
+        self.assertEqual(errors, [{'row': 4, 'errors': ['Missing account number']}])
+
+    def test_phone_spaces_removed(self):
+        frame, _ = normalize_dataframe(pd.DataFrame({
+            'Name': ['Amina'], 'Account Number': ['A1'], 'Phone': [' 0712 345 678 '],
+        }))
+
+        self.assertEqual(frame['phone'].tolist(), ['0712345678'])
+
+    def test_error_report_lists_every_problem_of_a_row(self):
+        _, errors = normalize_dataframe(pd.DataFrame({
+            'Name': ['', 'Brian'],
+            'Account Number': ['', 'A2'],
+            'April': ['x', 10],
+        }))
+
+        self.assertEqual(errors, [{
+            'row': 2,
+            'errors': ['Missing name', 'Missing account number', 'Invalid amount for April'],
+        }])
+
+    def test_row_numbers_follow_the_sheet(self):
+        sheet = openpyxl.Workbook()
+        rows = sheet.active
+        rows.append(['Name', 'Account Number', 'January'])
+        rows.append(['Amina', 'A1', 100])
+        rows.append([None, None, None])
+        rows.append(['Brian', 'A2', 100])
+        rows.append(['', 'A3', 100])
+        source = BytesIO()
+        sheet.save(source)
+        source.seek(0)
+        workbook = open_workbook(source)
+        self.addCleanup(workbook.close)
+
+        errors = []
+        for chunk in iter_sheet_chunks(workbook.worksheets[0], chunk_size=2):
+            errors.extend(normalize_dataframe(chunk)[1])
+
+        self.assertEqual(errors, [{'row': 5, 'errors': ['Missing name']}])
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            normalize_dataframe(pd.DataFrame({'Name': ['Amina'], 'Phone': ['0712']}))
+
+    def test_header_whitespace_ignored(self):
+        frame, errors = normalize_dataframe(pd.DataFrame({' Name ': ['Amina'], 'Account Number ': ['A1']}))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(frame['account_number'].tolist(), ['A1'])
+
+
+
+class KeysetPageTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+        # Few distinct names and amounts, so pages split runs of equal values
+        bulk_upsert_members(self.user, 2024, [
+            member_row(f'A{i:02}', name=f'Member {i % 4}', amount=100 * (i % 3)) for i in range(23)
+        ])
+        self.members = Member.objects.filter(user=self.user, year=2024)
+
+    def walk(self, sort, page_size=5):
+        """Ids page by page to the end, then back to the start"""
+        forward, after = [], None
+        while True:
+            rows, after, before = keyset_page(self.members, sort, page_size, after=after)
+            forward.append([member.id for member in rows])
+            if after is None:
+                break
+        backward = [forward[-1]]
+        while before is not None:
+            rows, _, before = keyset_page(self.members, sort, page_size, before=before)
+            backward.insert(0, [member.id for member in rows])
+        return forward, backward
+
+    def test_pages_cover_every_sort_in_order(self):
+        for sort, (field, descending) in SORTS.items():
+            with self.subTest(sort=sort):
+                forward, backward = self.walk(sort)
+                prefix = '-' if descending else ''
+                expected = list(self.members.order_by(f'{prefix}{field}', f'{prefix}id').values_list('id', flat=True))
+                self.assertEqual([member_id for page in forward for member_id in page], expected)
+                self.assertEqual([len(page) for page in forward], [5, 5, 5, 5, 3])
+                self.assertEqual(backward, forward)
+
+    def test_first_page_has_no_previous(self):
+        rows, after, before = keyset_page(self.members, 'name', 50)
+        self.assertEqual((len(rows), after, before), (23, None, None))
+
+    def test_invalid_cursors_start_over(self):
+        first, _, _ = keyset_page(self.members, '-contributed', 5)
+        forged = base64.urlsafe_b64encode(json.dumps(['NaN', 1]).encode()).decode()
+        for cursor in ('not a cursor', forged, encode_cursor(first[0], 'name')):
+            with self.subTest(cursor=cursor):
+                rows, _, before = keyset_page(self.members, '-contributed', 5, after=cursor)
+                self.assertEqual((rows, before), (first, None))
+
+    @web_settings
+    def test_dashboard_links_to_the_next_page(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get('/', {'year': 2024, 'sort': '-deficit', 'page_size': 10})
+
+        self.assertEqual(len(response.context['members']), 10)
+        next_url = response.context['next_url']
+        self.assertIn('sort=-deficit', next_url)
+        response = self.client.get('/' + next_url)
+        self.assertEqual(len(response.context['members']), 10)
+        self.assertIsNotNone(response.context['previous_url'])
+
+
+@web_settings
+class ExportYearTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+        self.client.force_login(self.user)
+        bulk_upsert_members(self.user, 2024, [
+            member_row('A1', name='Amina, "Mama" Njeri', amount=250.5),
+            member_row('A2', name='Baraka', monthly_contributions={'March': 1000}),
+        ])
+        other = User.objects.create(username='other')
+        bulk_upsert_members(other, 2024, [member_row('B1', name='Not mine')])
+
+    def test_csv(self):
+        response = self.client.get('/export/2024/')
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="contributions_2024.csv"')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], LEDGER_HEADERS)
+        self.assertEqual([row[:3] for row in rows[1:]],
+                         [['Amina, "Mama" Njeri', 'A1', '0700000000'], ['Baraka', 'A2', '0700000000']])
+        self.assertEqual(rows[1][3:15], ['250.5'] * 12)
+        self.assertEqual(float(rows[2][-2]), 1000)
+
+    def test_xlsx_imports_back_unchanged(self):
+        response = self.client.get('/export/2024/', {'format': 'xlsx'})
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        path = os.path.join(scratch.name, 'export.xlsx')
+        with open(path, 'wb') as output:
+            output.writelines(response.streaming_content)
+
+        # Into another year, then compared member by member
+        enqueue_import(self.user, path, 'export.xlsx', 2025)
+        job = run_import_job(claim_next_job())
+
+        self.assertEqual((job.status, job.created, job.rows_failed), (ImportJob.DONE, 2, 0), job.message)
+        exported, imported = (
+            [
+                (member.account_number, member.name, member.phone, member.total_contributed,
+                 member.total_deficit, [float(member.monthly_contributions.get(month, 0)) for month in MONTHS])
+                for member in Member.objects.filter(user=self.user, year=year).order_by('account_number')
+            ]
+            for year in (2024, 2025)
+        )
+        self.assertEqual(imported, exported)
+
+
+@web_settings
+class DashboardCacheTests(TestCase):
+
+    def setUp(self):
+        # Ids repeat across tests, so keys cached by an earlier test could match
+        cache.clear()
+        self.user = User.objects.create(username='treasurer')
+        self.client.force_login(self.user)
+        bulk_upsert_members(self.user, 2024, [member_row('A1'), member_row('A2', amount=100)])
+
+    def summary(self):
+        return self.client.get('/', {'year': 2024}).context['summary']
+
+    def test_summary_is_cached_until_a_write(self):
+        first = self.summary()
+        self.assertEqual((first['count'], first['contributed']), (2, Decimal('7200.00')))
+
+        # Not through the model, so nothing is invalidated
+        Member.objects.update(total_contributed=0)
+        self.assertEqual(self.summary(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_upsert_members(self.user, 2024, [member_row('A3')])
+        self.assertEqual(self.summary()['count'], 3)
+
+    def test_writes_clear_their_years(self):
+        writes = {
+            'save': lambda: Member.objects.get(account_number='A1').save(),
+            'upsert': lambda: bulk_upsert_members(self.user, 2024, [member_row('A9')]),
+            'policy': lambda: ContributionPolicy.objects.create(user=self.user, year=2024, schedule={'May': 1}),
+            'delete': lambda: Member.objects.get(account_number='A1').delete(),
+            'delete all': lambda: self.client.post('/delete-all/', {'year': 2024}),
+        }
+        cleared = [years_key(self.user.id), summary_key(self.user.id, 2024), analytics_key(self.user.id, 2024)]
+        for write, run in writes.items():
+            with self.subTest(write=write):
+                cache.set_many({key: 'cached' for key in cleared + [summary_key(self.user.id, 2023)]})
+                with self.captureOnCommitCallbacks(execute=True):
+                    run()
+                self.assertEqual(cache.get_many(cleared), {})
+                self.assertEqual(cache.get(summary_key(self.user.id, 2023)), 'cached')
+
+    def test_cleared_once_the_write_commits(self):
+        self.summary()
+        key = summary_key(self.user.id, 2024)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Member.objects.get(account_number='A1').save()
+            self.assertIsNotNone(cache.get(key))
+        for callback in callbacks:
+            callback()
+
+        self.assertIsNone(cache.get(key))
+
+
+@web_settings
+@override_settings(MPESA_CALLBACK_TOKEN='secret', MPESA_TIME_ZONE='Africa/Nairobi')
+class MpesaPaymentTests(TestCase):
+    url = '/payments/mpesa/confirmation/?token=secret'
+
+    def setUp(self):
+        self.user = User.objects.create(username='chama')
+        self.other = User.objects.create(username='other-chama')
+        MpesaShortcode.objects.create(user=self.user, shortcode='111111')
+        MpesaShortcode.objects.create(user=self.other, shortcode='222222')
+        bulk_upsert_members(self.user, 2024, [member_row('A1', amount=0, phone='0711000001')])
+        bulk_upsert_members(self.other, 2024, [
+            member_row('B1', amount=0, phone='0722000002'),
+            member_row('B2', amount=0, phone='0711000001'),
+        ])
+        self.sequence = 0
+
+    def payload(self, shortcode='111111', account='A1', phone='254711000001', **fields):
+        self.sequence += 1
+        return {
+            'TransID': f'TX{self.sequence:08d}',
+            'TransTime': '20240315120000',
+            'TransAmount': '500.00',
+            'BusinessShortCode': shortcode,
+            'BillRefNumber': account,
+            'MSISDN': phone,
+            'FirstName': 'Jane',
+            **fields,
+        }
+
+    def post(self, payload, url=None):
+        return self.client.post(url or self.url, json.dumps(payload), content_type='application/json')
+
+    def paid(self, account_number):
+        return Member.objects.get(account_number=account_number, year=2024).monthly_contributions['March']
+
+    def test_requires_token(self):
+        self.assertEqual(self.post(self.payload(), url='/payments/mpesa/confirmation/').status_code, 403)
+        self.assertEqual(self.post(self.payload(), url='/payments/mpesa/confirmation/?token=x').status_code, 403)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_retried_callback_is_stored_once(self):
+        payload = self.payload()
+        for _ in range(2):
+            response = self.post(payload)
+            self.assertEqual(response.json()['ResultCode'], 0)
+
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(apply_pending(), {'applied': 1, 'unmatched': 0})
+        self.assertEqual(self.paid('A1'), 500.0)
+
+    def test_malformed_payloads_are_rejected(self):
+        payloads = [
+            self.payload(TransAmount='NaN'),
+            self.payload(TransAmount='Infinity'),
+            self.payload(TransAmount='1e15'),
+            self.payload(TransAmount='-5'),
+            self.payload(TransAmount='abc'),
+            self.payload(TransID='X' * 33),
+            self.payload(TransTime='yesterday'),
+            {'TransAmount': '500'},
+        ]
+        for payload in payloads:
+            response = self.post(payload)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['ResultCode'], 'C2B00016')
+        self.assertFalse(Payment.objects.exists())
+
+    def test_overlong_details_are_cut(self):
+        self.post(self.payload(BillRefNumber='R' * 80, FirstName='N' * 150))
+
+        payment = Payment.objects.get()
+        self.assertEqual(len(payment.account_reference), 50)
+        self.assertEqual(len(payment.payer_name), 100)
+        self.assertEqual(payment.raw['BillRefNumber'], 'R' * 80)
+
+    def test_statement_rows_with_bad_amounts_are_reported(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as statement:
+            statement.write(
+                'Receipt No.,Completion Time,Transaction Status,Paid In,Other Party Info,A/C No.\n'
+                'RA1,2024-03-15 12:00:00,Completed,"1,000.00",254711000001 - JANE,A1\n'
+                'RA2,2024-03-15 12:00:00,Completed,inf,254711000001 - JANE,A1\n'
+                'RA3,2024-03-15 12:00:00,Completed,1e15,254711000001 - JANE,A1\n'
+            )
+        self.addCleanup(os.remove, statement.name)
+
+        payments, errors = read_statement(statement.name, self.user)
+
+        self.assertEqual([(payment.trans_id, payment.amount) for payment in payments], [('RA1', Decimal('1000.00'))])
+        self.assertEqual([error['row'] for error in errors], [3, 4])
+
+    def test_payment_belongs_to_the_shortcode_owner(self):
+        self.post(self.payload(shortcode='111111'))
+
+        self.assertEqual(Payment.objects.get().user, self.user)
+
+    def test_account_of_another_user_is_not_matched(self):
+        # B1 belongs to the other user, but was paid into this user's shortcode
+        self.post(self.payload(shortcode='111111', account='B1', phone='254799999999'))
+
+        self.assertEqual(apply_pending(), {'applied': 0, 'unmatched': 1})
+        self.assertEqual(self.paid('B1'), 0)
+
+    def test_phone_fallback_stays_within_the_user(self):
+        # Both users have a member with this phone; only this user's counts
+        self.post(self.payload(shortcode='111111', account='UNKNOWN', phone='254711000001'))
+
+        self.assertEqual(apply_pending(), {'applied': 1, 'unmatched': 0})
+        self.assertEqual(self.paid('A1'), 500.0)
+        self.assertEqual(self.paid('B2'), 0)
+        self.assertEqual(Payment.objects.get().member.account_number, 'A1')
+
+    def test_unregistered_shortcode_waits_for_its_owner(self):
+        self.post(self.payload(shortcode='333333'))
+        self.assertEqual(apply_pending(), {'applied': 0, 'unmatched': 1})
+
+        MpesaShortcode.objects.create(user=self.user, shortcode='333333')
+        self.assertEqual(assign_owners(), 1)
+        Payment.objects.update(status=Payment.PENDING)
+
+        self.assertEqual(apply_pending(), {'applied': 1, 'unmatched': 0})
+        self.assertEqual(self.paid('A1'), 500.0)
+
+    def test_payments_add_up_and_update_totals(self):
+        for amount in ('500', '250.50'):
+            self.post(self.payload(TransAmount=amount))
+
+        apply_pending()
+
+        member = Member.objects.get(account_number='A1', year=2024)
+        self.assertEqual(member.monthly_contributions['March'], 750.5)
+        self.assertEqual(member.total_contributed, Decimal('750.50'))
+
+
+
+class CompiledPolicyTests(SimpleTestCase):
+
+    def test_default_spreads_the_target_over_the_first_quarter(self):
+        expected, deficits = DEFAULT_POLICY.member_months({'January': 2000, 'April': 500}, 6000)
+
+        self.assertEqual(DEFAULT_POLICY.due_months, ['January', 'February', 'March'])
+        self.assertEqual([expected[month] for month in ('January', 'March', 'April')], [2000, 2000, 0])
+        # The shortfall shows in the last due month; April doesn't count
+        self.assertEqual(deficits['March'], 4000)
+        self.assertEqual(sum(deficits.values()), 4000)
+
+    def test_shares_and_fixed_target(self):
+        policy = CompiledPolicy({'June': 1, 'December': 3}, target=1000)
+        contributed, due_paid, deficit = policy.totals([[100] * 12, [0] * 5 + [250] + [0] * 5 + [750]], [50, 99999])
+
+        self.assertEqual(policy.due_months, ['June', 'December'])
+        self.assertEqual(contributed.tolist(), [1200, 1000])
+        self.assertEqual(due_paid.tolist(), [200, 1000])
+        self.assertEqual(deficit.tolist(), [800, 0])
+        expected, _ = policy.evaluate([[0] * 12], [1])
+        self.assertEqual(expected[0][MONTHS.index('December')], 750)
+
+    def test_invalid_schedules(self):
+        for schedule in ({}, {'January': 0}, {'January': float('inf')}, {'January': float('nan')},
+                         {'January': 1, 'February': -1}, {'January': 1e308, 'February': 1e308}):
+            with self.subTest(schedule=schedule), self.assertRaises(ValueError):
+                CompiledPolicy(schedule)
+        with self.assertRaises(ValueError):
+            CompiledPolicy({'January': 1}, target=float('inf'))
+
+
+class EvaluateRowsTests(TestCase):
+
+    def test_batch_matches_one_member_at_a_time(self):
+        rng = np.random.default_rng(0)
+        amounts = (rng.integers(0, 3, (20, 12)) * 500).tolist()
+        targets = (rng.integers(0, 10, 20) * 1000).tolist()
+        rows = [
+            {'monthly_contributions': {month: amount for month, amount in zip(MONTHS, paid) if amount},
+             'annual_target': Decimal(target)}
+            for paid, target in zip(amounts, targets)
+        ]
+        for policy in (DEFAULT_POLICY, CompiledPolicy({'June': 1, 'December': 3}, target=4000)):
+            with self.subTest(due=policy.due_months):
+                evaluated = evaluate_rows([dict(row) for row in rows], policy)
+                for row, result in zip(rows, evaluated):
+                    expected, deficits = policy.member_months(row['monthly_contributions'], row['annual_target'])
+                    self.assertEqual((result['expected'], result['deficits']), (expected, deficits))
+                    self.assertEqual(result['total_contributed'], sum(row['monthly_contributions'].values()))
+                    self.assertEqual(result['total_deficit'], sum(deficits.values()))
+
+    def test_empty_batch(self):
+        self.assertEqual(evaluate_rows([], DEFAULT_POLICY), [])
+
+    def test_year_rows_match_the_stored_totals(self):
+        user = User.objects.create(username='treasurer')
+        members = synthetic_members(7, 2024)
+        bulk_upsert_members(user, 2024, members)
+        queryset = Member.objects.filter(user=user, year=2024).order_by('id')
+
+        rows = list(year_rows(queryset, DEFAULT_POLICY, ['account_number'], chunk_size=3))
+
+        self.assertEqual(
+            [(row['account_number'], round(row['total_contributed'], 2), round(row['total_deficit'], 2))
+             for row in rows],
+            [(member.account_number, float(member.total_contributed), float(member.total_deficit))
+             for member in queryset],
+        )
+
+
+@web_settings
+class EditPolicyTests(TestCase):
+    url = '/policy/2024/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='chama')
+        self.client.force_login(self.user)
+        bulk_upsert_members(self.user, 2024, [member_row('A1', amount=0)])
+
+    def post(self, **data):
+        return self.client.post(self.url, {month: '' for month in MONTHS} | data)
+
+    def test_saves_and_recomputes_totals(self):
+        response = self.post(June='1', December='1', annual_target='1000')
+
+        self.assertRedirects(response, '/?year=2024', fetch_redirect_response=False)
+        policy = ContributionPolicy.objects.get(user=self.user, year=2024)
+        self.assertEqual(policy.schedule, {'June': 1.0, 'December': 1.0})
+        self.assertEqual(policy.annual_target, Decimal('1000.00'))
+        self.assertEqual(Member.objects.get(account_number='A1').total_deficit, Decimal('1000.00'))
+
+    def test_invalid_input_is_shown_not_saved(self):
+        cases = [
+            {'January': '1e400'},
+            {'January': 'inf'},
+            {'January': 'nan'},
+            {'January': '-1'},
+            {'January': 'abc'},
+            {'January': '1', 'annual_target': '1e20'},
+            {'January': '1', 'annual_target': 'inf'},
+            {'January': '1', 'annual_target': 'NaN'},
+            {'January': '1', 'annual_target': '100.555'},
+            {},
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                response = self.post(**data)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'text-red-700')
+        self.assertFalse(ContributionPolicy.objects.exists())
+
+    def test_reset_goes_back_to_the_default(self):
+        self.post(June='1')
+        self.client.post(self.url, {'reset': ''})
+
+        self.assertFalse(ContributionPolicy.objects.exists())
+        self.assertEqual(Member.objects.get(account_number='A1').total_deficit, Decimal('6000.00'))
+
+
+
+@web_settings
+class MemberApiTests(TestCase):
+    url = '/api/members/bulk/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='chama')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, *rows):
+        return self.client.post(self.url, {'members': list(rows)}, format='json')
+
+    def row(self, account_number='A1', **contributions):
+        return {'account_number': account_number, 'name': 'Amina', 'phone': '0711', 'year': 2024,
+                'monthly_contributions': contributions}
+
+    def test_bulk_creates_then_updates(self):
+        response = self.bulk(self.row('A1', January=500), self.row('A2', January='250.50', May=None))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'created': 2, 'updated': 0, 'unchanged': 0})
+
+        response = self.bulk(self.row('A1', January=700))
+        self.assertEqual(response.json(), {'created': 0, 'updated': 1, 'unchanged': 0})
+        member = Member.objects.get(account_number='A1')
+        self.assertEqual(member.monthly_contributions, {'January': 700.0})
+        self.assertEqual(member.total_contributed, Decimal('700.00'))
+
+    def test_invalid_amounts_are_refused(self):
+        for amount in ('nan', 'NaN', 'inf', '-Infinity', 1e15, '1e15', -1, 'abc', '1.005'):
+            with self.subTest(amount=amount):
+                response = self.bulk(self.row('A1', January=amount))
+                self.assertEqual(response.status_code, 400)
+        # Each month fits, but not the year's total
+        response = self.bulk(self.row('A1', **{month: '9999999999' for month in MONTHS}))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Member.objects.exists())
+
+    def test_invalid_rows_are_refused(self):
+        for rows in ([], [{'name': 'No account', 'year': 2024}], [self.row(Smarch=1)], [self.row() | {'year': 0}]):
+            with self.subTest(rows=rows):
+                self.assertEqual(self.client.post(self.url, {'members': rows}, format='json').status_code, 400)
+        with override_settings(API_BULK_MAX_ROWS=2):
+            self.assertEqual(self.bulk(self.row('A1'), self.row('A2'), self.row('A3')).status_code, 400)
+        self.assertFalse(Member.objects.exists())
+
+    def test_account_of_another_user_is_refused(self):
+        bulk_upsert_members(User.objects.create(username='other'), 2024, [member_row('A1')])
+
+        response = self.bulk(self.row('A2'), self.row('A1'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Member.objects.filter(user=self.user).exists())
+
+    def test_patch_validates_contributions(self):
+        member = Member.objects.create(user=self.user, account_number='A1', name='Amina', year=2024)
+
+        response = self.client.patch(f'/api/members/{member.id}/', {'monthly_contributions': {'March': 'inf'}},
+                                     format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_moving_a_member_refreshes_both_years(self):
+        member = Member.objects.create(user=self.user, account_number='A1', name='Amina', year=2023,
+                                       monthly_contributions={'March': 100})
+        member = Member.objects.get(id=member.id)
+        keys = [summary_key(self.user.id, 2023), summary_key(self.user.id, 2024),
+                analytics_key(self.user.id, 2023), analytics_key(self.user.id, 2024)]
+        cache.set_many({key: 'stale' for key in keys})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/members/{member.id}/', {'year': 2024}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get_many(keys), {})
+        self.assertEqual(list(Contribution.objects.filter(member=member).values_list('year', flat=True)), [2024])
+
+    def test_bulk_delete(self):
+        self.bulk(self.row('A1'), self.row('A2'), self.row('A3'))
+
+        response = self.client.delete(self.url, {'year': 2024, 'account_numbers': ['A1', 'A2']}, format='json')
+
+        self.assertEqual(response.json(), {'deleted': 2})
+        self.assertEqual(list(Member.objects.values_list('account_number', flat=True)), ['A3'])
+        self.assertEqual(self.client.delete(self.url, {}, format='json').status_code, 400)
+
+    def test_only_own_members_are_listed(self):
+        bulk_upsert_members(User.objects.create(username='other'), 2024, [member_row('B1')])
+        self.bulk(self.row('A1'))
+
+        response = self.client.get('/api/members/', {'year': 2024, 'fields': 'account_number,name'})
+
+        self.assertEqual(response.json()['results'], [{'account_number': 'A1', 'name': 'Amina'}])
+
+
+
+@web_settings
+class StatementPdfTests(TestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        pdf_settings = override_settings(PDF_CACHE_DIR=scratch.name)
+        pdf_settings.enable()
+        self.addCleanup(pdf_settings.disable)
+        self.user = User.objects.create(username='chama')
+        self.client.force_login(self.user)
+        bulk_upsert_members(self.user, 2024, [member_row('A1')])
+        self.member = Member.objects.get(account_number='A1')
+        self.url = f'/report-pdf/{self.member.id}/'
+
+    def test_statement_is_cached_by_content(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(first.streaming_content).startswith(b'%PDF'))
+
+        second = self.client.get(self.url)
+        self.assertEqual(second['ETag'], first['ETag'])
+        b''.join(second.streaming_content)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_if_modified_since_alone(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_changed_member_gets_a_new_statement(self):
+        first = self.client.get(self.url)
+        self.member.monthly_contributions['June'] = 100
+        self.member.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'],
+                                   HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+
+
+@web_settings
+@override_settings(REPORT_PDF_WORKERS=2)
+class YearStatementsTests(TestCase):
+    url = '/report-pdf/year/2024/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='chama')
+        self.client.force_login(self.user)
+        bulk_upsert_members(self.user, 2024, [
+            member_row('A2', name='Zawadi Achieng'), member_row('A1', name='Baraka / Otieno'),
+        ])
+        other = User.objects.create(username='other')
+        bulk_upsert_members(other, 2024, [member_row('B1', name='Not mine')])
+
+    def test_zip_has_a_statement_per_member(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="statements_2024.zip"')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ['A1_Baraka__Otieno.pdf', 'A2_Zawadi_Achieng.pdf'])
+            for name in archive.namelist():
+                self.assertTrue(archive.read(name).startswith(b'%PDF'))
+
+    def test_merged_pdf(self):
+        response = self.client.get(self.url, {'format': 'pdf'})
+
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # One page per member of the user's year
+        self.assertEqual(re.search(rb'/Count (\d+) /Kids', pdf)[1], b'2')
+
+
+@web_settings
+class ImportJobTests(TestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.scratch = scratch.name
+        job_settings = override_settings(IMPORT_JOB_DIR=scratch.name, IMPORT_PARSE_WORKERS=2)
+        job_settings.enable()
+        self.addCleanup(job_settings.disable)
+        self.user = User.objects.create(username='chama')
+
+    def enqueue(self, sheets, year=2024, **kwargs):
+        path = os.path.join(self.scratch, f'{len(os.listdir(self.scratch))}.xlsx')
+        write_workbook(path, sheets)
+        return enqueue_import(self.user, path, 'members.xlsx', year, **kwargs)
+
+    def test_claims_each_job_once(self):
+        first = self.enqueue({'Sheet': synthetic_members(5, 2024)})
+        second = self.enqueue({'Sheet': synthetic_members(5, 2024)})
+
+        claimed = [claim_next_job(), claim_next_job(), claim_next_job()]
+
+        self.assertEqual([job and job.id for job in claimed], [first.id, second.id, None])
+        self.assertEqual(claimed[0].status, ImportJob.RUNNING)
+        self.assertIsNotNone(claimed[0].heartbeat_at)
+
+    def test_single_sheet_job(self):
+        job = self.enqueue({'Sheet': synthetic_members(30, 2024)})
+
+        job = run_import_job(claim_next_job())
+
+        self.assertEqual(job.status, ImportJob.DONE, job.message)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created, job.rows_done), (ImportJob.DONE, 30, 30))
+        self.assertEqual(Member.objects.filter(user=self.user, year=2024).count(), 30)
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_reimport_skips_unchanged_rows(self):
+        members = synthetic_members(10, 2024)
+        self.enqueue({'Sheet': members})
+        run_import_job(claim_next_job())
+        members[3] = {**members[3], 'name': 'Renamed'}
+        self.enqueue({'Sheet': members})
+
+        job = run_import_job(claim_next_job())
+
+        self.assertEqual((job.created, job.updated, job.unchanged), (0, 1, 9), job.message)
+        self.assertEqual(Member.objects.get(account_number=members[3]['account_number']).name, 'Renamed')
+        # An edit clears the stored fingerprint, so the same row is written again
+        edited = Member.objects.get(account_number=members[0]['account_number'])
+        edited.save()
+        self.enqueue({'Sheet': members})
+        job = run_import_job(claim_next_job())
+        self.assertEqual((job.updated, job.unchanged), (1, 9))
+
+    def test_sheet_map_job(self):
+        job = self.enqueue({'2023': synthetic_members(20, 2023), '2024': synthetic_members(10, 2024), 'Bad': []},
+                           sheet_years={'2023': 2023, '2024': 2024})
+
+        job = run_import_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created), (ImportJob.DONE, 30), job.message)
+        self.assertEqual(sorted(result['sheet'] for result in job.sheet_results), ['2023', '2024'])
+        self.assertEqual(Member.objects.filter(user=self.user, year=2023).count(), 20)
+
+    def test_stale_jobs_fail_and_fresh_ones_run_on(self):
+        stale = self.enqueue({'Sheet': synthetic_members(5, 2024)})
+        fresh = self.enqueue({'Sheet': synthetic_members(5, 2024)})
+        claim_next_job()
+        claim_next_job()
+        ImportJob.objects.filter(id=stale.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(fail_stale_jobs(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), (ImportJob.FAILED, ImportJob.RUNNING))
+        self.assertFalse(os.path.exists(stale.file_path))
+        self.assertTrue(os.path.exists(fresh.file_path))
+        self.assertEqual(fail_stale_jobs(), 0)
+
+    def test_job_failed_meanwhile_stays_failed(self):
+        self.enqueue({'Sheet': synthetic_members(5, 2024)})
+        job = claim_next_job()
+        ImportJob.objects.filter(id=job.id).update(status=ImportJob.FAILED, message='Stopped')
+
+        job = run_import_job(job)
+
+        self.assertEqual((job.status, job.message), (ImportJob.FAILED, 'Stopped'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+
+    @override_settings(IMPORT_JOB_STALE_SECONDS=0.2)
+    def test_heartbeat_while_waiting_for_sheets(self):
+        self.enqueue({'Sheet': []})
+        job = claim_next_job()
+        claimed_at = job.heartbeat_at
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            futures = {pool.submit(time.sleep, 0.3): 'slow'}
+            self.assertEqual(list(_as_completed_beating(futures, job)), list(futures))
+
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, claimed_at)
+
+
+@web_settings
+class UploadDedupTests(TestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.scratch = scratch.name
+        job_settings = override_settings(IMPORT_JOB_DIR=scratch.name)
+        job_settings.enable()
+        self.addCleanup(job_settings.disable)
+        self.user = User.objects.create(username='chama')
+        self.client.force_login(self.user)
+        workbook = BytesIO()
+        write_workbook(workbook, {'Sheet': synthetic_members(5, 2024)})
+        self.workbook = workbook.getvalue()
+
+    def upload(self, content=None, **data):
+        excel_file = SimpleUploadedFile('members.xlsx', content or self.workbook)
+        return self.client.post('/upload/', {'excel_file': excel_file, 'year': 2024, **data})
+
+    def test_same_file_reuses_the_first_job(self):
+        first = self.upload()
+        job = ImportJob.objects.get()
+        self.assertRedirects(first, f'/imports/{job.id}/', fetch_redirect_response=False)
+
+        second = self.upload()
+
+        self.assertRedirects(second, f'/imports/{job.id}/', fetch_redirect_response=False)
+        self.assertEqual(ImportJob.objects.count(), 1)
+        duplicate = ImportBatch.objects.get(duplicate_of__isnull=False)
+        self.assertEqual((duplicate.job, duplicate.reusable), (job, False))
+        # The repeated upload is not kept
+        self.assertEqual(os.listdir(self.scratch), [os.path.basename(job.file_path)])
+
+    def test_other_content_year_or_force_import_again(self):
+        self.upload()
+        other = BytesIO()
+        write_workbook(other, {'Sheet': synthetic_members(6, 2024)})
+
+        self.upload(other.getvalue())
+        self.upload(year=2023)
+        self.upload(force='on')
+
+        self.assertEqual(ImportJob.objects.count(), 4)
+
+    def test_changed_members_or_failed_job_import_again(self):
+        self.upload()
+        job = run_import_job(claim_next_job())
+        self.assertEqual(job.status, ImportJob.DONE, job.message)
+
+        member = Member.objects.filter(user=self.user).first()
+        member.name = 'Edited'
+        member.save()
+        self.upload()
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+        ImportJob.objects.filter(id=ImportJob.objects.latest('id').id).update(status=ImportJob.FAILED)
+        self.upload()
+        self.assertEqual(ImportJob.objects.count(), 3)
+
+
+@web_settings
+class MultiSheetUploadTests(TestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        job_settings = override_settings(IMPORT_JOB_DIR=scratch.name, IMPORT_PARSE_WORKERS=2)
+        job_settings.enable()
+        self.addCleanup(job_settings.disable)
+        self.user = User.objects.create(username='chama')
+        self.client.force_login(self.user)
+        workbook = BytesIO()
+        write_workbook(workbook, {
+            '2023': synthetic_members(4, 2023), '2024': synthetic_members(6, 2024), 'Notes': [],
+        })
+        self.workbook = workbook.getvalue()
+
+    def upload(self, **selection):
+        response = self.client.post('/upload/', {
+            'excel_file': SimpleUploadedFile('members.xlsx', self.workbook), 'year': 2024,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response, self.client.post('/upload/', selection)
+
+    def test_sheets_go_to_the_years_chosen(self):
+        form, response = self.upload(sheet_index=['0', '1'], sheet_year_0='2023', sheet_year_1='2024')
+
+        # Sheets named after a year default to it
+        self.assertEqual([(sheet['name'], sheet['year']) for sheet in form.context['sheets']],
+                         [('2023', 2023), ('2024', 2024), ('Notes', 2024)])
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, f'/imports/{job.id}/', fetch_redirect_response=False)
+        self.assertEqual(job.sheet_years, {'2023': 2023, '2024': 2024})
+        self.assertNotIn('uploaded_excel_path', self.client.session)
+
+        job = run_import_job(claim_next_job())
+        self.assertEqual((job.status, job.created), (ImportJob.DONE, 10), job.message)
+        self.assertEqual(Member.objects.filter(user=self.user, year=2023).count(), 4)
+
+    def test_one_sheet_is_streamed_and_imported_sheets_skipped(self):
+        self.upload(sheet_index=['1'], sheet_year_1='2024')
+        first = ImportJob.objects.get()
+        self.assertEqual((first.sheet_name, first.year, first.sheet_years), ('2024', 2024, {}))
+
+        _, response = self.upload(sheet_index=['0', '1'], sheet_year_0='2023', sheet_year_1='2024')
+
+        second = ImportJob.objects.latest('id')
+        self.assertEqual((second.sheet_name, second.year), ('2023', 2023))
+        self.assertRedirects(response, f'/imports/{second.id}/', fetch_redirect_response=False)
+
+    def test_no_or_invalid_selection(self):
+        _, response = self.upload()
+        self.assertContains(response, 'Please select at least one sheet.')
+        # The saved file is kept for another try
+        path = self.client.session['uploaded_excel_path']
+        self.assertTrue(os.path.exists(path))
+
+        self.client.post('/upload/', {'sheet_index': ['7']})
+        self.assertFalse(ImportJob.objects.exists())
+        self.assertNotIn('uploaded_excel_path', self.client.session)
+        self.assertFalse(os.path.exists(path))
+
+
+class MemberSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+        bulk_upsert_members(self.user, 2024, [
+            member_row('AC-100', name='Jane Wanjiku', phone='0712345678'),
+            member_row('AC-200', name='john otieno', phone='254722000111'),
+            member_row('BX-300', name='Achieng Jones', phone='+254733999888'),
+        ])
+        other = User.objects.create(username='other')
+        bulk_upsert_members(other, 2024, [member_row('OT-1', name='Jane Other')])
+        self.members = Member.objects.filter(user=self.user, year=2024)
+
+    def accounts(self, term, **kwargs):
+        return sorted(filter_members(self.members, term, **kwargs).values_list('account_number', flat=True))
+
+    def test_name_prefix_ignores_case(self):
+        self.assertEqual(self.accounts('JA'), ['AC-100'])
+        self.assertEqual(self.accounts('jo'), ['AC-200'])
+
+    def test_account_prefix(self):
+        self.assertEqual(self.accounts('ac-'), ['AC-100', 'AC-200'])
+        self.assertEqual(self.accounts('BX-3'), ['BX-300'])
+
+    def test_phone_in_any_format(self):
+        for term in ['0712345', '254712345', '+254712345']:
+            self.assertEqual(self.accounts(term), ['AC-100'], term)
+        self.assertEqual(self.accounts('0722000'), ['AC-200'])
+
+    def test_fuzzy_matches_inside_the_name(self):
+        self.assertEqual(self.accounts('ones'), [])
+        self.assertEqual(self.accounts('ones', fuzzy=True), ['BX-300'])
+        self.assertEqual(self.accounts('"', fuzzy=True), [])
+
+    def test_fuzzy_follows_renames(self):
+        Member.objects.filter(account_number='AC-100').update(name='Mary Akinyi')
+
+        self.assertEqual(self.accounts('anj', fuzzy=True), [])
+        self.assertEqual(self.accounts('kiny', fuzzy=True), ['AC-100'])
+
+    def test_filters(self):
+        self.members.update(total_deficit=0)
+        self.members.filter(account_number='AC-200').update(total_deficit=Decimal('100.00'))
+
+        self.assertEqual(self.accounts('', status='deficit'), ['AC-200'])
+        self.assertEqual(self.accounts('a', status='paid'), ['AC-100', 'BX-300'])
+        self.assertEqual(self.accounts('', min_contributed=6000), ['AC-100', 'AC-200', 'BX-300'])
+        self.assertEqual(self.accounts('', min_contributed=6001), [])
+
+    def test_unchanged_name_leaves_the_search_index_alone(self):
+        if not fts_available():
+            self.skipTest('SQLite build without FTS5 trigram')
+        member = self.members.get(account_number='AC-100')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT total_changes()')
+            before = cursor.fetchone()[0]
+            Member.objects.filter(pk=member.pk).update(name=F('name'))
+            cursor.execute('SELECT total_changes()')
+            # The row itself, and no FTS delete/insert from the update trigger
+            self.assertEqual(cursor.fetchone()[0] - before, 1)
+
+
+@web_settings
+class AnalyticsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='treasurer')
+        bulk_upsert_members(self.user, 2023, [member_row('A1', amount=100)])
+        bulk_upsert_members(self.user, 2024, [
+            member_row('A1', annual_target=Decimal('6000')),
+            member_row('A2', monthly_contributions={'January': 1000, 'March': '250.50'},
+                       annual_target=Decimal('6000')),
+        ])
+        other = User.objects.create(username='other')
+        bulk_upsert_members(other, 2024, [member_row('B1', amount=9999)])
+
+    def test_contributions_carry_the_member_user(self):
+        Member.objects.get(account_number='A2').save()
+
+        rows = Contribution.objects.select_related('member')
+        self.assertTrue(rows.exists())
+        for row in rows:
+            self.assertEqual((row.user_id, row.year), (row.member.user_id, row.member.year))
+
+    def test_year_figures(self):
+        figures = year_figures(self.user, 2024)
+
+        members = Member.objects.filter(user=self.user, year=2024)
+        deficit = float(sum(member.total_deficit for member in members))
+        self.assertEqual(figures['members'], 2)
+        self.assertEqual(figures['contributed'], 6000 + 1250.5)
+        self.assertEqual(figures['target'], 12000)
+        self.assertEqual(figures['deficit'], deficit)
+        self.assertEqual(figures['collection_rate'], round((12000 - deficit) / 12000, 4))
+        self.assertEqual(figures['months']['January'], 1500)
+        self.assertEqual(figures['months']['March'], 750.5)
+        self.assertEqual(figures['months']['February'], 500)
+
+    def test_policy_target_replaces_member_targets(self):
+        ContributionPolicy.objects.create(
+            user=self.user, year=2024, schedule={'January': 1}, annual_target=Decimal('1000'),
+        )
+
+        figures = year_figures(self.user, 2024)
+        self.assertEqual(figures['target'], 2000)
+        # Only A1's January (500 of 1000) falls short
+        self.assertEqual((figures['deficit'], figures['in_deficit'], figures['collection_rate']), (500, 1, 0.75))
+
+    def test_years_compared_and_cached(self):
+        self.client.force_login(self.user)
+
+        years = self.client.get('/analytics/data/').json()['years']
+        self.assertEqual([figures['year'] for figures in years], [2023, 2024])
+        self.assertIsNone(years[0]['contributed_change'])
+        self.assertEqual(years[1]['contributed_change'], 7250.5 - 1200)
+        self.assertEqual(cache.get(analytics_key(self.user.id, 2024))['contributed'], 7250.5)
+
+        member = Member.objects.get(account_number='A2')
+        member.monthly_contributions = {'January': 50}
+        with self.captureOnCommitCallbacks(execute=True):
+            member.save()
+
+        self.assertIsNone(cache.get(analytics_key(self.user.id, 2024)))
+        years = self.client.get('/analytics/data/').json()['years']
+        self.assertEqual(years[1]['contributed'], 6050)
+        self.assertEqual(years[1]['months']['January'], 550)
+
+
+@web_settings
+@override_settings(PERFORMANCE_MONITORING=True, PERFORMANCE_SLOW_REQUEST_MS=0, PERFORMANCE_SLOW_QUERIES=2)
+class PerformanceMiddlewareTests(TestCase):
+    timing = re.compile(r'total;dur=[\d.]+, db;dur=[\d.]+;desc="(\d+) queries", app;dur=[\d.]+')
+
+    def setUp(self):
+        self.user = User.objects.create(username='treasurer')
+        self.client.force_login(self.user)
+        bulk_upsert_members(self.user, 2024, [member_row('A1')])
+
+    def test_server_timing_and_slow_log(self):
+        with self.assertLogs('expenses.performance', 'WARNING') as logs:
+            response = self.client.get('/', {'year': 2024, 'q': '0799123'})
+
+        queries = int(self.timing.fullmatch(response['Server-Timing'])[1])
+        self.assertGreater(queries, 0)
+        [entry] = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual((entry['view'], entry['status'], entry['user']), ('dashboard', 200, self.user.id))
+        self.assertEqual(entry['queries'], queries)
+        self.assertEqual(len(entry['slowest_queries']), 2)
+        self.assertGreaterEqual(entry['slowest_queries'][0]['ms'], entry['slowest_queries'][1]['ms'])
+        # Statements are logged without their parameters
+        self.assertNotIn('799123', logs.output[0])
+
+    def test_streaming_response_logged_once_sent(self):
+        with self.assertNoLogs('expenses.performance', 'WARNING'):
+            response = self.client.get('/export/2024/')
+        self.assertRegex(response['Server-Timing'], self.timing)
+
+        with self.assertLogs('expenses.performance', 'WARNING') as logs:
+            b''.join(response.streaming_content)
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'export_year')
+
+    def test_fast_requests_are_not_logged(self):
+        with override_settings(PERFORMANCE_SLOW_REQUEST_MS=60_000):
+            with self.assertNoLogs('expenses.performance', 'WARNING'):
+                self.assertIn('Server-Timing', self.client.get('/'))
+
+    def test_off_removes_the_header(self):
+        with override_settings(PERFORMANCE_MONITORING=False):
+            self.assertNotIn('Server-Timing', self.client.get('/'))
+
+
+@web_settings
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        metrics_settings = override_settings(
+            METRICS_ENABLED=True, METRICS_DB=os.path.join(scratch.name, 'metrics.sqlite3'),
+        )
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+        self.admin = User.objects.create_superuser('admin', password='secret')
+
+    def test_counters_and_histograms(self):
+        record_import(created=3, updated=2, unchanged=1, failed=0, seconds=0.05)
+        record_import(created=1, updated=0, unchanged=0, failed=4, seconds=0.05)
+
+        lines = render_metrics().splitlines()
+        for line in [
+            '# TYPE cwa_import_rows_total counter',
+            'cwa_import_rows_total{result="created"} 4',
+            'cwa_import_rows_total{result="failed"} 4',
+            '# TYPE cwa_import_rows_per_second histogram',
+            'cwa_import_rows_per_second_bucket{le="100.0"} 1',
+            'cwa_import_rows_per_second_bucket{le="250.0"} 2',
+            'cwa_import_rows_per_second_bucket{le="+Inf"} 2',
+            'cwa_import_rows_per_second_sum 140',
+            'cwa_import_rows_per_second_count 2',
+        ]:
+            self.assertIn(line, lines)
+
+    def test_disabled_records_nothing(self):
+        with override_settings(METRICS_ENABLED=False):
+            record_import(created=3, updated=0, unchanged=0, failed=0, seconds=1)
+        self.assertNotIn('cwa_import_rows_total{', render_metrics())
+
+    def test_endpoint_needs_a_superuser(self):
+        User.objects.create_user('member', password='secret')
+
+        def basic(username):
+            return 'Basic ' + base64.b64encode(f'{username}:secret'.encode()).decode()
+
+        response = self.client.get('/metrics/')
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Basic realm="metrics"'))
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION=basic('member')).status_code, 403)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION=basic('admin'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(b'# TYPE cwa_pdf_render_seconds histogram', response.content)
+
+    def test_cache_lookups_are_counted(self):
+        self.client.force_login(self.admin)
+        bulk_upsert_members(self.admin, 2024, [member_row('A1')])
+
+        self.client.get('/', {'year': 2024})
+        self.client.get('/', {'year': 2024})
+
+        # The years list and the summary: missed once, then hit
+        self.assertEqual(self.client.get('/cache-stats/').json(), {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+        self.assertIn('cwa_dashboard_rows_count 2', render_metrics().splitlines())
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_members_are_reproducible(self):
+        first, again, next_year = (synthetic_members(50, 2023), synthetic_members(50, 2023),
+                                   synthetic_members(50, 2024))
+
+        self.assertEqual(first, again)
+        # The same people every year, paying differently
+        self.assertEqual([row['account_number'] for row in first], [row['account_number'] for row in next_year])
+        self.assertNotEqual([row['monthly_contributions'] for row in first],
+                            [row['monthly_contributions'] for row in next_year])
+
+    def test_command_seeds_users_and_years(self):
+        options = {'users': 2, 'members': 5, 'years': [2023, 2024], 'prefix': 'synth', 'stdout': StringIO()}
+        call_command('generate_synthetic_data', **options)
+        call_command('generate_synthetic_data', **options)
+
+        users = User.objects.filter(username__startswith='synth-')
+        self.assertEqual(users.count(), 2)
+        self.assertFalse(any(user.has_usable_password() for user in users))
+        self.assertEqual(Member.objects.filter(user__in=users).count(), 20)
+
+        call_command('generate_synthetic_data', **options, reset=True)
+        self.assertEqual(Member.objects.filter(user__username__startswith='synth-').count(), 20)
+
+    def test_workbook_only(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, 'members.xlsx')
+            call_command('generate_synthetic_data', members=40, years=[2023, 2024], workbook=path,
+                         workbook_only=True, error_rate=0.25, stdout=StringIO())
+
+            workbook = open_workbook(path)
+            self.assertEqual(workbook.sheetnames, ['2023', '2024'])
+            frame, errors = normalize_dataframe(next(iter_sheet_chunks(workbook['2023'])))
+            workbook.close()
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(len(frame) + len(errors), 40)
+        self.assertTrue(errors)
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    def run_suite(self, *args):
+        output = StringIO()
+        call_command('benchmark_suite', *args, stdout=output)
+        return output.getvalue()
+
+    def test_runs_and_leaves_nothing_behind(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            path = os.path.join(scratch, 'run.json')
+            self.run_suite('--sizes', '20', '--repeat', '1', '--steps', 'dashboard', 'generate_pdf_cached',
+                           '--output', path)
+            with open(path) as result_file:
+                run = json.load(result_file)
+
+        self.assertEqual(set(run['results']['20']), {'dashboard', 'generate_pdf_cached'})
+        self.assertGreater(run['results']['20']['dashboard']['queries'], 0)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Member.objects.exists())
+
+    def test_compare_flags_regressions(self):
+        def run(ms, queries):
+            return {'results': {'1000': {'dashboard': {'ms': ms, 'queries': queries, 'db_ms': 1}}}}
+
+        with tempfile.TemporaryDirectory() as scratch:
+            paths = []
+            for name, result in [('old', run(100, 5)), ('noise', run(104, 5)), ('slower', run(150, 5)),
+                                 ('queries', run(90, 6))]:
+                paths.append(os.path.join(scratch, f'{name}.json'))
+                with open(paths[-1], 'w') as result_file:
+                    json.dump(result, result_file)
+            old, noise, slower, queries = paths
+
+            self.assertIn('0 regressions in 1', self.run_suite('--compare', old, noise, '--fail-on-regression'))
+            for new in (slower, queries):
+                with self.assertRaisesMessage(CommandError, '1 steps regressed'):
+                    self.run_suite('--compare', old, new, '--fail-on-regression')
+
+
+class ColdStartTests(SimpleTestCase):
+    # A fresh interpreter, since this one has imported everything by now
+    script = (
+        'import sys\n'
+        'from django.core.wsgi import get_wsgi_application\n'
+        'from django.urls import get_resolver\n'
+        'get_wsgi_application()\n'
+        'get_resolver().url_patterns\n'
+        'print(sorted(name for name in ("pandas", "reportlab", "openpyxl") if name in sys.modules))\n'
+        'from expenses.warmup import warm_up\n'
+        'warm_up()\n'
+        'print(sorted(name for name in ("pandas", "reportlab", "openpyxl") if name in sys.modules))\n'
+    )
+
+    def test_heavy_modules_load_on_demand(self):
+        result = subprocess.run(
+            [sys.executable, '-c', self.script], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        )
+
+        self.assertEqual(result.stdout.splitlines(), ['[]', "['openpyxl', 'pandas', 'reportlab']"])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLITE_PRAGMAS only apply to SQLite')
+class SQLitePragmaTests(TransactionTestCase):
+    """Dashboard reads keep going while an import holds the write lock.
+
+    The test database is in memory, where WAL doesn't apply, so these run
+    against a scratch file set up like the default database.
+    """
+    alias = 'pragma_check'
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        connections.settings[self.alias] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(scratch.name, 'check.sqlite3'),
+            'CONN_MAX_AGE': 0,
+            # A blocked read fails in a second instead of waiting out SQLITE_TIMEOUT
+            'OPTIONS': {'timeout': 1},
+        }
+        self.addCleanup(connections.settings.pop, self.alias)
+        self.addCleanup(connections.__delitem__, self.alias)
+        self.addCleanup(connections[self.alias].close)
+        call_command('migrate', database=self.alias, verbosity=0)
+        self.user = User.objects.using(self.alias).create(username='reader')
+        Member.objects.using(self.alias).bulk_create(
+            Member(user=self.user, year=2023, **row) for row in synthetic_members(100, 2023)
+        )
+
+    def read_members(self):
+        """Count 2023's members from another thread; returns ``(count, seconds, error)``"""
+        result = {}
+
+        def read():
+            start = time.perf_counter()
+            try:
+                result['count'] = Member.objects.using(self.alias).filter(year=2023).count()
+            except Exception as e:
+                result['error'] = e
+            finally:
+                result['seconds'] = time.perf_counter() - start
+                connections[self.alias].close()
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        return result.get('count'), result['seconds'], result.get('error')
+
+    def test_journal_mode_is_wal(self):
+        with connections[self.alias].cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_reader_not_blocked_by_open_write_transaction(self):
+        writer = connections[self.alias]
+        with transaction.atomic(using=self.alias):
+            # A small page cache makes the writer spill to the database file
+            # mid-transaction, as a large import does; without WAL that takes
+            # an exclusive lock and readers fail with "database is locked"
+            with writer.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = 10')
+            Member.objects.using(self.alias).bulk_create(
+                Member(user=self.user, year=2024, **row)
+                for row in synthetic_members(2000, 2024, account_prefix='IMP')
+            )
+            Member.objects.using(self.alias).filter(year=2023).update(name='Renamed')
+
+            count, seconds, error = self.read_members()
+
+        self.assertIsNone(error)
+        self.assertEqual(count, 100)
+        self.assertLess(seconds, 0.5)
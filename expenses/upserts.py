@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db import transaction
+
+from .cache import invalidate_member_cache
+from .db import take_write_lock
+from .models import Contribution, ContributionPolicy, Member
+
+# Fields rewritten on existing members during an import
+MEMBER_IMPORT_FIELDS = ['name', 'phone', 'monthly_contributions', 'fingerprint']
+
+
+def existing_members(user, year):
+    """Map the user's account numbers in ``year`` to ``(annual_target, fingerprint)``"""
+    return {
+        account_number: (annual_target, fingerprint)
+        for account_number, annual_target, fingerprint in
+        Member.objects.filter(user=user, year=year)
+        .values_list('account_number', 'annual_target', 'fingerprint')
+    }
+
+
+def bulk_upsert_members(user, year, rows, batch_size=None, existing=None):
+    """Create/update members for a user and year in a single transaction.
+
+    ``rows`` is an iterable of dicts with ``account_number``, ``name``, ``phone``
+    and ``monthly_contributions`` keys, plus an optional ``fingerprint`` from
+    ``importers.row_fingerprints``. Rows whose fingerprint matches the stored one are
+    left alone. The rest are split into plain inserts and ``ON CONFLICT DO
+    UPDATE`` upserts, which are much cheaper than ``bulk_update``'s CASE
+    expressions. Only rows already owned by ``user`` go through the upsert, so
+    another user's member is never overwritten.
+
+    ``existing`` is the dict from ``existing_members``; it is fetched when
+    omitted and updated in place, so chunked imports only query it once. The
+    stored totals are recomputed for every written row, using the member's
+    own annual target for updates and the year's ``ContributionPolicy``, and
+    its ``Contribution`` rows are rewritten.
+    Returns a ``(created, updated, unchanged)`` tuple of counts.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+
+    # Later rows win for duplicate account numbers, like update_or_create did
+    incoming = {}
+    for row in rows:
+        incoming[row['account_number']] = row
+
+    with transaction.atomic():
+        take_write_lock(Member)
+        if existing is None:
+            existing = existing_members(user, year)
+
+        to_create = []
+        to_update = []
+        unchanged = 0
+        for account_number, row in incoming.items():
+            member = Member(user=user, year=year, **row)
+            if account_number in existing:
+                annual_target, fingerprint = existing[account_number]
+                if member.fingerprint and member.fingerprint == fingerprint:
+                    unchanged += 1
+                    continue
+                member.annual_target = annual_target
+                to_update.append(member)
+            else:
+                to_create.append(member)
+
+        written = to_create + to_update
+        if not written:
+            return 0, 0, unchanged
+        Member.set_totals(written, ContributionPolicy.for_year(user.id, year))
+
+        Member.objects.bulk_create(to_create, batch_size=batch_size)
+        Member.objects.bulk_create(
+            to_update,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['account_number', 'year'],
+            update_fields=MEMBER_IMPORT_FIELDS + Member.TOTAL_FIELDS,
+        )
+        existing.update(
+            (member.account_number, (member.annual_target, member.fingerprint))
+            for member in written
+        )
+
+        # Upserts don't hand back ids, so look them up to mirror the months
+        member_ids = dict(
+            Member.objects.filter(
+                user=user, year=year,
+                account_number__in=[member.account_number for member in written],
+            ).values_list('account_number', 'id')
+        )
+        Contribution.replace_for(
+            (member_ids[member.account_number], user.id, year, member.monthly_contributions)
+            for member in written
+        )
+        invalidate_member_cache(user.id, [year])
+
+    return len(to_create), len(to_update), unchanged
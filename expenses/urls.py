@@ -1,5 +1,12 @@
-from django.urls import path
-from expenses import views
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from expenses import api, views
+
+router = DefaultRouter()
+router.register('members', api.MemberViewSet, basename='api-member')
+router.register('contributions', api.ContributionViewSet, basename='api-contribution')
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
@@ -7,9 +14,24 @@ urlpatterns = [
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('upload/', views.upload_excel, name='upload'),
+    path('imports/', views.import_history, name='import_history'),
+    path('imports/<int:job_id>/', views.import_job, name='import_job'),
+    path('imports/<int:job_id>/progress/', views.import_job_progress, name='import_job_progress'),
     path('report/<int:member_id>/', views.generate_report, name='generate_report'),
     path('report-pdf/<int:member_id>/', views.generate_pdf, name='generate_pdf'),
+    path('report-pdf/year/<int:year>/', views.generate_year_pdfs, name='generate_year_pdfs'),
+    path('analytics/', views.analytics, name='analytics'),
+    path('analytics/data/', views.analytics_data, name='analytics_data'),
+    path('export/<int:year>/', views.export_year, name='export_year'),
     path('edit/<int:member_id>/', views.edit_contributions, name='edit_contributions'),
+    path('policy/<int:year>/', views.edit_policy, name='edit_policy'),
     path('delete/<int:member_id>/', views.delete_member, name='delete_member'),
     path('delete-all/', views.delete_all, name='delete_all'),
+    path('cache-stats/', views.member_cache_stats, name='member_cache_stats'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('payments/mpesa/validation/', views.mpesa_validation, name='mpesa_validation'),
+    path('payments/mpesa/confirmation/', views.mpesa_confirmation, name='mpesa_confirmation'),
+    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/', include(router.urls)),
 ]
\ No newline at end of file
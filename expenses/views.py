@@ -1,23 +1,46 @@
+import base64
 from datetime import datetime
-import tempfile
+import json
+from urllib.parse import urlencode
 import os
+import tempfile
 
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Member
-import pandas as pd
-from django.http import HttpResponse, HttpResponseForbidden, Http404
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from .models import ContributionPolicy, ImportBatch, ImportJob, Member, MONTHS
+from .analytics import user_analytics
+from .policies import DEFAULT_SCHEDULE, evaluate_rows, year_rows
+from .payments import callback_payment, record_payments
+from .search import STATUS_FILTERS, filter_members
+from .jobs import (
+    enqueue_import, find_imported_batch, record_batches, record_duplicate, remove_upload,
+    save_upload,
+)
+from .pagination import DEFAULT_SORT, SORTS, keyset_page
+from .exports import ledger_rows, stream_csv, write_xlsx
+from .metrics import DASHBOARD_ROWS, UPLOAD_BYTES, render as render_metrics
+from .cache import cache_stats, get_or_compute, invalidate_member_cache, summary_key, years_key
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.utils.http import http_date
+from django.utils.text import get_valid_filename
+from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from django.contrib.auth.forms import UserCreationForm
-from .forms import CustomUserCreationForm
 from django import forms
 
+# pandas, openpyxl and ReportLab are imported inside the upload and report
+# views, so a worker boots and serves every other page without loading them
+# (gunicorn.conf.py can still preload them; see expenses.warmup)
+
 
 @login_required
 def dashboard(request):
@@ -28,9 +51,11 @@ def dashboard(request):
 
     # Get available years with data
     members = Member.objects.filter(user=request.user)
-    years = list(members.values_list('year', flat=True)
-                 .distinct()
-                 .order_by('-year'))
+    years = get_or_compute(years_key(request.user.id), lambda: list(
+        members.values_list('year', flat=True)
+        .distinct()
+        .order_by('-year')
+    ))
 
     if not years:
         years = [datetime.now().year]
@@ -40,15 +65,95 @@ def dashboard(request):
         if selected_year not in years:
             selected_year = years[0]  # Use first available year
 
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    try:
+        page_size = int(request.GET.get('page_size', settings.DASHBOARD_PAGE_SIZE))
+        page_size = min(max(page_size, 1), settings.DASHBOARD_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = settings.DASHBOARD_PAGE_SIZE
+
     members_data = Member.objects.filter(
         user=request.user,
         year=selected_year
-    ).order_by('name')
+    )
+
+    summary = get_or_compute(
+        summary_key(request.user.id, selected_year),
+        lambda: members_data.aggregate(
+            count=Count('id'),
+            contributed=Sum('total_contributed'),
+            deficit=Sum('total_deficit'),
+            in_deficit=Count('id', filter=Q(total_deficit__gt=0)),
+        )
+    )
+
+    # Search and filters run in SQL; the summary above stays the year's
+    term = request.GET.get('q', '').strip()
+    status = request.GET.get('status', '')
+    if status not in STATUS_FILTERS:
+        status = ''
+    min_field = forms.DecimalField(required=False, max_digits=12, decimal_places=2)
+    try:
+        # Also rejects NaN, infinities and amounts the column can't hold
+        min_contributed = min_field.clean(request.GET.get('min', ''))
+    except ValidationError:
+        min_contributed = None
+    fuzzy = request.GET.get('fuzzy') == '1'
+    filtered = bool(term or status or min_contributed is not None)
+    if filtered:
+        members_data = filter_members(members_data, term, status, min_contributed, fuzzy)
+
+    page, next_cursor, previous_cursor = keyset_page(
+        members_data, sort, page_size,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+    # Links keep the year, sort, page size and filters; sorting again starts at page one
+    query = {'year': selected_year, 'sort': sort, 'page_size': page_size}
+    if term:
+        query['q'] = term
+    if status:
+        query['status'] = status
+    if min_contributed is not None:
+        query['min'] = min_contributed
+    if fuzzy:
+        query['fuzzy'] = 1
+    sort_urls = {
+        column: '?' + urlencode({**query, 'sort': f'-{column}' if sort == column else column})
+        for column in ('name', 'contributed', 'deficit')
+    }
+    next_url = '?' + urlencode({**query, 'after': next_cursor}) if next_cursor else None
+    previous_url = '?' + urlencode({**query, 'before': previous_cursor}) if previous_cursor else None
+
+    # The page's figures are computed together, and the template gets plain rows
+    policy = ContributionPolicy.for_year(request.user.id, selected_year)
+    rows = evaluate_rows([
+        {'id': member.id, 'name': member.name,
+         'monthly_contributions': member.monthly_contributions,
+         'annual_target': member.annual_target}
+        for member in page
+    ], policy)
+    DASHBOARD_ROWS.observe(len(rows))
+
+    # Latest background imports, so finished uploads show up here
+    recent_jobs = ImportJob.objects.filter(user=request.user)[:3]
 
     return render(request, 'dashboard.html', {
-        'members': members_data,
+        'members': rows,
+        'summary': summary,
+        'matches': members_data.count() if filtered else None,
+        'search': {'q': term, 'status': status, 'min': min_contributed, 'fuzzy': fuzzy},
+        'due_months': policy.due_months,
         'selected_year': selected_year,
-        'years': years
+        'years': years,
+        'sort': sort,
+        'sort_urls': sort_urls,
+        'next_url': next_url,
+        'previous_url': previous_url,
+        'recent_jobs': recent_jobs,
     })
 
 
@@ -56,6 +161,7 @@ class UploadForm(forms.Form):
     excel_file = forms.FileField()
     year = forms.IntegerField()
     sheet_name = forms.ChoiceField(required=False)  # Add field for sheet selection
+    force = forms.BooleanField(required=False)  # Import even if this file was imported before
 
 
 # UPLOAD EXCEL FUNCTIONALITY
@@ -81,43 +187,78 @@ def upload_excel(request):
 
 
 def handle_multi_sheet_upload(request, years):
-    """Process multi-sheet Excel file after sheet selection"""
+    """Queue the selected sheets of a multi-sheet Excel file"""
     # Get session data
     tmp_path = request.session.get('uploaded_excel_path')
     year = request.session.get('uploaded_year')
     excel_file_name = request.session.get('uploaded_excel_name')
-    selected_sheet = request.POST.get('sheet_name')
+    sheet_names = request.session.get('sheet_names', [])
+    selected = request.POST.getlist('sheet_index')
 
-    if not selected_sheet:
+    if not selected:
         return render(request, 'upload.html', {
-            'error': 'Please select a sheet.',
-            'sheet_names': request.session.get('sheet_names', []),
+            'error': 'Please select at least one sheet.',
+            'sheets': sheet_year_choices(sheet_names, year, years),
             'excel_file_name': excel_file_name,
             'year': year,
-            'years': reversed(list(years)),
+            'years': list(reversed(years)),
         })
 
+    # Map each ticked sheet to the year chosen next to it
+    sheet_years = {}
     try:
-        with pd.ExcelFile(tmp_path) as xls:
-            if selected_sheet not in xls.sheet_names:
-                raise ValueError(f"Sheet '{selected_sheet}' not found")
+        for index in selected:
+            sheet_years[sheet_names[int(index)]] = int(request.POST.get(f'sheet_year_{index}', year))
+    except (ValueError, IndexError):
+        cleanup_upload_session(request, tmp_path)
+        return render(request, 'upload.html', {
+            'error': 'Error: Invalid sheet selection',
+            'years': reversed(list(years)),
+        })
 
-            df = pd.read_excel(xls, sheet_name=selected_sheet)
+    # Sheets this exact file already imported into the same year are skipped
+    content_hash = request.session.get('uploaded_hash', '')
+    reused = []
+    if not request.session.get('uploaded_force'):
+        for sheet_name, sheet_year in list(sheet_years.items()):
+            batch = find_imported_batch(request.user, content_hash, sheet_year, sheet_name)
+            if batch is not None:
+                record_duplicate(batch, excel_file_name)
+                reused.append(batch)
+                del sheet_years[sheet_name]
+
+    if not sheet_years:
+        cleanup_upload_session(request, tmp_path)
+        messages.info(request, 'This file was already imported; showing the earlier import.')
+        return redirect('import_job', job_id=reused[0].job_id)
 
-        # Process data rows
-        process_dataframe(df, request.user, year)
+    if len(sheet_years) == 1:
+        # A single sheet is streamed rather than parsed in a process pool
+        [(sheet_name, sheet_year)] = sheet_years.items()
+        job = enqueue_import(request.user, tmp_path, excel_file_name, sheet_year, sheet_name)
+    else:
+        job = enqueue_import(request.user, tmp_path, excel_file_name, year,
+                             sheet_years=sheet_years)
+    record_batches(job, content_hash, sheet_years)
 
-        # Cleanup
-        cleanup_upload_session(request, tmp_path)
+    if reused:
+        skipped = ', '.join(batch.sheet_name for batch in reused)
+        messages.info(request, f'Already imported from this file, skipped: {skipped}')
 
-        return redirect(f'/?year={year}')
+    # The worker owns the file now, so only the session keys are cleared
+    cleanup_upload_session(request)
+
+    return redirect('import_job', job_id=job.id)
 
-    except Exception as e:
-        cleanup_upload_session(request, tmp_path)
-        return render(request, 'upload.html', {
-            'error': f'Error: {str(e)}',
-            'years': reversed(list(years)),
-        })
+
+def sheet_year_choices(sheet_names, year, years):
+    """Pair each sheet with a default year, using the sheet name if it is one"""
+    choices = []
+    for index, sheet in enumerate(sheet_names):
+        name = sheet.strip()
+        sheet_year = int(name) if name.isdigit() and int(name) in years else year
+        choices.append({'index': index, 'name': sheet, 'year': sheet_year})
+    return choices
 
 
 def handle_initial_upload(request, years):
@@ -130,105 +271,134 @@ def handle_initial_upload(request, years):
         })
 
     year = form.cleaned_data['year']
+    force = form.cleaned_data['force']
     excel_file = request.FILES['excel_file']
+    UPLOAD_BYTES.observe(excel_file.size)
+    tmp_path, content_hash = save_upload(excel_file)
 
     try:
-        with pd.ExcelFile(excel_file) as xls:
-            sheet_names = xls.sheet_names
+        from .importers import open_workbook
+
+        # Only the sheet list is read here, the import worker streams the rows
+        workbook = open_workbook(tmp_path)
+        try:
+            sheet_names = workbook.sheetnames
+        finally:
+            workbook.close()
 
         if len(sheet_names) > 1:
-            # Save to temporary file for sheet selection
-            return handle_multi_sheet_case(excel_file, year, sheet_names, request)
+            # Keep the saved file for sheet selection
+            request.session.update({'uploaded_hash': content_hash, 'uploaded_force': force})
+            return handle_multi_sheet_case(tmp_path, excel_file.name, year, sheet_names, request, years)
         else:
-            # Process single sheet immediately
-            return handle_single_sheet_case(excel_file, year, sheet_names, request)
+            # Queue the single sheet immediately
+            return handle_single_sheet_case(tmp_path, excel_file.name, year, sheet_names, request,
+                                            content_hash, force)
 
     except Exception as e:
+        remove_upload(tmp_path)
         return render(request, 'upload.html', {
             'error': f'Error: {str(e)}',
             'years': reversed(list(years)),
         })
 
 
-def handle_multi_sheet_case(excel_file, year, sheet_names, request):
+def handle_multi_sheet_case(tmp_path, file_name, year, sheet_names, request, years):
     """Handle multi-sheet Excel file"""
-    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-        for chunk in excel_file.chunks():
-            tmp_file.write(chunk)
-        tmp_path = tmp_file.name
-
     # Store in session
     request.session.update({
         'uploaded_excel_path': tmp_path,
         'uploaded_year': year,
-        'uploaded_excel_name': excel_file.name,
+        'uploaded_excel_name': file_name,
         'sheet_names': sheet_names
     })
 
     return render(request, 'upload.html', {
-        'sheet_names': sheet_names,
-        'excel_file_name': excel_file.name,
+        'sheets': sheet_year_choices(sheet_names, year, years),
+        'excel_file_name': file_name,
         'year': year,
-        'years': reversed(list(range(2019, datetime.now().year + 1))),
+        'years': list(reversed(years)),
     })
 
 
-def handle_single_sheet_case(excel_file, year, sheet_names, request):
+def handle_single_sheet_case(tmp_path, file_name, year, sheet_names, request, content_hash,
+                             force=False):
     """Handle single-sheet Excel file"""
-    with pd.ExcelFile(excel_file) as xls:
-        df = pd.read_excel(xls, sheet_name=sheet_names[0])
+    if not force:
+        batch = find_imported_batch(request.user, content_hash, year, sheet_names[0])
+        if batch is not None:
+            # Same bytes, same year: the earlier import already produced this
+            remove_upload(tmp_path)
+            record_duplicate(batch, file_name)
+            messages.info(request, 'This file was already imported; showing the earlier import.')
+            return redirect('import_job', job_id=batch.job_id)
 
-    process_dataframe(df, request.user, year)
-    return redirect(f'/?year={year}')
+    job = enqueue_import(request.user, tmp_path, file_name, year, sheet_names[0])
+    record_batches(job, content_hash, {sheet_names[0]: year})
+    return redirect('import_job', job_id=job.id)
 
 
 def process_dataframe(df, user, year):
     """Process DataFrame and create/update members"""
-    if 'Name' not in df.columns or 'Account Number' not in df.columns:
-        raise ValueError("Excel file must contain 'Name' and 'Account Number' columns")
-
-    for _, row in df.iterrows():
-        phone = str(row.get('Phone', '')).strip().replace(' ', '')
-
-        member_data = {
-            'name': row['Name'].strip(),
-            'phone': phone,
-            'monthly_contributions': {
-                month: float(row.get(month, 0))
-                for month in [
-                    'January', 'February', 'March', 'April', 'May', 'June',
-                    'July', 'August', 'September', 'October', 'November', 'December'
-                ]
-            }
-        }
-
-        Member.objects.update_or_create(
-            user=user,
-            account_number=str(row['Account Number']).strip(),
-            year=year,
-            defaults=member_data
-        )
+    from .importers import import_frames
+
+    # Write the whole sheet with bulk queries instead of one upsert per row
+    return import_frames([df], user, year)
 
 
 def cleanup_upload_session(request, tmp_path=None):
     """Cleanup temporary files and session data"""
     # Delete temporary file if exists
-    if tmp_path and os.path.exists(tmp_path):
-        try:
-            os.unlink(tmp_path)
-        except PermissionError:
-            pass
+    remove_upload(tmp_path)
 
     # Clear session keys
     session_keys = [
         'uploaded_excel_path', 'uploaded_year',
-        'uploaded_excel_name', 'sheet_names'
+        'uploaded_excel_name', 'sheet_names',
+        'uploaded_hash', 'uploaded_force',
     ]
     for key in session_keys:
         if key in request.session:
             del request.session[key]
 
 
+# IMPORT JOB PROGRESS FUNCTIONALITY
+@login_required
+def import_job(request, job_id):
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+    return render(request, 'import_job.html', {'job': job})
+
+
+@login_required
+def import_job_progress(request, job_id):
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+    return JsonResponse(job.progress())
+
+
+@login_required
+def import_history(request):
+    """Every uploaded sheet with its counts and timing, newest first"""
+    batches = (ImportBatch.objects.filter(user=request.user)
+               .select_related('job', 'duplicate_of'))
+    page = Paginator(batches, settings.IMPORT_HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    rows = [{'batch': batch, 'result': batch.result()} for batch in page]
+    return render(request, 'import_history.html', {'page': page, 'rows': rows})
+
+
+# ANALYTICS FUNCTIONALITY
+@login_required
+def analytics(request):
+    years = user_analytics(request.user)
+    # One row per month with a column per year
+    month_rows = [(month, [figures['months'][month] for figures in years]) for month in MONTHS]
+    return render(request, 'analytics.html', {'years': years, 'month_rows': month_rows})
+
+
+@login_required
+def analytics_data(request):
+    return JsonResponse({'years': user_analytics(request.user)})
+
+
 # REPORT GENERATING FUNCTIONALITY
 @login_required
 def generate_report(request, member_id):
@@ -239,70 +409,81 @@ def generate_report(request, member_id):
 
 
 def generate_pdf(request, member_id):
+    from .pdf_cache import open_statement, statement_key, statement_path
+    from .reports import statement_data
+
     member = get_object_or_404(Member, id=member_id)
-    buffer = BytesIO()
+    data = statement_data(member)
 
-    # Create PDF
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
+    # Statements are cached by content, so an unchanged member is never re-rendered
+    key = statement_key(data)
+    etag = f'"{key}"'
+    try:
+        # Whole seconds, as If-Modified-Since is sent back
+        last_modified = int(os.stat(statement_path(key)).st_mtime)
+    except FileNotFoundError:
+        last_modified = None
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    statement = open_statement(data, key)
+    response = FileResponse(statement, content_type='application/pdf')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(int(os.fstat(statement.fileno()).st_mtime))
+    # Browsers keep the PDF but check the ETag before reusing it
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
-    # Use ReportLab styles, not Tailwind
-    styles = getSampleStyleSheet()
-    title_style = styles['Title']
-    body_style = styles['BodyText']
 
-    elements.append(Paragraph(f"Member Report: {member.name}", title_style))
+@login_required
+def generate_year_pdfs(request, year):
+    """All statements for a year, as a ZIP (default) or one merged PDF"""
+    from .reports import STATEMENT_FIELDS, build_merged_statements, render_statements, stream_zip
+
+    members = Member.objects.filter(user=request.user, year=year).order_by('name', 'id')
+    # Every statement's figures are computed in vectorized chunks
+    policy = ContributionPolicy.for_year(request.user.id, year)
+    datas = year_rows(members, policy, STATEMENT_FIELDS, chunk_size=500)
+
+    if request.GET.get('format') == 'pdf':
+        # One document can't be built in parallel; it is spooled to disk instead
+        output = tempfile.TemporaryFile()
+        build_merged_statements(datas, output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=f'statements_{year}.pdf',
+                            content_type='application/pdf')
+
+    workers = settings.REPORT_PDF_WORKERS or os.cpu_count() or 1
+    files = (
+        (get_valid_filename(f"{data['account_number']}_{data['name']}.pdf"), pdf)
+        for data, pdf in render_statements(datas, workers)
+    )
+    response = StreamingHttpResponse(stream_zip(files), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="statements_{year}.zip"'
+    return response
+
+
+# EXPORT FUNCTIONALITY
+@login_required
+def export_year(request, year):
+    """Stream a year's ledger as CSV, or as XLSX with ?format=xlsx"""
+    members = Member.objects.filter(user=request.user, year=year).order_by('name', 'id')
+    rows = ledger_rows(members)
+
+    if request.GET.get('format') == 'xlsx':
+        # Write-only workbooks keep memory flat but need a real file to save into
+        output = tempfile.TemporaryFile()
+        write_xlsx(rows, output, title=str(year))
+        output.seek(0)
+        return FileResponse(
+            output, as_attachment=True, filename=f'contributions_{year}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
 
-    # Member Details
-    details = [
-        ["Account Number:", member.account_number],
-        ["Phone:", member.phone],
-        ["Total Contributed:", f"KES {member.total_contributed:.2f}"],
-        ["Total Deficit:", f"KES {member.total_deficit:.2f}"]
-    ]
-    details_table = Table(details, colWidths=[150, 150])
-    elements.append(details_table)
-
-    # Calculate total paid for Jan-Mar
-    total_paid = sum(float(member.monthly_contributions.get(month, 0))
-                    for month in ['January', 'February', 'March'])
-
-    # Build contributions table
-    contributions_data = [["Month", "Paid (KES)", "Expected (KES)", "Deficit (KES)"]]
-
-    for month in ['January', 'February', 'March', 'April', 'May', 'June',
-                  'July', 'August', 'September', 'October', 'November', 'December']:
-        paid = float(member.monthly_contributions.get(month, 0))
-        
-        # Calculate expected and deficit
-        if month == 'March':
-            expected = float(member.annual_target)
-            deficit = max(expected - total_paid, 0)  # Only show deficit in March
-        else:
-            expected = 0.0
-            deficit = 0.0  # No deficit calculation for other months
-
-        contributions_data.append([
-            month,
-            f"{paid:.2f}",
-            f"{expected:.2f}",
-            f"{deficit:.2f}" if deficit > 0 else "0.00"
-        ])
-
-    contributions_table = Table(contributions_data)
-    contributions_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(contributions_table)
-
-    doc.build(elements)
-    buffer.seek(0)
-    return HttpResponse(buffer, content_type='application/pdf')
+    response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="contributions_{year}.csv"'
+    return response
 
 
 # EDITING MEMBERS CONTRIBUTIONS FUNCTIONALITY
@@ -317,16 +498,13 @@ def edit_contributions(request, member_id):
     # Get current year from member object or request
     current_year = request.GET.get('year', member.year)
 
-    months = ['January', 'February', 'March', 'April', 'May', 'June',
-              'July', 'August', 'September', 'October', 'November', 'December']
+    months = MONTHS
 
-    # Calculate expected values
-    annual_months = ['January', 'February', 'March']
-    expected_annual = float(member.annual_target) / 3
-    expected_per_month = {
-        month: expected_annual if month in annual_months else 0.0
-        for month in months
-    }
+    # Expected and deficit per month come from the year's contribution policy
+    policy = ContributionPolicy.for_year(member.user_id, member.year)
+    expected_per_month, deficits = policy.member_months(
+        member.monthly_contributions, member.annual_target
+    )
 
     if request.method == 'POST':
         contributions = {}
@@ -343,13 +521,95 @@ def edit_contributions(request, member_id):
         'member': member,
         'months': months,
         'expected_per_month': expected_per_month,
-        'annual_months': annual_months,
+        'deficits': deficits,
+        'annual_months': policy.due_months,
         'current_year': current_year  # Pass to template
     })
 
 
+@login_required
+def edit_policy(request, year):
+    """Set which months a year's contributions are due in, and their shares"""
+    from .forms import ContributionPolicyForm
+
+    policy = ContributionPolicy.objects.filter(user=request.user, year=year).first()
+
+    if request.method == 'POST':
+        if 'reset' in request.POST:
+            if policy is not None:
+                policy.delete()
+            messages.success(request, f'{year} uses the default January to March schedule again.')
+            return redirect(f'/?year={year}')
+
+        form = ContributionPolicyForm(request.POST)
+        if not form.is_valid():
+            return render(request, 'edit_policy.html', {
+                'year': year,
+                'shares': [
+                    (month, request.POST.get(month, ''), form.errors.get(month)) for month in MONTHS
+                ],
+                'annual_target': request.POST.get('annual_target', ''),
+                'target_errors': form.errors.get('annual_target'),
+                'errors': form.non_field_errors(),
+            })
+        policy = policy or ContributionPolicy(user=request.user, year=year)
+        policy.schedule = form.schedule()
+        policy.annual_target = form.cleaned_data['annual_target']
+        policy.save()
+        messages.success(request, f'Contribution schedule for {year} saved.')
+        return redirect(f'/?year={year}')
+
+    if policy is not None:
+        shares, annual_target = policy.schedule, policy.annual_target
+    else:
+        shares, annual_target = DEFAULT_SCHEDULE, None
+    return render(request, 'edit_policy.html', {
+        'year': year,
+        'shares': [(month, shares.get(month, ''), None) for month in MONTHS],
+        'annual_target': annual_target if annual_target is not None else '',
+    })
+
+
+# M-PESA PAYMENT CALLBACKS
+def _mpesa_reply(accepted, description):
+    # Daraja only reads ResultCode: 0 accepts, anything else rejects
+    return JsonResponse({'ResultCode': 0 if accepted else 'C2B00016', 'ResultDesc': description})
+
+
+def _mpesa_token_ok(request):
+    # Without a token anyone could post payments, so callbacks are refused
+    token = settings.MPESA_CALLBACK_TOKEN
+    return bool(token) and constant_time_compare(request.GET.get('token', ''), token)
+
+
+@csrf_exempt
+@require_POST
+def mpesa_validation(request):
+    """Accept every payment; matching to members happens when it is applied"""
+    if not _mpesa_token_ok(request):
+        return HttpResponseForbidden()
+    return _mpesa_reply(True, 'Accepted')
+
+
+@csrf_exempt
+@require_POST
+def mpesa_confirmation(request):
+    """Store a confirmed C2B payment; apply_payments adds it to the ledger later"""
+    if not _mpesa_token_ok(request):
+        return HttpResponseForbidden()
+    try:
+        payment = callback_payment(json.loads(request.body))
+    except (ValueError, TypeError) as e:
+        return _mpesa_reply(False, str(e))
+
+    record_payments([payment])
+    return _mpesa_reply(True, 'Accepted')
+
+
 # USER AUTHENTICATION FUNCTIONALITY
 def signup(request):
+    from .forms import CustomUserCreationForm
+
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
         if form.is_valid():
@@ -377,6 +637,38 @@ def user_logout(request):
     return redirect('login')
 
 
+# CACHE MONITORING FUNCTIONALITY
+@login_required
+def member_cache_stats(request):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Only superusers can view cache statistics.")
+    return JsonResponse(cache_stats())
+
+
+def _basic_auth_user(request):
+    """User from an HTTP Basic Authorization header, for scrapers without a session"""
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(':')
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return authenticate(request, username=username, password=password)
+
+
+def metrics(request):
+    """Prometheus metrics for superusers, by session or HTTP Basic auth"""
+    user = request.user if request.user.is_authenticated else _basic_auth_user(request)
+    if user is None:
+        response = HttpResponse('Authentication required', status=401)
+        response['WWW-Authenticate'] = 'Basic realm="metrics"'
+        return response
+    if not user.is_superuser:
+        return HttpResponseForbidden("Only superusers can view metrics.")
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # DELETE MEMBER(S) DATA OR ALL MEMBERS DATA FUNCTIONALITY
 @login_required
 def delete_member(request, member_id):
@@ -392,6 +684,8 @@ def delete_all(request):
         try:
             selected_year = int(request.POST.get('year', datetime.now().year))
             Member.objects.filter(user=request.user, year=selected_year).delete()
+            invalidate_member_cache(request.user.id, [selected_year])
+            ImportBatch.forget(request.user.id, [selected_year])
         except ValueError:
             selected_year = datetime.now().year
 
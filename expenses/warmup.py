@@ -0,0 +1,20 @@
+import importlib
+
+# Modules the views only import when an upload, report or signup needs them.
+# Importing them in the gunicorn master, after the app is preloaded and before
+# workers fork, lets every worker share their memory instead of each loading
+# pandas and ReportLab on its first upload or report.
+HEAVY_MODULES = [
+    'expenses.importers',
+    'expenses.reports',
+    'expenses.pdf_cache',
+    'expenses.forms',
+    'openpyxl',
+]
+
+
+def warm_up(modules=HEAVY_MODULES):
+    """Import ``modules`` now; returns their names"""
+    for name in modules:
+        importlib.import_module(name)
+    return list(modules)
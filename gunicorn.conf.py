@@ -0,0 +1,35 @@
+# Gunicorn settings for the web process in the Procfile.
+# Every value can be overridden from the environment without editing this file.
+import multiprocessing
+import os
+
+
+def _flag(name, default):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+# A year of statements streams as one ZIP, which can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+accesslog = '-'
+
+# Load Django once in the master; workers are forked from it ready to serve,
+# sharing its memory until they write to it
+preload_app = _flag('GUNICORN_PRELOAD', 'true')
+
+# With preloading, optionally also import pandas, openpyxl and ReportLab in
+# the master, so the first upload or report in each worker doesn't pay for
+# them and the workers share those pages (see expenses.warmup). It delays the
+# first response, so it is off unless most workers end up serving uploads
+# or reports; `manage.py benchmark_startup --gunicorn` compares the profiles.
+WARM_UP = _flag('GUNICORN_WARM_UP', 'false')
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is loaded, before any fork
+    if preload_app and WARM_UP:
+        from expenses.warmup import warm_up
+
+        modules = warm_up()
+        server.log.info('Warmed up %s', ', '.join(modules))